@@ -0,0 +1,34 @@
+"""
+Shared Redis connection
+One client (and connection pool) per process for code that needs Redis
+data structures beyond what the Django cache API offers
+"""
+
+import os
+import threading
+
+import redis
+from django.conf import settings
+
+_lock = threading.Lock()
+_clients = {}
+
+
+def get_redis():
+    """
+    Process-wide Redis client for settings.REDIS_URL
+    Recreated after fork so Celery prefork children never share sockets
+    """
+    pid = os.getpid()
+    client = _clients.get(pid)
+    if client is None:
+        with _lock:
+            client = _clients.get(pid)
+            if client is None:
+                client = redis.from_url(
+                    getattr(settings, 'REDIS_URL', settings.CELERY_BROKER_URL),
+                    socket_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 5),
+                    socket_connect_timeout=getattr(settings, 'REDIS_SOCKET_TIMEOUT', 5),
+                )
+                _clients[pid] = client
+    return client
@@ -0,0 +1,271 @@
+"""
+AISStream.io websocket ingestion
+Long-running asyncio consumer that subscribes to bbox-filtered position
+streams, normalises messages into the position schema used everywhere else
+and writes them through PositionBatchWriter in micro-batches
+"""
+
+import asyncio
+import json
+import logging
+import random
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .nmea import NAV_STATUS, map_ship_type
+
+logger = logging.getLogger(__name__)
+
+POSITION_MESSAGE_TYPES = ('PositionReport', 'StandardClassBPositionReport', 'ExtendedClassBPositionReport')
+STATIC_MESSAGE_TYPES = ('ShipStaticData', 'StaticDataReport')
+
+# AISStream limits a subscription to this many MMSI filters
+MAX_MMSI_FILTERS = 50
+
+
+def _import_websockets():
+    try:
+        import websockets
+    except ImportError:
+        raise ImportError(
+            "AISStream ingestion needs the 'websockets' package: pip install websockets"
+        )
+    return websockets
+
+
+def _parse_time(value):
+    """AISStream time_utc, e.g. '2022-12-29 18:22:32.318353 +0000 UTC'"""
+    if not value:
+        return None
+    try:
+        date_part, time_part = value.split(' ')[:2]
+        return datetime.fromisoformat(f"{date_part}T{time_part[:15]}").replace(tzinfo=dt_timezone.utc)
+    except ValueError:
+        return None
+
+
+def _eta(eta):
+    if not eta or not eta.get('Month') or not eta.get('Day'):
+        return None
+    now = timezone.now()
+    for year in (now.year, now.year + 1):
+        try:
+            value = datetime(year, eta['Month'], eta['Day'], eta.get('Hour', 0) % 24,
+                             eta.get('Minute', 0) % 60, tzinfo=dt_timezone.utc)
+        except (ValueError, TypeError):
+            return None
+        if value >= now - timedelta(days=1):
+            return value
+    return None
+
+
+def normalize_message(data):
+    """
+    Convert one AISStream message into a position dict (as accepted by
+    apply_position_batch) and/or static Vessel fields
+    Returns None for message types we do not use
+    """
+    message_type = data.get('MessageType')
+    meta = data.get('MetaData') or {}
+    body = (data.get('Message') or {}).get(message_type) or {}
+    mmsi = meta.get('MMSI') or body.get('UserID')
+    if not mmsi:
+        return None
+    
+    if message_type in POSITION_MESSAGE_TYPES:
+        lat = body.get('Latitude', meta.get('latitude'))
+        lon = body.get('Longitude', meta.get('longitude'))
+        if lat is None or lon is None or not (-90 <= lat <= 90) or not (-180 <= lon <= 180):
+            return None
+        sog = body.get('Sog')
+        cog = body.get('Cog')
+        heading = body.get('TrueHeading')
+        status = body.get('NavigationalStatus')
+        message = {
+            'mmsi': str(mmsi).zfill(9),
+            'latitude': round(lat, 7),
+            'longitude': round(lon, 7),
+            'speed_over_ground': sog if sog is not None and sog < 102.3 else None,
+            'course_over_ground': cog if cog is not None and cog < 360 else None,
+            'heading': heading if heading is not None and heading < 360 else None,
+            'navigational_status': NAV_STATUS.get(status, 'underway') if status is not None else None,
+            'timestamp': _parse_time(meta.get('time_utc')) or timezone.now(),
+            'data_source': 'aisstream',
+        }
+        if message_type == 'ExtendedClassBPositionReport':
+            message['vessel_name'] = (body.get('Name') or '').strip() or None
+            message['vessel_type'] = map_ship_type(body.get('Type'))
+        return message
+    
+    if message_type in STATIC_MESSAGE_TYPES:
+        if message_type == 'StaticDataReport':
+            report_a = body.get('ReportA') or {}
+            report_b = body.get('ReportB') or {}
+            body = {
+                'Name': report_a.get('Name') if report_a.get('Valid') else None,
+                'CallSign': report_b.get('CallSign') if report_b.get('Valid') else None,
+                'Type': report_b.get('ShipType') if report_b.get('Valid') else None,
+                'Dimension': report_b.get('Dimension') if report_b.get('Valid') else None,
+            }
+        dimension = body.get('Dimension') or {}
+        length = (dimension.get('A') or 0) + (dimension.get('B') or 0)
+        beam = (dimension.get('C') or 0) + (dimension.get('D') or 0)
+        draught = body.get('MaximumStaticDraught')
+        return {
+            'mmsi': str(mmsi).zfill(9),
+            'vessel_name': (body.get('Name') or '').strip() or None,
+            'call_sign': (body.get('CallSign') or '').strip() or None,
+            'vessel_type': map_ship_type(body.get('Type')),
+            'destination': (body.get('Destination') or '').strip() or None,
+            'eta': _eta(body.get('Eta')),
+            'draft': draught or None,
+            'length_overall': length or None,
+            'beam': beam or None,
+        }
+    
+    return None
+
+
+class AISStreamIngester:
+    """
+    Subscribe to AISStream and feed Vessel/VesselPosition
+    
+    One reader coroutine receives and normalises messages into a bounded
+    queue; one writer coroutine drains it into micro-batches that are written
+    in a worker thread (the ORM is synchronous). When the writer falls behind
+    the reader waits up to AISSTREAM_BACKPRESSURE_TIMEOUT for queue space and
+    then drops the message, so the socket is never starved long enough for
+    the server to disconnect us. Lost connections and silent streams are
+    retried with jittered exponential backoff, re-sending the subscription.
+    """
+    
+    def __init__(self, bounding_boxes, mmsis=None, url=None, api_key=None, writer=None,
+                 queue_size=None, backpressure_timeout=None, idle_timeout=None):
+        self.bounding_boxes = bounding_boxes
+        self.mmsis = [str(m) for m in (mmsis or [])][:MAX_MMSI_FILTERS]
+        self.url = url or getattr(settings, 'AISSTREAM_URL', 'wss://stream.aisstream.io/v0/stream')
+        self.api_key = api_key if api_key is not None else getattr(settings, 'AISSTREAM_API_KEY', '')
+        self.writer = writer
+        self.queue_size = queue_size or getattr(settings, 'AISSTREAM_QUEUE_SIZE', 10000)
+        self.backpressure_timeout = backpressure_timeout or getattr(settings, 'AISSTREAM_BACKPRESSURE_TIMEOUT', 5.0)
+        self.idle_timeout = idle_timeout or getattr(settings, 'AISSTREAM_IDLE_TIMEOUT', 60.0)
+        self.max_backoff = getattr(settings, 'AISSTREAM_MAX_BACKOFF', 60.0)
+        self.stats = Counter()
+        self.last_message_at = None
+        self._stopping = False
+        self._reader_task = None
+    
+    def subscription(self):
+        message = {
+            'APIKey': self.api_key,
+            # AISStream expects [[lat, lon], [lat, lon]] corners
+            'BoundingBoxes': [[[b[0], b[2]], [b[1], b[3]]] for b in self.bounding_boxes],
+            'FilterMessageTypes': list(POSITION_MESSAGE_TYPES + STATIC_MESSAGE_TYPES),
+        }
+        if self.mmsis:
+            message['FiltersShipMMSI'] = self.mmsis
+        return message
+    
+    def stop(self):
+        """Stop reading; buffered messages are still written before run() returns"""
+        self._stopping = True
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+    
+    async def run(self):
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        writer_task = asyncio.create_task(self._write_loop(queue))
+        self._reader_task = asyncio.create_task(self._read_loop(queue))
+        try:
+            await self._reader_task
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self._stopping = True
+            await writer_task
+    
+    async def _read_loop(self, queue):
+        websockets = _import_websockets()
+        attempt = 0
+        while not self._stopping:
+            try:
+                async with websockets.connect(self.url, open_timeout=10, max_queue=1024) as ws:
+                    # AISStream closes connections that do not subscribe within 3 seconds
+                    await ws.send(json.dumps(self.subscription()))
+                    self.stats['connections'] += 1
+                    gap = time.time() - self.last_message_at if self.last_message_at else None
+                    logger.info(
+                        f"Subscribed to AISStream with {len(self.bounding_boxes)} boxes"
+                        + (f", resuming after {gap:.0f}s gap" if gap else "")
+                    )
+                    while not self._stopping:
+                        raw = await asyncio.wait_for(ws.recv(), timeout=self.idle_timeout)
+                        attempt = 0
+                        await self._enqueue(queue, raw)
+            except asyncio.TimeoutError:
+                logger.warning(f"No AISStream data for {self.idle_timeout:.0f}s, reconnecting")
+            except (OSError, websockets.exceptions.WebSocketException) as e:
+                logger.warning(f"AISStream connection lost: {str(e)}")
+            if self._stopping:
+                break
+            self.stats['reconnects'] += 1
+            delay = random.uniform(0, min(self.max_backoff, 2 ** attempt))
+            attempt += 1
+            await asyncio.sleep(delay)
+    
+    async def _enqueue(self, queue, raw):
+        self.stats['received'] += 1
+        self.last_message_at = time.time()
+        try:
+            data = json.loads(raw)
+        except ValueError:
+            self.stats['invalid'] += 1
+            return
+        if 'error' in data:
+            # e.g. invalid API key; the server closes the connection afterwards
+            logger.error(f"AISStream error: {data['error']}")
+            return
+        
+        message = normalize_message(data)
+        if message is None:
+            self.stats['ignored'] += 1
+            return
+        try:
+            queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.stats['backpressure_waits'] += 1
+            try:
+                await asyncio.wait_for(queue.put(message), timeout=self.backpressure_timeout)
+            except asyncio.TimeoutError:
+                self.stats['dropped'] += 1
+                if self.stats['dropped'] % 1000 == 1:
+                    logger.warning(f"AISStream writer is behind, dropped {self.stats['dropped']} messages so far")
+    
+    async def _write_loop(self, queue):
+        flush_interval = self.writer.flush_interval
+        while not (self._stopping and queue.empty()):
+            batch = []
+            deadline = time.monotonic() + flush_interval
+            while len(batch) < self.writer.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), timeout=timeout))
+                except asyncio.TimeoutError:
+                    break
+            if batch:
+                await asyncio.to_thread(self._write_batch, batch)
+    
+    def _write_batch(self, batch):
+        # Runs in a worker thread that keeps its own database connection
+        close_old_connections()
+        for message in batch:
+            self.writer.add(message)
+        self.writer.flush()
+        self.stats['written'] += len(batch)
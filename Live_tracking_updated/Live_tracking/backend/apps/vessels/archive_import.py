@@ -0,0 +1,338 @@
+"""
+Bulk import of AIS history archives (MarineCadastre-style CSV or Parquet)
+Files are cut into blocks at line boundaries (row groups for Parquet) that
+worker processes parse with pandas; the importing process only upserts
+vessels and hands positions to the bulk loader. Progress is checkpointed per
+file as the offset after the last block written, so an interrupted import
+resumes where it stopped.
+"""
+
+import gzip
+import io
+import json
+import logging
+import os
+import zipfile
+from collections import Counter
+
+import numpy as np
+import pandas as pd
+
+from .bulk_load import format_positions
+from .models import Vessel
+from .nmea import NAV_STATUS, map_ship_type
+
+logger = logging.getLogger(__name__)
+
+# Archive column (case-insensitive) -> canonical name
+COLUMN_ALIASES = {
+    'mmsi': 'mmsi',
+    'basedatetime': 'timestamp',
+    'timestamp': 'timestamp',
+    'lat': 'latitude',
+    'latitude': 'latitude',
+    'lon': 'longitude',
+    'longitude': 'longitude',
+    'sog': 'speed_over_ground',
+    'speed_over_ground': 'speed_over_ground',
+    'cog': 'course_over_ground',
+    'course_over_ground': 'course_over_ground',
+    'heading': 'heading',
+    'status': 'status',
+    'navigational_status': 'status',
+    'vesselname': 'vessel_name',
+    'vessel_name': 'vessel_name',
+    'callsign': 'call_sign',
+    'call_sign': 'call_sign',
+    'vesseltype': 'vessel_type',
+    'vessel_type': 'vessel_type',
+    'length': 'length_overall',
+    'width': 'beam',
+    'draft': 'draft',
+}
+
+REQUIRED_COLUMNS = ('mmsi', 'timestamp', 'latitude', 'longitude')
+
+# Static fields taken from the latest row per MMSI; imo_number is unique in the database and never imported
+STATIC_COLUMNS = ('vessel_name', 'call_sign', 'vessel_type', 'length_overall', 'beam', 'draft')
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow.parquet
+    except ImportError:
+        raise ImportError("Parquet archives need the 'pyarrow' package: pip install pyarrow")
+    return pyarrow.parquet
+
+
+def is_parquet(path):
+    return path.lower().endswith('.parquet')
+
+
+def open_archive(path):
+    """Binary stream of a .csv, .csv.gz or single-CSV .zip archive"""
+    lower = path.lower()
+    if lower.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if lower.endswith('.zip'):
+        archive = zipfile.ZipFile(path)
+        members = [name for name in archive.namelist() if name.lower().endswith('.csv')]
+        if not members:
+            raise ValueError(f"No CSV file in {path}")
+        return archive.open(members[0])
+    return open(path, 'rb')
+
+
+def canonical_columns(names):
+    return [COLUMN_ALIASES.get(str(name).strip().lower(), str(name).strip()) for name in names]
+
+
+def csv_blocks(path, offset=0, block_bytes=16 * 1024 * 1024):
+    """
+    Yield (header, start, end, data) blocks of whole lines
+    Offsets count bytes of the (decompressed) CSV, the first block starting
+    after the header; seeking a compressed stream re-reads it up to offset.
+    """
+    with open_archive(path) as stream:
+        header_line = stream.readline()
+        header = canonical_columns(header_line.decode('utf-8-sig').strip().split(','))
+        missing = [name for name in REQUIRED_COLUMNS if name not in header]
+        if missing:
+            raise ValueError(f"{path} lacks columns {', '.join(missing)}")
+        start = max(offset, len(header_line))
+        stream.seek(start)
+        while True:
+            data = stream.read(block_bytes)
+            if not data:
+                return
+            if not data.endswith(b'\n'):
+                data += stream.readline()
+            yield header, start, start + len(data), data
+            start += len(data)
+
+
+def parquet_groups(path, offset=0):
+    """Yield (path, group) for the row groups from offset on"""
+    parquet = _import_pyarrow()
+    groups = parquet.ParquetFile(path).num_row_groups
+    for group in range(offset, groups):
+        yield path, group
+
+
+def parse_csv_block(task):
+    header, data = task
+    known = set(COLUMN_ALIASES.values())
+    frame = pd.read_csv(
+        io.BytesIO(data), names=header, header=None, usecols=lambda name: name in known,
+        dtype={'timestamp': str, 'vessel_name': str, 'call_sign': str},
+        on_bad_lines='skip', engine='c',
+    )
+    return clean_frame(frame)
+
+
+def parse_parquet_group(task):
+    path, group = task
+    frame = _import_pyarrow().ParquetFile(path).read_row_group(group).to_pandas()
+    frame.columns = canonical_columns(frame.columns)
+    return clean_frame(frame)
+
+
+def _numeric(frame, name):
+    if name not in frame:
+        return pd.Series(np.nan, index=frame.index)
+    return pd.to_numeric(frame[name], errors='coerce')
+
+
+def clean_frame(frame):
+    """
+    Validate one parsed block
+    Returns {'rows', 'rejected', 'positions': column arrays with an mmsi
+    column, 'static': {mmsi: fields}}. AIS "not available" values (SOG 102.3,
+    COG 360, heading 511, lat 91, lon 181) become missing or reject the row.
+    """
+    rows = len(frame)
+    mmsi = _numeric(frame, 'mmsi')
+    latitude = _numeric(frame, 'latitude')
+    longitude = _numeric(frame, 'longitude')
+    timestamp = pd.to_datetime(frame['timestamp'], errors='coerce', utc=True, format='ISO8601')
+    
+    valid = (
+        mmsi.between(100000000, 999999999) & (mmsi % 1 == 0)
+        & latitude.between(-90, 90) & longitude.between(-180, 180)
+        & timestamp.notna()
+    )
+    frame = frame[valid]
+    mmsi, latitude, longitude, timestamp = mmsi[valid], latitude[valid], longitude[valid], timestamp[valid]
+    
+    sog = _numeric(frame, 'speed_over_ground')
+    cog = _numeric(frame, 'course_over_ground')
+    heading = _numeric(frame, 'heading')
+    status = _numeric(frame, 'status').map(NAV_STATUS)
+    
+    positions = {
+        'mmsi': mmsi.to_numpy(dtype=np.int64),
+        'latitude': latitude.to_numpy(dtype=float),
+        'longitude': longitude.to_numpy(dtype=float),
+        'speed_over_ground': sog.where((sog >= 0) & (sog < 102.3)).to_numpy(dtype=float),
+        'course_over_ground': cog.where((cog >= 0) & (cog < 360)).to_numpy(dtype=float),
+        'heading': heading.where((heading >= 0) & (heading < 360)).to_numpy(dtype=float),
+        'navigational_status': status.where(status.notna(), None).tolist(),
+        'timestamp': ((timestamp - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64),
+    }
+    
+    static = {}
+    columns = [name for name in STATIC_COLUMNS if name in frame]
+    if columns:
+        # Latest known value per MMSI and field; archives often leave static fields blank on most rows
+        latest = frame[columns].assign(mmsi=mmsi.astype(np.int64).astype(str)).groupby('mmsi', sort=False).last()
+        for mmsi_text, record in zip(latest.index.tolist(), latest.to_dict('records')):
+            fields = {}
+            for name, value in record.items():
+                if value is None or value != value or str(value).strip() == '':
+                    continue
+                if name == 'vessel_type':
+                    try:
+                        value = map_ship_type(int(float(value)))
+                    except ValueError:
+                        value = None
+                elif name in ('length_overall', 'beam', 'draft'):
+                    try:
+                        value = round(float(value), 2)
+                    except ValueError:
+                        value = None
+                    value = value if value else None
+                else:
+                    value = str(value).strip()
+                if value is not None:
+                    fields[name] = value
+            if fields:
+                static[mmsi_text] = fields
+    
+    return {'rows': rows, 'rejected': rows - len(frame), 'positions': positions, 'static': static}
+
+
+class ArchiveWriter:
+    """
+    Upserts vessels seen in parsed blocks and writes their positions
+    Unknown MMSIs become vessels (untracked unless track=True, so pollers do
+    not pick up a whole archive); static fields are written when they differ
+    from what this run last wrote. Positions of deleted vessels are dropped.
+    """
+    
+    def __init__(self, loader, track=False, create_vessels=True):
+        self.loader = loader
+        self.track = track
+        self.create_vessels = create_vessels
+        self.vessel_ids = {}  # mmsi -> id, 0 for vessels that are deleted or were not created
+        self.static = {}
+        self.stats = Counter()
+    
+    def write(self, block):
+        positions = block['positions']
+        self.stats['rows'] += block['rows']
+        self.stats['rejected'] += block['rejected']
+        if not len(positions['mmsi']):
+            return 0
+        
+        mmsis, inverse = np.unique(positions['mmsi'], return_inverse=True)
+        self._upsert_vessels([str(mmsi) for mmsi in mmsis.tolist()], block['static'])
+        ids = np.array([self.vessel_ids.get(str(mmsi), 0) for mmsi in mmsis.tolist()], dtype=np.int64)[inverse]
+        keep = ids > 0
+        self.stats['unknown'] += int((~keep).sum())
+        
+        columns = {name: np.asarray(values, dtype=object)[keep] if name == 'navigational_status' else values[keep]
+                   for name, values in positions.items() if name != 'mmsi'}
+        columns['vessel_id'] = ids[keep]
+        columns['data_source'] = 'archive'
+        if keep.any():
+            self.loader.cover(columns['timestamp'].min(), columns['timestamp'].max())
+        inserted = self.loader.write(format_positions(columns, self.loader.format))
+        self.stats['positions'] += int(keep.sum())
+        self.stats['inserted'] += inserted
+        return inserted
+    
+    def _upsert_vessels(self, mmsis, static):
+        unseen = [mmsi for mmsi in mmsis if mmsi not in self.vessel_ids]
+        if unseen:
+            existing = dict(Vessel.objects.filter(mmsi__in=unseen).values_list('mmsi', 'is_deleted'))
+            new = [mmsi for mmsi in unseen if mmsi not in existing]
+            if new and self.create_vessels:
+                Vessel.objects.bulk_create([self._new_vessel(mmsi, static.get(mmsi, {})) for mmsi in new],
+                                           batch_size=1000, ignore_conflicts=True)
+                self.stats['vessels_created'] += len(new)
+            found = Vessel.objects.filter(mmsi__in=unseen, is_deleted=False).values_list('mmsi', 'id')
+            self.vessel_ids.update({mmsi: 0 for mmsi in unseen})
+            self.vessel_ids.update(dict(found))
+            for mmsi in new:
+                self.static[mmsi] = static.get(mmsi, {})
+        
+        changed = {mmsi: fields for mmsi, fields in static.items()
+                   if self.vessel_ids.get(mmsi) and self.static.get(mmsi) != fields}
+        if not changed:
+            return
+        updated, fields = [], set()
+        for vessel in Vessel.objects.filter(id__in=[self.vessel_ids[mmsi] for mmsi in changed]):
+            for field, value in self._clip(changed[vessel.mmsi]).items():
+                if getattr(vessel, field) != value:
+                    setattr(vessel, field, value)
+                    fields.add(field)
+            updated.append(vessel)
+            self.static[vessel.mmsi] = changed[vessel.mmsi]
+        if fields:
+            Vessel.objects.bulk_update(updated, sorted(fields), batch_size=1000)
+            self.stats['static_updates'] += len(updated)
+    
+    def _clip(self, fields):
+        return {
+            field: value[:Vessel._meta.get_field(field).max_length] if isinstance(value, str) else value
+            for field, value in fields.items()
+        }
+    
+    def _new_vessel(self, mmsi, fields):
+        fields = self._clip(fields)
+        return Vessel(
+            mmsi=mmsi,
+            vessel_name=fields.pop('vessel_name', None) or f"MMSI {mmsi}",
+            vessel_type=fields.pop('vessel_type', None) or 'other',
+            flag_country='XX',
+            is_tracked=self.track,
+            **fields,
+        )
+
+
+class ImportCheckpoint:
+    """
+    JSON file of {path: {'size', 'mtime', 'offset', 'done'}}
+    An entry only applies while the file's size and mtime are unchanged.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.entries = {}
+        if path and os.path.exists(path):
+            with open(path) as f:
+                self.entries = json.load(f)
+    
+    def _key(self, archive):
+        return os.path.abspath(archive)
+    
+    def _signature(self, archive):
+        stat = os.stat(archive)
+        return {'size': stat.st_size, 'mtime': int(stat.st_mtime)}
+    
+    def get(self, archive):
+        """(offset, done) to resume archive from"""
+        entry = self.entries.get(self._key(archive))
+        if not entry or any(entry.get(key) != value for key, value in self._signature(archive).items()):
+            return 0, False
+        return entry['offset'], entry.get('done', False)
+    
+    def set(self, archive, offset, done=False):
+        self.entries[self._key(archive)] = {**self._signature(archive), 'offset': offset, 'done': done}
+        if not self.path:
+            return
+        # Write then rename, so a crash never leaves a truncated checkpoint
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w') as f:
+            json.dump(self.entries, f, indent=1)
+        os.replace(temporary, self.path)
@@ -0,0 +1,124 @@
+"""
+Area-batched polling planner
+Groups tracked vessels by their last known position into a small set of
+bounding boxes so upstream calls scale with regions instead of vessels
+"""
+
+import logging
+import math
+from collections import defaultdict
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class AreaPollPlan:
+    """
+    Result of planning a polling run
+    - boxes: list of (min_lat, max_lat, min_lon, max_lon, mmsis)
+    - individual: MMSIs that must be looked up one by one
+    """
+    
+    def __init__(self, boxes, individual):
+        self.boxes = boxes
+        self.individual = individual
+    
+    def __repr__(self):
+        covered = sum(len(box[4]) for box in self.boxes)
+        return f"<AreaPollPlan {len(self.boxes)} boxes covering {covered} vessels, {len(self.individual)} individual>"
+
+
+class AreaPollPlanner:
+    """
+    Clusters last known positions into bounding boxes
+    
+    Positions are bucketed into a grid of AIS_AREA_CELL_DEG cells, the grid is
+    split into blocks of at most AIS_AREA_MAX_SPAN_DEG, and neighbouring
+    occupied cells inside a block are merged into one box. Boxes are padded
+    so vessels that moved since their last fix are still inside. Boxes with
+    fewer than AIS_AREA_MIN_VESSELS vessels are not worth an area query and
+    fall back to per-MMSI lookups, as do vessels with no position yet.
+    """
+    
+    def __init__(self, cell_deg=None, max_span_deg=None, padding_deg=None, min_vessels=None):
+        self.cell_deg = cell_deg or getattr(settings, 'AIS_AREA_CELL_DEG', 2.0)
+        self.max_span_deg = max_span_deg or getattr(settings, 'AIS_AREA_MAX_SPAN_DEG', 20.0)
+        self.padding_deg = padding_deg if padding_deg is not None else getattr(settings, 'AIS_AREA_PADDING_DEG', 0.5)
+        self.min_vessels = min_vessels or getattr(settings, 'AIS_AREA_MIN_VESSELS', 3)
+    
+    def plan(self, vessels):
+        """
+        Build a plan from vessels (objects with mmsi/latitude/longitude)
+        """
+        cells = defaultdict(list)
+        individual = []
+        
+        for vessel in vessels:
+            if vessel.latitude is None or vessel.longitude is None:
+                individual.append(str(vessel.mmsi))
+                continue
+            lat = float(vessel.latitude)
+            lon = float(vessel.longitude)
+            cell = (math.floor(lat / self.cell_deg), math.floor(lon / self.cell_deg))
+            cells[cell].append(str(vessel.mmsi))
+        
+        cells_per_block = max(1, int(self.max_span_deg // self.cell_deg))
+        blocks = defaultdict(set)
+        for cell in cells:
+            blocks[(cell[0] // cells_per_block, cell[1] // cells_per_block)].add(cell)
+        
+        boxes = []
+        for block_cells in blocks.values():
+            for component in self._connected_components(block_cells):
+                mmsis = [mmsi for cell in component for mmsi in cells[cell]]
+                if len(mmsis) < self.min_vessels:
+                    individual.extend(mmsis)
+                    continue
+                boxes.append(self._component_bbox(component) + (mmsis,))
+        
+        plan = AreaPollPlan(boxes, individual)
+        logger.debug(f"Planned polling run: {plan!r}")
+        return plan
+    
+    def _connected_components(self, block_cells):
+        """Group 8-connected occupied cells"""
+        remaining = set(block_cells)
+        while remaining:
+            seed = remaining.pop()
+            component = [seed]
+            stack = [seed]
+            while stack:
+                row, col = stack.pop()
+                for d_row in (-1, 0, 1):
+                    for d_col in (-1, 0, 1):
+                        neighbour = (row + d_row, col + d_col)
+                        if neighbour in remaining:
+                            remaining.remove(neighbour)
+                            component.append(neighbour)
+                            stack.append(neighbour)
+            yield component
+    
+    def _component_bbox(self, component):
+        """Padded (min_lat, max_lat, min_lon, max_lon) covering a group of cells"""
+        rows = [cell[0] for cell in component]
+        cols = [cell[1] for cell in component]
+        return (
+            max(-90.0, min(rows) * self.cell_deg - self.padding_deg),
+            min(90.0, (max(rows) + 1) * self.cell_deg + self.padding_deg),
+            max(-180.0, min(cols) * self.cell_deg - self.padding_deg),
+            min(180.0, (max(cols) + 1) * self.cell_deg + self.padding_deg),
+        )
+
+
+def poll_by_area(vessels, poller=None, planner=None):
+    """
+    Fetch positions for vessels using area queries first
+    Only vessels not found in any box are looked up individually
+    Returns {mmsi: position_data}
+    """
+    from .polling import AsyncAISPoller
+    
+    poller = poller or AsyncAISPoller()
+    plan = (planner or AreaPollPlanner()).plan(vessels)
+    return poller.poll_plan(plan)
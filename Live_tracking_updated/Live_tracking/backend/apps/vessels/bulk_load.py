@@ -0,0 +1,295 @@
+"""
+Bulk loading of historical vessel positions
+PostgreSQL gets COPY into a staging table followed by one INSERT .. ON CONFLICT
+per chunk; SQLite gets chunked INSERT OR IGNORE; other backends fall back to
+bulk_create. Secondary indexes can be dropped for the load and rebuilt once
+at the end, which is much cheaper than maintaining them row by row.
+
+Producers (backfill_positions, import_positions) build column arrays and turn
+them into a loader payload with format_positions - in worker processes, so
+the loading process only writes. They call PositionBulkLoader.cover with the
+time range of their data first, so partitioned storage (see partitions.py)
+has the partitions ready; on SQLite the loader writes straight into the shards.
+"""
+
+import io
+import logging
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+import django
+import numpy as np
+from django.db import connections, transaction
+
+from apps.vessels.models import VesselPosition
+from apps.vessels.partitions import DEFAULT_PARTITION, SQLitePartitioner, ensure_partitions, shard_index_sql
+
+logger = logging.getLogger(__name__)
+
+POSITION_COLUMNS = (
+    'vessel_id', 'latitude', 'longitude', 'speed_over_ground', 'course_over_ground', 'heading',
+    'navigational_status', 'timestamp', 'received_at', 'data_source', 'created_at', 'updated_at',
+)
+
+STAGING_TABLE = 'vessel_positions_load'
+
+TIMESTAMP_INDEX = POSITION_COLUMNS.index('timestamp')
+
+
+def payload_format(using='default'):
+    """'csv' for PostgreSQL COPY, 'rows' (tuples in POSITION_COLUMNS order) otherwise"""
+    return 'csv' if connections[using].vendor == 'postgresql' else 'rows'
+
+
+def ordered_map(function, tasks, workers):
+    """
+    Yield function(task) for each task in order, computed by a process pool
+    At most 2 * workers results are in flight, so a slow writer bounds memory.
+    workers=0 runs inline.
+    """
+    if workers <= 0:
+        yield from map(function, tasks)
+        return
+    # Spawned rather than forked: children must not inherit the loader's open connection
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup) as pool:
+        pending = deque()
+        for task in tasks:
+            pending.append(pool.submit(function, task))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def _text(values):
+    return ['' if value is None else str(value) for value in values]
+
+
+def format_positions(columns, fmt):
+    """
+    Turn column arrays into a loader payload
+    columns: vessel_id, latitude, longitude, timestamp (UTC epoch seconds) and
+    optionally speed_over_ground, course_over_ground, heading (NaN = missing),
+    navigational_status and data_source (array or scalar).
+    Positions keep their own timestamp as received_at/created_at so retention
+    and analytics see them as history.
+    """
+    count = len(columns['vessel_id'])
+    
+    def optional(name, decimals):
+        values = columns.get(name)
+        if values is None:
+            return [None] * count
+        values = np.asarray(values, dtype=float)
+        missing = np.isnan(values)
+        if decimals:
+            rounded = np.round(values, decimals).tolist()
+        else:
+            rounded = np.round(np.where(missing, 0, values)).astype(np.int64).tolist()
+        return [None if gap else value for gap, value in zip(missing.tolist(), rounded)]
+    
+    def text(name, default):
+        values = columns.get(name, default)
+        if values is None or isinstance(values, str):
+            return [values] * count
+        return [None if value is None or value != value else str(value) for value in values]
+    
+    stamps = np.datetime_as_string(np.asarray(columns['timestamp'], dtype=float).astype('datetime64[s]'), unit='s')
+    # SQLite stores naive UTC text, PostgreSQL gets an explicit offset
+    stamps = [stamp.replace('T', ' ') + ('+00' if fmt == 'csv' else '') for stamp in stamps.tolist()]
+    
+    data = [
+        np.asarray(columns['vessel_id'], dtype=np.int64).tolist(),
+        np.round(np.asarray(columns['latitude'], dtype=float), 7).tolist(),
+        np.round(np.asarray(columns['longitude'], dtype=float), 7).tolist(),
+        optional('speed_over_ground', 2),
+        optional('course_over_ground', 2),
+        optional('heading', 0),
+        text('navigational_status', None),
+        stamps,
+        stamps,
+        text('data_source', 'ais'),
+        stamps,
+        stamps,
+    ]
+    if fmt == 'rows':
+        return list(zip(*data))
+    
+    # COPY csv: an unquoted empty field is NULL; statuses and sources never contain commas or quotes
+    buffer = io.StringIO()
+    buffer.writelines(','.join(row) + '\n' for row in zip(*(_text(column) for column in data)))
+    return buffer.getvalue()
+
+
+class PositionBulkLoader:
+    """
+    Context manager that appends formatted payloads to vessel_positions
+    Rows that already exist for (vessel, timestamp) are skipped. With
+    defer_indexes the non-unique indexes are dropped before the first write
+    and rebuilt on exit (also after a failure); the unique index stays so
+    reruns are safe.
+    """
+    
+    def __init__(self, using='default', defer_indexes=True):
+        self.using = using
+        self.connection = connections[using]
+        self.table = VesselPosition._meta.db_table
+        self.format = payload_format(using)
+        self.defer_indexes = defer_indexes
+        self.deferred = []
+        self.prepared = False
+        self.covered = None  # epoch range already covered by partitions
+        self.shards = None
+        if self.connection.vendor == 'sqlite' and SQLitePartitioner(self.connection).is_partitioned():
+            self.shards = SQLitePartitioner(self.connection)
+        self.stats = {'rows': 0, 'inserted': 0, 'chunks': 0, 'index_rebuild_seconds': 0.0}
+    
+    def __enter__(self):
+        return self
+    
+    def _prepare(self):
+        """Session settings, staging table and index drops, done on the first write only"""
+        self.prepared = True
+        with self.connection.cursor() as cursor:
+            if self.connection.vendor == 'postgresql':
+                cursor.execute("SET synchronous_commit TO OFF")
+                cursor.execute(
+                    f"CREATE TEMP TABLE IF NOT EXISTS {STAGING_TABLE} AS "
+                    f"SELECT {', '.join(POSITION_COLUMNS)} FROM {self.quoted_table} WITH NO DATA"
+                )
+            elif self.connection.vendor == 'sqlite':
+                # Chunks are committed one by one; losing the tail of a load on power loss is acceptable
+                cursor.execute("PRAGMA synchronous = OFF")
+        if self.defer_indexes and self.connection.vendor in ('postgresql', 'sqlite'):
+            self._drop_indexes()
+    
+    def __exit__(self, exc_type, exc, tb):
+        if not self.prepared:
+            return False
+        try:
+            self._restore_indexes()
+        finally:
+            with self.connection.cursor() as cursor:
+                if self.connection.vendor == 'postgresql':
+                    cursor.execute(f"DROP TABLE IF EXISTS {STAGING_TABLE}")
+                    cursor.execute("SET synchronous_commit TO DEFAULT")
+                    cursor.execute(f"ANALYZE {self.quoted_table}")
+                elif self.connection.vendor == 'sqlite':
+                    cursor.execute("PRAGMA synchronous = FULL")
+                    for table in self.tables():
+                        cursor.execute(f"ANALYZE {self.connection.ops.quote_name(table)}")
+        return False
+    
+    @property
+    def quoted_table(self):
+        return self.connection.ops.quote_name(self.table)
+    
+    def tables(self):
+        """Physical tables behind vessel_positions (the SQLite shards, or the table itself)"""
+        return self.shards.tables() if self.shards else [self.table]
+    
+    def cover(self, start, end):
+        """Make sure partitions exist for positions timestamped in [start, end] (UTC epoch seconds)"""
+        start, end = int(start), int(end) + 1
+        if self.covered and self.covered[0] <= start and end <= self.covered[1]:
+            return []
+        if self.covered:
+            start, end = min(start, self.covered[0]), max(end, self.covered[1])
+        created = ensure_partitions(
+            datetime.fromtimestamp(start, dt_timezone.utc), datetime.fromtimestamp(end, dt_timezone.utc), self.using
+        )
+        self.covered = (start, end)
+        if created and self.shards:
+            # New shards copy the default shard's indexes, so they lack the deferred ones too
+            for name, definition, _ in [entry for entry in self.deferred if entry[2] == DEFAULT_PARTITION]:
+                self.deferred.extend(
+                    (f"{shard}__{name}", shard_index_sql(definition, name, shard), shard) for shard in created
+                )
+        return created
+    
+    def write(self, payload):
+        """Write one payload in its own transaction; returns the number of new rows"""
+        if not payload:
+            return 0
+        if not self.prepared:
+            self._prepare()
+        with transaction.atomic(using=self.using), self.connection.cursor() as cursor:
+            if self.connection.vendor == 'postgresql':
+                rows, inserted = self._copy(cursor, payload)
+            elif self.connection.vendor == 'sqlite':
+                rows = len(payload)
+                routed = self.shards.route(payload, TIMESTAMP_INDEX) if self.shards else {self.table: payload}
+                inserted = 0
+                for table, table_rows in routed.items():
+                    cursor.executemany(
+                        f"INSERT OR IGNORE INTO {self.connection.ops.quote_name(table)} ({', '.join(POSITION_COLUMNS)}) "
+                        f"VALUES ({', '.join(['%s'] * len(POSITION_COLUMNS))})",
+                        table_rows,
+                    )
+                    inserted += cursor.rowcount
+            else:
+                rows = len(payload)
+                VesselPosition.objects.using(self.using).bulk_create(
+                    [VesselPosition(**dict(zip(POSITION_COLUMNS, row))) for row in payload],
+                    batch_size=1000,
+                    ignore_conflicts=True,
+                )
+                inserted = rows  # not reported with ignore_conflicts
+        self.stats['rows'] += rows
+        self.stats['inserted'] += inserted
+        self.stats['chunks'] += 1
+        return inserted
+    
+    def _copy(self, cursor, payload):
+        columns = ', '.join(POSITION_COLUMNS)
+        sql = f"COPY {STAGING_TABLE} ({columns}) FROM STDIN WITH (FORMAT csv)"
+        raw = cursor.cursor
+        if hasattr(raw, 'copy_expert'):  # psycopg2
+            raw.copy_expert(sql, io.StringIO(payload))
+        else:  # psycopg 3
+            with raw.copy(sql) as copy:
+                copy.write(payload)
+        cursor.execute(f"SELECT COUNT(*) FROM {STAGING_TABLE}")
+        rows = cursor.fetchone()[0]
+        cursor.execute(
+            f"INSERT INTO {self.quoted_table} ({columns}) SELECT {columns} FROM {STAGING_TABLE} "
+            f"ON CONFLICT (vessel_id, timestamp) DO NOTHING"
+        )
+        inserted = cursor.rowcount
+        cursor.execute(f"TRUNCATE {STAGING_TABLE}")
+        return rows, inserted
+    
+    def _drop_indexes(self):
+        with self.connection.cursor() as cursor:
+            for table in self.tables():
+                constraints = self.connection.introspection.get_constraints(cursor, table)
+                for name, info in constraints.items():
+                    if not info['index'] or info['unique'] or info['primary_key']:
+                        continue
+                    if self.connection.vendor == 'postgresql':
+                        cursor.execute("SELECT indexdef FROM pg_indexes WHERE indexname = %s", [name])
+                    else:
+                        cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND name = %s", [name])
+                    row = cursor.fetchone()
+                    if not row or not row[0]:
+                        continue
+                    # A partitioned table's index reads "ON ONLY", which would not recreate it on the partitions
+                    definition = row[0].replace(' ON ONLY ', ' ON ', 1)
+                    # Logged so an interrupted load can be repaired by hand
+                    logger.info(f"Deferring index {name}: {definition}")
+                    cursor.execute(f"DROP INDEX {self.connection.ops.quote_name(name)}")
+                    self.deferred.append((name, definition, table))
+    
+    def _restore_indexes(self):
+        started = time.monotonic()
+        with self.connection.cursor() as cursor:
+            while self.deferred:
+                name, definition, _ = self.deferred[0]
+                cursor.execute(definition)
+                self.deferred.pop(0)
+                logger.info(f"Rebuilt index {name}")
+        self.stats['index_rebuild_seconds'] += time.monotonic() - started
@@ -0,0 +1,156 @@
+"""
+Dead-band compression of the position history
+A new fix is only stored in vessel_positions when it differs enough from the
+last stored fix of that vessel, or when the keep-alive interval has passed.
+The last stored state is kept in the shared cache, so the check never reads
+the database. The vessel's current state is always updated regardless.
+"""
+
+import logging
+import math
+from collections import Counter
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+
+# Course over ground is meaningless for (nearly) stationary vessels
+MIN_COURSE_SPEED = 1.0  # knots
+
+# Sources that are always stored (operator input is never compressed away)
+UNCOMPRESSED_SOURCES = ('manual',)
+
+
+def _float(value):
+    return float(value) if value is not None else None
+
+
+def _epoch(value):
+    if isinstance(value, datetime):
+        return value.timestamp()
+    return timezone.now().timestamp()
+
+
+class DeadBandFilter:
+    """
+    Decides which fixes are worth storing
+    
+    A fix is stored when any of these hold against the last stored fix:
+    - moved at least AIS_COMPRESSION_DISTANCE_M metres
+    - speed changed by at least AIS_COMPRESSION_SPEED_KN knots
+    - course changed by at least AIS_COMPRESSION_COURSE_DEG degrees (when under way)
+    - navigational status changed
+    - AIS_COMPRESSION_KEEPALIVE_MINUTES have passed since the last stored fix
+    Fixes older than the last stored one (late or backfilled data) are stored
+    without becoming the new reference.
+    """
+    
+    def __init__(self, namespace='ais:lastfix'):
+        self.namespace = namespace
+        self.stats = Counter()
+    
+    @property
+    def enabled(self):
+        return getattr(settings, 'AIS_COMPRESSION_ENABLED', True)
+    
+    def _key(self, vessel_id):
+        return f"{self.namespace}:{vessel_id}"
+    
+    def filter(self, fixes):
+        """
+        fixes: list of (vessel_id, position_data) in arrival order
+        Returns the indexes of the fixes to store; call remember() with the
+        stored fixes once they are committed
+        """
+        if not self.enabled:
+            return list(range(len(fixes)))
+        
+        try:
+            cached = cache.get_many([self._key(vessel_id) for vessel_id in {v for v, _ in fixes}])
+        except Exception as e:
+            logger.warning(f"Dead-band state read failed, storing every fix: {str(e)}")
+            cached = {}
+        last = {vessel_id: cached.get(self._key(vessel_id)) for vessel_id, _ in fixes}
+        
+        keep = []
+        for index, (vessel_id, data) in enumerate(fixes):
+            state = self._state(data)
+            previous = last[vessel_id]
+            if data.get('data_source') in UNCOMPRESSED_SOURCES or self._significant(previous, state):
+                keep.append(index)
+                if previous is None or state[5] >= previous[5]:
+                    last[vessel_id] = state
+            else:
+                self.stats['skipped'] += 1
+        self.stats['stored'] += len(keep)
+        return keep
+    
+    def remember(self, fixes):
+        """Record the latest stored fix per vessel as the new reference"""
+        if not self.enabled or not fixes:
+            return
+        latest = {}
+        for vessel_id, data in fixes:
+            state = self._state(data)
+            if vessel_id not in latest or state[5] >= latest[vessel_id][5]:
+                latest[vessel_id] = state
+        
+        # Outlive the keep-alive interval so the reference survives between fixes
+        ttl = max(getattr(settings, 'AIS_COMPRESSION_KEEPALIVE_MINUTES', 10) * 60 * 6, 3600)
+        try:
+            cache.set_many({self._key(vessel_id): state for vessel_id, state in latest.items()}, ttl)
+        except Exception as e:
+            logger.warning(f"Dead-band state write failed: {str(e)}")
+    
+    def _state(self, data):
+        # (lat, lon, sog, cog, status, epoch) - small and picklable
+        return (
+            _float(data['latitude']),
+            _float(data['longitude']),
+            _float(data.get('speed_over_ground')),
+            _float(data.get('course_over_ground')),
+            data.get('navigational_status'),
+            _epoch(data.get('timestamp')),
+        )
+    
+    def _significant(self, previous, state):
+        if previous is None:
+            return True
+        lat, lon, sog, cog, status, ts = state
+        last_lat, last_lon, last_sog, last_cog, last_status, last_ts = previous
+        
+        if ts < last_ts:
+            return True
+        if ts - last_ts >= getattr(settings, 'AIS_COMPRESSION_KEEPALIVE_MINUTES', 10) * 60:
+            return True
+        if status != last_status:
+            return True
+        
+        # Equirectangular approximation, accurate to well under a metre at these distances
+        dy = math.radians(lat - last_lat)
+        dx = math.radians(lon - last_lon) * math.cos(math.radians((lat + last_lat) / 2))
+        if EARTH_RADIUS_M * math.hypot(dx, dy) >= getattr(settings, 'AIS_COMPRESSION_DISTANCE_M', 50):
+            return True
+        
+        if (sog is None) != (last_sog is None):
+            return True
+        if sog is not None and abs(sog - last_sog) >= getattr(settings, 'AIS_COMPRESSION_SPEED_KN', 0.5):
+            return True
+        
+        if cog is not None and last_cog is not None and max(sog or 0, last_sog or 0) >= MIN_COURSE_SPEED:
+            turn = abs(cog - last_cog) % 360
+            if min(turn, 360 - turn) >= getattr(settings, 'AIS_COMPRESSION_COURSE_DEG', 5):
+                return True
+        return False
+
+
+position_filter = DeadBandFilter()
+
+
+def compression_stats():
+    return dict(position_filter.stats)
@@ -0,0 +1,145 @@
+"""
+Tiered downsampling of the position history
+Positions younger than the first tier keep full resolution; older ones are
+thinned per tier (AIS_POSITION_DOWNSAMPLE_TIERS) to the first fix of each
+resolution bucket per vessel, plus every fix where the navigational status
+changed or the course turned by AIS_POSITION_DOWNSAMPLE_TURN_DEG since the
+last kept fix, so voyages keep their shape (gradual turns included) and stops. Each tier works through its age band in
+AIS_POSITION_DOWNSAMPLE_CHUNK_HOURS chunks and records how far it got in a
+PositionDownsampleWatermark, so runs are incremental and can be cut short.
+Positions loaded later into an already processed range stay as loaded.
+"""
+
+import logging
+import math
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db.models import Min
+from django.utils import timezone
+
+from .compression import MIN_COURSE_SPEED
+from .models import PositionDownsampleWatermark, VesselPosition
+from .partitions import delete_positions
+
+logger = logging.getLogger(__name__)
+
+
+def downsample_tiers():
+    """(age in days, resolution in seconds) pairs, youngest first"""
+    return sorted((int(days), int(seconds)) for days, seconds in getattr(settings, 'AIS_POSITION_DOWNSAMPLE_TIERS', []))
+
+
+def _align(moment, seconds):
+    epoch = int(moment.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % seconds, dt_timezone.utc)
+
+
+def select_keepers(frame, resolution, turn_deg):
+    """
+    Boolean mask of the fixes to keep
+    frame: vessel_id, timestamp (epoch seconds), speed_over_ground,
+    course_over_ground, heading, navigational_status, sorted by vessel and time
+    """
+    vessel = frame['vessel_id'].to_numpy()
+    same_vessel = np.r_[False, vessel[1:] == vessel[:-1]]
+    bucket = frame['timestamp'].to_numpy() // resolution
+    first_in_bucket = ~same_vessel | np.r_[True, bucket[1:] != bucket[:-1]]
+    
+    status = frame['navigational_status'].fillna('').to_numpy()
+    status_changed = same_vessel & np.r_[False, status[1:] != status[:-1]]
+    
+    # Course over ground, else heading (511 = not available); meaningless when (nearly) stationary
+    course = frame['course_over_ground'].to_numpy(dtype=float)
+    heading = frame['heading'].to_numpy(dtype=float)
+    course = np.where(np.isnan(course) & (heading < 360), heading, course)
+    course[frame['speed_over_ground'].to_numpy(dtype=float) < MIN_COURSE_SPEED] = np.nan
+    
+    # Turns are measured from the course at the last kept fix, so a gradual turn adds up until
+    # it is kept; this depends on earlier decisions, hence the scan
+    keep = first_in_bucket | status_changed
+    turned = np.zeros(len(keep), dtype=bool)
+    reference = math.nan
+    for index, (new_track, value, kept) in enumerate(zip((~same_vessel).tolist(), course.tolist(), keep.tolist())):
+        if new_track:
+            reference = math.nan
+        if math.isnan(value):
+            continue
+        if not math.isnan(reference):
+            turn = abs(value - reference) % 360
+            if min(turn, 360 - turn) >= turn_deg:
+                turned[index] = kept = True
+        # No course at the last kept fix (stationary): the first one after it is the reference
+        if kept or math.isnan(reference):
+            reference = value
+    
+    return keep | turned
+
+
+def downsample_chunk(start, end, resolution, using='default'):
+    """Thin the positions timestamped in [start, end); returns (examined, deleted)"""
+    # Sorted in pandas: ordering in SQL keeps the per-partition timestamp indexes from being used
+    rows = VesselPosition.objects.using(using).filter(timestamp__gte=start, timestamp__lt=end).order_by().values_list(
+        'id', 'vessel_id', 'timestamp', 'speed_over_ground', 'course_over_ground', 'heading', 'navigational_status'
+    )
+    frame = pd.DataFrame.from_records(
+        list(rows),
+        columns=['id', 'vessel_id', 'timestamp', 'speed_over_ground', 'course_over_ground', 'heading', 'navigational_status'],
+    )
+    if frame.empty:
+        return 0, 0
+    frame['timestamp'] = (pd.to_datetime(frame['timestamp'], utc=True) - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)
+    for name in ('speed_over_ground', 'course_over_ground', 'heading'):
+        frame[name] = pd.to_numeric(frame[name], errors='coerce')
+    frame = frame.sort_values(['vessel_id', 'timestamp'], kind='stable')
+    
+    keep = select_keepers(frame, resolution, getattr(settings, 'AIS_POSITION_DOWNSAMPLE_TURN_DEG', 30))
+    dropped = frame['id'].to_numpy()[~keep].tolist()
+    deleted = delete_positions(dropped, start, end, using) if dropped else 0
+    return len(frame), deleted
+
+
+def downsample_positions(now=None, time_budget=None, using='default'):
+    """
+    Advance every tier through its age band until done or out of time
+    A tier's band ends where the next (coarser) tier takes over, so no range
+    is thinned twice. Returns {resolution: Counter(chunks, examined, deleted)}.
+    """
+    now = now or timezone.now()
+    time_budget = time_budget if time_budget is not None else getattr(settings, 'AIS_POSITION_DOWNSAMPLE_TIME_BUDGET', 240)
+    chunk = int(getattr(settings, 'AIS_POSITION_DOWNSAMPLE_CHUNK_HOURS', 1) * 3600)
+    started = time.monotonic()
+    tiers = downsample_tiers()
+    positions = VesselPosition.objects.using(using)
+    
+    def next_chunk(mark, target):
+        # Start of the chunk holding the first position at or after mark, so gaps in the history are skipped
+        earliest = positions.filter(timestamp__gte=mark, timestamp__lt=target).aggregate(earliest=Min('timestamp'))['earliest']
+        return _align(earliest, chunk) if earliest else target
+    
+    stats = {}
+    for index, (days, resolution) in enumerate(tiers):
+        stats[resolution] = Counter()
+        target = _align(now - timedelta(days=days), chunk)
+        floor = _align(now - timedelta(days=tiers[index + 1][0]), chunk) if index + 1 < len(tiers) else None
+        watermark = PositionDownsampleWatermark.objects.using(using).filter(resolution_seconds=resolution).first()
+        mark = watermark.processed_until if watermark else datetime.min.replace(tzinfo=dt_timezone.utc)
+        if floor and mark < floor:
+            mark = floor
+        mark = max(mark, next_chunk(mark, target))
+        
+        while mark < target and time.monotonic() - started < time_budget:
+            end = min(mark + timedelta(seconds=chunk), target)
+            examined, deleted = downsample_chunk(mark, end, resolution, using)
+            stats[resolution].update(chunks=1, examined=examined, deleted=deleted)
+            mark = end if examined else next_chunk(end, target)
+            PositionDownsampleWatermark.objects.using(using).update_or_create(
+                resolution_seconds=resolution, defaults={'processed_until': mark}
+            )
+        if mark < target:
+            logger.info(f"Downsampling to {resolution}s stopped at {mark} (target {target}); continuing next run")
+    return stats
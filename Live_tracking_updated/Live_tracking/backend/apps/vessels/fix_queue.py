@@ -0,0 +1,361 @@
+"""
+Buffered ingestion queue between position fetchers and the database writer
+Fetchers publish normalised fixes and return immediately; a dedicated writer
+drains the queue in batches of AIS_QUEUE_BATCH_SIZE rows or
+AIS_QUEUE_MAX_WAIT_MS milliseconds, so slow commits never stall provider I/O
+
+Backends (AIS_QUEUE_BACKEND):
+- 'redis': a Redis stream read through a consumer group, drained by the
+  write_fix_queue management command; fixes are acknowledged only after they
+  are committed and those of a dead writer are claimed by another one
+- 'local': an in-process queue drained by a writer thread (single node)
+- '' (default): no queue, fetchers write directly
+
+Load shedding when the database falls behind: the backlog is capped at
+AIS_QUEUE_MAXLEN fixes (oldest dropped first, they are superseded anyway),
+and while the oldest queued fix is older than AIS_QUEUE_MAX_LAG seconds the
+writer keeps only the latest fix per vessel of each batch
+"""
+
+import json
+import logging
+import os
+import socket
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from datetime import datetime
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils.dateparse import parse_datetime
+from redis.exceptions import RedisError, ResponseError
+
+from apps.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f"Cannot queue {type(value).__name__}")
+
+
+def encode_fix(fix):
+    return json.dumps(fix, default=_encode, separators=(',', ':'))
+
+
+def decode_fix(raw):
+    fix = json.loads(raw)
+    if isinstance(fix.get('timestamp'), str):
+        fix['timestamp'] = parse_datetime(fix['timestamp'])
+    return fix
+
+
+class RedisFixQueue:
+    """Redis stream with a consumer group; entries are deleted once acknowledged"""
+    
+    def __init__(self, stream=None, group=None, client=None):
+        self.stream = stream or getattr(settings, 'AIS_QUEUE_STREAM', 'ais:fixes')
+        self.group = group or getattr(settings, 'AIS_QUEUE_GROUP', 'writers')
+        self.maxlen = getattr(settings, 'AIS_QUEUE_MAXLEN', 200000)
+        self.redis = client or get_redis()
+        self._group_ready = False
+    
+    def publish(self, fixes):
+        pipe = self.redis.pipeline(transaction=False)
+        for fix in fixes:
+            # Approximate trimming is O(1); the oldest fixes go first
+            pipe.xadd(self.stream, {'f': encode_fix(fix)}, maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+        return len(fixes)
+    
+    def ensure_group(self):
+        if self._group_ready:
+            return
+        try:
+            self.redis.xgroup_create(self.stream, self.group, id='0', mkstream=True)
+        except ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+        self._group_ready = True
+    
+    def read(self, consumer, count, block_ms):
+        """New entries for this consumer as [(entry_id, fix)]"""
+        self.ensure_group()
+        response = self.redis.xreadgroup(self.group, consumer, {self.stream: '>'}, count=count, block=block_ms or None)
+        return self._entries(response[0][1] if response else [])
+    
+    def claim(self, consumer, min_idle_ms, count=1000):
+        """
+        Take over entries delivered but never acknowledged for min_idle_ms
+        (a writer that died mid-batch); min_idle_ms=0 on startup also picks
+        up this consumer's own unfinished batch
+        """
+        self.ensure_group()
+        _, entries, *_ = self.redis.xautoclaim(
+            self.stream, self.group, consumer, min_idle_ms, start_id='0-0', count=count
+        )
+        return self._entries(entries)
+    
+    def ack(self, entry_ids):
+        if entry_ids:
+            pipe = self.redis.pipeline()
+            pipe.xack(self.stream, self.group, *entry_ids)
+            pipe.xdel(self.stream, *entry_ids)
+            pipe.execute()
+    
+    def lag_seconds(self):
+        """Age of the oldest entry still in the stream"""
+        oldest = self.redis.xrange(self.stream, count=1)
+        if not oldest:
+            return 0.0
+        entry_id = oldest[0][0]
+        entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+        return max(0.0, time.time() - int(entry_id.split('-')[0]) / 1000)
+    
+    def stats(self):
+        self.ensure_group()
+        pipe = self.redis.pipeline()
+        pipe.xlen(self.stream)
+        pipe.xpending(self.stream, self.group)
+        depth, pending = pipe.execute()
+        return {
+            'backend': 'redis',
+            'depth': depth,
+            'pending': pending['pending'],
+            'consumers': len(pending['consumers']),
+            'lag_seconds': round(self.lag_seconds(), 1),
+        }
+    
+    def _entries(self, raw_entries):
+        entries = []
+        for entry_id, fields in raw_entries:
+            entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+            # Trimmed while pending: nothing left to write, acknowledge it
+            raw = (fields or {}).get(b'f') or (fields or {}).get('f')
+            entries.append((entry_id, decode_fix(raw) if raw else None))
+        return entries
+
+
+class LocalFixQueue:
+    """In-process queue with the same interface, for single-node deployments"""
+    
+    def __init__(self, maxlen=None):
+        self.maxlen = maxlen or getattr(settings, 'AIS_QUEUE_MAXLEN', 200000)
+        self._entries = deque()
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+        self._next_id = 0
+        self.trimmed = 0
+    
+    def publish(self, fixes):
+        with self._cond:
+            now = time.time()
+            for fix in fixes:
+                self._next_id += 1
+                self._entries.append((f"{self._next_id}", now, fix))
+            while len(self._entries) > self.maxlen:
+                self._entries.popleft()
+                self.trimmed += 1
+            self._cond.notify()
+        return len(fixes)
+    
+    def read(self, consumer, count, block_ms):
+        with self._cond:
+            if not self._entries and block_ms:
+                self._cond.wait(block_ms / 1000)
+            entries = []
+            while self._entries and len(entries) < count:
+                entry_id, published, fix = self._entries.popleft()
+                self._pending[entry_id] = (published, fix)
+                entries.append((entry_id, fix))
+            return entries
+    
+    def claim(self, consumer, min_idle_ms, count=1000):
+        # Pending entries belong to this process's writer, which never dies alone
+        return []
+    
+    def ack(self, entry_ids):
+        with self._cond:
+            for entry_id in entry_ids:
+                self._pending.pop(entry_id, None)
+    
+    def lag_seconds(self):
+        with self._cond:
+            oldest = [next(iter(self._pending.values()))[0]] if self._pending else []
+            if self._entries:
+                oldest.append(self._entries[0][1])
+        return max(0.0, time.time() - min(oldest)) if oldest else 0.0
+    
+    def stats(self):
+        return {
+            'backend': 'local',
+            'depth': len(self._entries) + len(self._pending),
+            'pending': len(self._pending),
+            'consumers': 1,
+            'lag_seconds': round(self.lag_seconds(), 1),
+            'trimmed': self.trimmed,
+        }
+
+
+class FixQueueWriter:
+    """
+    Drains a fix queue into Vessel/VesselPosition
+    Batches are written with apply_position_batch, which is idempotent per
+    (vessel, timestamp), so redelivered fixes are harmless. A batch that fails
+    is retried with backoff and only acknowledged once it is committed.
+    """
+    
+    def __init__(self, queue, consumer=None, batch_size=None, max_wait_ms=None):
+        self.queue = queue
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.batch_size = batch_size or getattr(settings, 'AIS_QUEUE_BATCH_SIZE', 1000)
+        self.max_wait_ms = max_wait_ms or getattr(settings, 'AIS_QUEUE_MAX_WAIT_MS', 500)
+        self.max_lag = getattr(settings, 'AIS_QUEUE_MAX_LAG', 30)
+        self.claim_idle_ms = int(getattr(settings, 'AIS_QUEUE_CLAIM_IDLE', 60) * 1000)
+        self.stats = Counter()
+        self._stop = threading.Event()
+        self._last_claim = 0.0
+    
+    def stop(self):
+        self._stop.set()
+    
+    def run(self, tick=None):
+        """Write until stop(); tick() is called once per loop, e.g. for progress output"""
+        # Our own unfinished batch from before a restart
+        batch = self.queue.claim(self.consumer, 0, count=self.batch_size)
+        backoff = 1
+        while not self._stop.is_set():
+            if tick is not None:
+                tick()
+            try:
+                batch = batch or self.collect()
+                if batch:
+                    self.write(batch)
+                    batch = []
+                backoff = 1
+            except RedisError as e:
+                logger.error(f"Fix queue unavailable, retrying in {backoff}s: {str(e)}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30)
+            except Exception as e:
+                # Database error: keep the batch unacknowledged and retry it
+                self.stats['failed_batches'] += 1
+                logger.error(f"Error writing queued batch of {len(batch)} fixes, retrying in {backoff}s: {str(e)}")
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, 30)
+    
+    def collect(self):
+        """Up to batch_size entries, waiting at most max_wait_ms after the first"""
+        now = time.monotonic()
+        if now - self._last_claim >= self.claim_idle_ms / 1000:
+            self._last_claim = now
+            claimed = self.queue.claim(self.consumer, self.claim_idle_ms, count=self.batch_size)
+            if claimed:
+                self.stats['claimed'] += len(claimed)
+                return claimed
+        
+        batch = self.queue.read(self.consumer, self.batch_size, self.max_wait_ms)
+        if not batch:
+            return []
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.batch_size and not self._stop.is_set():
+            remaining = int((deadline - time.monotonic()) * 1000)
+            if remaining <= 0:
+                break
+            more = self.queue.read(self.consumer, self.batch_size - len(batch), remaining)
+            if not more:
+                break
+            batch.extend(more)
+        return batch
+    
+    def write(self, batch):
+        from .models import Vessel
+        from .services import VesselService
+        
+        entry_ids = [entry_id for entry_id, _ in batch]
+        fixes = [fix for _, fix in batch if fix]
+        
+        if self.queue.lag_seconds() > self.max_lag:
+            # Falling behind: the last fix per vessel (arrival order) keeps current state right
+            latest = {}
+            for fix in fixes:
+                latest[fix['mmsi']] = fix
+            self.stats['shed'] += len(fixes) - len(latest)
+            fixes = list(latest.values())
+        
+        close_old_connections()
+        vessels = {v.mmsi: v for v in Vessel.objects.filter(mmsi__in={f['mmsi'] for f in fixes}, is_deleted=False)}
+        updates = [(vessels[fix['mmsi']], fix) for fix in fixes if fix['mmsi'] in vessels]
+        VesselService.apply_position_batch(updates)
+        self.queue.ack(entry_ids)
+        
+        self.stats['written'] += len(updates)
+        self.stats['unknown'] += len(fixes) - len(updates)
+        self.stats['batches'] += 1
+        return len(updates)
+
+
+_queue = None
+_queue_pid = None
+_queue_lock = threading.Lock()
+
+
+def get_fix_queue():
+    """
+    Process-wide queue for AIS_QUEUE_BACKEND, or None when fetchers write directly
+    The local backend starts its writer thread on first use
+    """
+    global _queue, _queue_pid
+    backend = getattr(settings, 'AIS_QUEUE_BACKEND', '')
+    if not backend:
+        return None
+    if _queue is None or _queue_pid != os.getpid():
+        with _queue_lock:
+            if _queue is None or _queue_pid != os.getpid():
+                if backend == 'redis':
+                    _queue = RedisFixQueue()
+                elif backend == 'local':
+                    _queue = LocalFixQueue()
+                    writer = FixQueueWriter(_queue)
+                    threading.Thread(target=writer.run, name='fix-queue-writer', daemon=True).start()
+                    _queue.writer = writer
+                else:
+                    raise ValueError(f"Unknown AIS_QUEUE_BACKEND '{backend}'")
+                _queue_pid = os.getpid()
+    return _queue
+
+
+def publish_fixes(positions):
+    """
+    Queue {mmsi: position_data} for the writer
+    Returns the number queued, or None when no queue is configured or the
+    queue is unavailable (the caller then writes directly)
+    """
+    queue = get_fix_queue()
+    if queue is None:
+        return None
+    try:
+        return queue.publish([{**data, 'mmsi': mmsi} for mmsi, data in positions.items()])
+    except RedisError as e:
+        logger.warning(f"Fix queue unavailable, writing directly: {str(e)}")
+        return None
+
+
+def fix_queue_stats():
+    queue = get_fix_queue()
+    if queue is None:
+        return {'backend': None}
+    try:
+        stats = queue.stats()
+    except RedisError as e:
+        return {'backend': 'redis', 'error': str(e)}
+    writer = getattr(queue, 'writer', None)
+    if writer is not None:
+        stats['writer'] = dict(writer.stats)
+    return stats
@@ -0,0 +1,207 @@
+"""
+Micro-batched writers for streamed AIS data
+Used by the feed ingesters (NMEA, AISStream): messages are buffered and
+written with one vessel lookup, one bulk_update and one bulk_create per batch.
+PositionUploadIngest does the same for NDJSON/CSV uploads to the API
+"""
+
+import csv
+import json
+import logging
+import time
+from collections import Counter
+
+from django.conf import settings
+from rest_framework import serializers
+
+from .models import Vessel
+from .nmea import STATIC_FIELDS
+from .services import VesselService
+
+logger = logging.getLogger(__name__)
+
+# imo_number is unique in the database, so it is never overwritten from a feed
+WRITABLE_STATIC_FIELDS = tuple(field for field in STATIC_FIELDS if field != 'imo_number')
+
+
+class PositionBatchWriter:
+    """
+    Buffers decoded messages and flushes them to Vessel/VesselPosition
+    
+    A flush happens when batch_size position reports are buffered, or on
+    maybe_flush() once flush_interval seconds have passed since the last one.
+    Only MMSIs that exist as (non-deleted) vessels are written; the rest are
+    counted as unknown. Static fields are merged per MMSI and written once.
+    """
+    
+    def __init__(self, batch_size=None, flush_interval=None, dry_run=False):
+        self.batch_size = batch_size or getattr(settings, 'AIS_WRITE_BATCH_SIZE', 500)
+        self.flush_interval = flush_interval or getattr(settings, 'AIS_INGEST_FLUSH_INTERVAL', 1.0)
+        self.dry_run = dry_run
+        self.stats = Counter()
+        self._positions = []
+        self._static = {}
+        self._last_flush = time.monotonic()
+    
+    def __len__(self):
+        return len(self._positions) + len(self._static)
+    
+    def add(self, message):
+        mmsi = message['mmsi']
+        if message.get('latitude') is not None and message.get('longitude') is not None:
+            self._positions.append(message)
+        
+        static = {field: message[field] for field in WRITABLE_STATIC_FIELDS if message.get(field) is not None}
+        if static:
+            self._static.setdefault(mmsi, {}).update(static)
+        
+        if len(self._positions) >= self.batch_size:
+            self.flush()
+    
+    def maybe_flush(self):
+        if len(self) and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+    
+    def flush(self):
+        positions, static = self._positions, self._static
+        self._positions, self._static = [], {}
+        self._last_flush = time.monotonic()
+        if not positions and not static:
+            return 0
+        
+        if self.dry_run:
+            self.stats['positions'] += len(positions)
+            self.stats['static_updates'] += len(static)
+            return len(positions)
+        
+        mmsis = {message['mmsi'] for message in positions}
+        mmsis.update(static)
+        vessels = {v.mmsi: v for v in Vessel.objects.filter(mmsi__in=mmsis, is_deleted=False)}
+        
+        try:
+            self._write_static(vessels, static)
+            updates = [(vessels[m['mmsi']], m) for m in positions if m['mmsi'] in vessels]
+            VesselService.apply_position_batch(updates)
+        except Exception as e:
+            self.stats['failed_batches'] += 1
+            logger.error(f"Error writing ingest batch of {len(positions)} positions: {str(e)}")
+            return 0
+        
+        self.stats['positions'] += len(updates)
+        self.stats['unknown'] += len(positions) - len(updates)
+        self.stats['batches'] += 1
+        return len(updates)
+    
+    def _write_static(self, vessels, static):
+        changed = []
+        fields = set()
+        for mmsi, values in static.items():
+            vessel = vessels.get(mmsi)
+            if vessel is None:
+                continue
+            for field, value in values.items():
+                if field in ('vessel_name', 'call_sign', 'destination') and isinstance(value, str):
+                    value = value[:Vessel._meta.get_field(field).max_length]
+                if getattr(vessel, field) != value:
+                    setattr(vessel, field, value)
+                    fields.add(field)
+            changed.append(vessel)
+        
+        if changed and fields:
+            Vessel.objects.bulk_update(changed, sorted(fields), batch_size=self.batch_size)
+            self.stats['static_updates'] += len(changed)
+
+
+class PositionUploadIngest:
+    """
+    Incremental ingest of an uploaded NDJSON or CSV body
+    
+    Rows are parsed one line at a time, validated with the bulk position
+    serializer and committed through bulk_update_positions every batch_size
+    rows, so memory use does not depend on the size of the upload.
+    batches() yields a summary per committed batch; errors are reported
+    with their row number (capped per batch).
+    """
+    
+    FORMATS = ('ndjson', 'csv')
+    MAX_BATCH_ERRORS = 100
+    
+    def __init__(self, lines, format='ndjson', batch_size=None):
+        if format not in self.FORMATS:
+            raise ValueError(f"Unsupported upload format '{format}'")
+        self.lines = lines
+        self.format = format
+        self.batch_size = batch_size or getattr(settings, 'AIS_UPLOAD_BATCH_SIZE', 1000)
+        self.totals = Counter()
+    
+    def batches(self):
+        # Imported here: serializers are an API concern the feed writers do not need
+        from .serializers import VesselPositionBulkSerializer
+        
+        serializer = VesselPositionBulkSerializer()
+        valid, errors, rows = [], [], 0
+        for row_number, row in self._rows():
+            rows += 1
+            try:
+                if isinstance(row, Exception):
+                    raise serializers.ValidationError(str(row))
+                valid.append(serializer.run_validation(row))
+            except serializers.ValidationError as e:
+                errors.append({'row': row_number, 'errors': e.detail})
+            if rows >= self.batch_size:
+                yield self._commit(valid, errors, rows)
+                valid, errors, rows = [], [], 0
+        if rows:
+            yield self._commit(valid, errors, rows)
+    
+    def _commit(self, valid, errors, rows):
+        result = VesselService.bulk_update_positions(valid) if valid else {'updated': 0, 'errors': []}
+        self.totals['batches'] += 1
+        self.totals['rows'] += rows
+        self.totals['updated'] += result['updated']
+        self.totals['rejected'] += rows - result['updated']
+        
+        all_errors = errors + result['errors']
+        summary = {
+            'batch': self.totals['batches'],
+            'rows': rows,
+            'updated': result['updated'],
+            'rejected': rows - result['updated'],
+            'errors': all_errors[:self.MAX_BATCH_ERRORS],
+        }
+        logger.info(
+            f"Position upload batch {summary['batch']}: {rows} rows, {summary['updated']} updated, "
+            f"{summary['rejected']} rejected ({self.totals['rows']} rows so far)"
+        )
+        return summary
+    
+    def _text_lines(self):
+        for number, line in enumerate(self.lines):
+            if isinstance(line, bytes):
+                line = line.decode('utf-8', 'replace')
+            if number == 0:
+                line = line.lstrip('\ufeff')
+            yield line
+    
+    def _rows(self):
+        """(row number, dict or parse error) pairs; row numbers count data rows from 1"""
+        if self.format == 'csv':
+            reader = csv.DictReader(self._text_lines())
+            for number, row in enumerate(reader, 1):
+                # Empty cells are omitted so optional fields stay optional
+                yield number, {key: value for key, value in row.items() if key and value not in ('', None)}
+            return
+        
+        number = 0
+        for line in self._text_lines():
+            line = line.strip()
+            if not line:
+                continue
+            number += 1
+            try:
+                row = json.loads(line)
+                if not isinstance(row, dict):
+                    raise ValueError('expected a JSON object')
+            except ValueError as e:
+                row = ValueError(f"Invalid JSON: {str(e)}")
+            yield number, row
@@ -0,0 +1,214 @@
+"""
+Live picture of the latest state of every known vessel
+Rebuilt in the background (refresh_live_picture task) and stored in a Redis
+hash; every process keeps a numpy mirror so bbox queries never touch upstream
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from apps.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+PICTURE_KEY = 'ais:live:vessels'
+META_KEY = 'ais:live:meta'
+
+GLOBAL_BBOX = (-90.0, 90.0, -180.0, 180.0)
+
+# MMSIs per IN query when resolving ids (stays under SQLite's bound parameter limit)
+ID_LOOKUP_BATCH = 500
+
+
+class LivePicture:
+    """
+    Latest vessel records indexed for bbox queries
+    
+    The worker publishes a full picture with replace(): records are written to a
+    temporary hash which is renamed over PICTURE_KEY, and the version counter in
+    META_KEY is bumped. Readers check the version at most every
+    AIS_LIVE_PICTURE_CHECK_INTERVAL seconds and reload the mirror only when it
+    changed. Records returned by query() are shared - do not mutate them.
+    """
+    
+    def __init__(self):
+        self.check_interval = getattr(settings, 'AIS_LIVE_PICTURE_CHECK_INTERVAL', 1.0)
+        self.retry_interval = getattr(settings, 'AIS_LIVE_PICTURE_RETRY_INTERVAL', 30)
+        self._lock = threading.Lock()
+        self._records = []
+        self._lat = np.empty(0)
+        self._lon = np.empty(0)
+        self._version = None
+        self._checked_at = 0
+        self._redis_down_until = 0
+        self.updated_at = None  # epoch seconds of the last published picture
+    
+    # Publishing (background worker)
+    
+    def replace(self, records):
+        """Publish a complete picture, replacing the previous one"""
+        records = [r for r in records if r.get('mmsi') and _has_position(r)]
+        updated_at = time.time()
+        
+        try:
+            client = get_redis()
+            tmp_key = f"{PICTURE_KEY}:tmp:{os.getpid()}"
+            pipe = client.pipeline()
+            pipe.delete(tmp_key)
+            if records:
+                pipe.hset(tmp_key, mapping={
+                    str(r['mmsi']): json.dumps(r, cls=DjangoJSONEncoder) for r in records
+                })
+                pipe.rename(tmp_key, PICTURE_KEY)
+            else:
+                pipe.delete(PICTURE_KEY)
+            pipe.hset(META_KEY, mapping={'updated_at': updated_at, 'count': len(records)})
+            pipe.hincrby(META_KEY, 'version', 1)
+            pipe.execute()
+        except redis.RedisError as e:
+            logger.warning(f"Could not publish live picture to Redis, keeping it in-process only: {str(e)}")
+        
+        # Decode through JSON so the local mirror matches what readers load from Redis
+        self._load(json.loads(json.dumps(records, cls=DjangoJSONEncoder)), updated_at, None)
+        return len(records)
+    
+    # Reading
+    
+    def query(self, min_lat, max_lat, min_lon, max_lon):
+        """Records inside the bbox, in publishing order"""
+        self._refresh()
+        with self._lock:
+            records, lat, lon = self._records, self._lat, self._lon
+        
+        mask = (lat >= min_lat) & (lat <= max_lat) & (lon >= min_lon) & (lon <= max_lon)
+        return [records[i] for i in np.flatnonzero(mask)]
+    
+    def freshness(self):
+        """When the picture was published and how old it is now"""
+        if self.updated_at is None:
+            return {'updated_at': None, 'age_seconds': None}
+        return {
+            'updated_at': datetime.fromtimestamp(self.updated_at, tz=dt_timezone.utc).isoformat(),
+            'age_seconds': round(max(0.0, time.time() - self.updated_at), 1),
+        }
+    
+    def is_empty(self):
+        self._refresh()
+        return self.updated_at is None
+    
+    def _refresh(self):
+        """Reload the mirror if another process published a newer picture"""
+        now = time.monotonic()
+        if now - self._checked_at < self.check_interval or now < self._redis_down_until:
+            return
+        self._checked_at = now
+        
+        try:
+            client = get_redis()
+            meta = client.hgetall(META_KEY)
+            version = meta.get(b'version')
+            if version is None or version == self._version:
+                return
+            raw = client.hvals(PICTURE_KEY)
+        except redis.RedisError as e:
+            self._redis_down_until = now + self.retry_interval
+            logger.warning(f"Live picture unavailable from Redis, serving in-process copy: {str(e)}")
+            return
+        
+        records = [json.loads(value) for value in raw]
+        self._load(records, float(meta[b'updated_at']), version)
+        logger.debug(f"Live picture mirror reloaded: {len(records)} vessels")
+    
+    def _load(self, records, updated_at, version):
+        lat = np.fromiter((float(r['latitude']) for r in records), dtype=float, count=len(records))
+        lon = np.fromiter((float(r['longitude']) for r in records), dtype=float, count=len(records))
+        with self._lock:
+            self._records = records
+            self._lat = lat
+            self._lon = lon
+            self._version = version
+            self.updated_at = updated_at
+
+
+def _has_position(record):
+    try:
+        float(record['latitude'])
+        float(record['longitude'])
+        return True
+    except (KeyError, TypeError, ValueError):
+        return False
+
+
+def _attach_ids(records):
+    """Add database IDs so the frontend can open vessel details"""
+    from .models import Vessel
+    
+    # Database records already carry their id; only provider records are looked up, by MMSI
+    missing = list({str(r['mmsi']) for r in records if r.get('id') is None and r.get('mmsi')})
+    mmsi_to_id_map = {}
+    for start in range(0, len(missing), ID_LOOKUP_BATCH):
+        mmsi_to_id_map.update(Vessel.objects.filter(mmsi__in=missing[start:start + ID_LOOKUP_BATCH]).values_list('mmsi', 'id'))
+    for record in records:
+        if record.get('id') is None:
+            record['id'] = mmsi_to_id_map.get(str(record.get('mmsi')))
+    return records
+
+
+_picture = None
+_picture_pid = None
+_picture_lock = threading.Lock()
+
+
+def get_live_picture():
+    """Process-wide LivePicture"""
+    global _picture, _picture_pid
+    if _picture is None or _picture_pid != os.getpid():
+        with _picture_lock:
+            if _picture is None or _picture_pid != os.getpid():
+                _picture = LivePicture()
+                _picture_pid = os.getpid()
+    return _picture
+
+
+def rebuild_live_picture(ais_service=None):
+    """
+    Fetch the whole globe once (database + providers) and publish it
+    Called by the refresh_live_picture task. Goes through fetch_vessels_in_area,
+    so provider results come from the area tile cache (at most AIS_TILE_TTL old)
+    and vessels get weather from the StormGlass grid. IDs are resolved here and
+    stored with the records, so readers never look them up.
+    """
+    from .services import AISIntegrationService
+    
+    ais_service = ais_service or AISIntegrationService()
+    records = ais_service.fetch_vessels_in_area(*GLOBAL_BBOX)
+    return get_live_picture().replace(_attach_ids(records))
+
+
+def vessels_in_area(min_lat, max_lat, min_lon, max_lon):
+    """
+    Vessel records in a bbox from the live picture
+    Returns (records, meta). Until the first picture has been published
+    (e.g. no Celery worker in development) the database positions are served
+    instead, still without any upstream call.
+    """
+    picture = get_live_picture()
+    if not picture.is_empty():
+        meta = {'source': 'live_picture'}
+        meta.update(picture.freshness())
+        return picture.query(min_lat, max_lat, min_lon, max_lon), meta
+    
+    from .services import AISIntegrationService
+    
+    # Database records carry their ids already
+    records = AISIntegrationService()._fetch_static_vessels_in_area(min_lat, max_lat, min_lon, max_lon)
+    return records, {'source': 'database', 'updated_at': None, 'age_seconds': None}
@@ -0,0 +1,110 @@
+"""
+Local stand-in for the AISStream websocket, for development and tests
+Usage:
+    python manage.py aisstream_standin --port 8765 --vessels 500 --rate 2000
+    python manage.py aisstream_standin --replay recorded_messages.jsonl
+Then: python manage.py ingest_aisstream --url ws://localhost:8765 --api-key test
+"""
+
+import asyncio
+import json
+import random
+from datetime import datetime, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.vessels.aisstream import _import_websockets
+
+
+class Command(BaseCommand):
+    help = 'Serve synthetic or recorded AISStream messages over a local websocket'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--replay', help='JSON lines file of recorded AISStream messages')
+        parser.add_argument('--vessels', type=int, default=100, help='Synthetic vessels to simulate')
+        parser.add_argument('--mmsi-start', type=int, default=200000000, help='First synthetic MMSI')
+        parser.add_argument('--rate', type=float, default=100.0, help='Messages per second per connection')
+        parser.add_argument('--seed', type=int, default=1)
+    
+    def handle(self, *args, **options):
+        self.options = options
+        self.recorded = None
+        if options['replay']:
+            try:
+                with open(options['replay']) as handle:
+                    self.recorded = [line.strip() for line in handle if line.strip()]
+            except OSError as e:
+                raise CommandError(f"Cannot read {options['replay']}: {str(e)}")
+        try:
+            asyncio.run(self.serve())
+        except KeyboardInterrupt:
+            pass
+    
+    async def serve(self):
+        websockets = _import_websockets()
+        async with websockets.serve(self.stream, self.options['host'], self.options['port']):
+            self.stdout.write(f"AISStream stand-in listening on ws://{self.options['host']}:{self.options['port']}")
+            await asyncio.Future()
+    
+    async def stream(self, websocket, *args):
+        # Same handshake as the real service: a subscription within 3 seconds
+        try:
+            subscription = json.loads(await asyncio.wait_for(websocket.recv(), timeout=3))
+        except (asyncio.TimeoutError, ValueError):
+            await websocket.close()
+            return
+        if not subscription.get('APIKey'):
+            await websocket.send(json.dumps({'error': 'Api Key Is Not Valid'}))
+            await websocket.close()
+            return
+        
+        boxes = subscription.get('BoundingBoxes') or [[[-90, -180], [90, 180]]]
+        messages = self.replay() if self.recorded else self.synthetic(boxes)
+        # Send in ~10ms bursts so high rates are not capped by sleep granularity
+        burst = max(1, int(self.options['rate'] / 100))
+        interval = burst / self.options['rate']
+        websockets = _import_websockets()
+        try:
+            for count, message in enumerate(messages, 1):
+                await websocket.send(message)
+                if count % burst == 0:
+                    await asyncio.sleep(interval)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+    
+    def replay(self):
+        while True:
+            yield from self.recorded
+    
+    def synthetic(self, boxes):
+        rng = random.Random(self.options['seed'])
+        fleet = []
+        for i in range(self.options['vessels']):
+            (lat1, lon1), (lat2, lon2) = boxes[i % len(boxes)]
+            fleet.append({
+                'mmsi': self.options['mmsi_start'] + i,
+                'lat': rng.uniform(min(lat1, lat2), max(lat1, lat2)),
+                'lon': rng.uniform(min(lon1, lon2), max(lon1, lon2)),
+                'sog': round(rng.uniform(0, 20), 1),
+                'cog': round(rng.uniform(0, 359), 1),
+            })
+        while True:
+            vessel = rng.choice(fleet)
+            vessel['lat'] = max(-89.9, min(89.9, vessel['lat'] + rng.uniform(-0.01, 0.01)))
+            vessel['lon'] = max(-179.9, min(179.9, vessel['lon'] + rng.uniform(-0.01, 0.01)))
+            now = datetime.now(dt_timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f +0000 UTC')
+            yield json.dumps({
+                'MessageType': 'PositionReport',
+                'MetaData': {'MMSI': vessel['mmsi'], 'latitude': vessel['lat'], 'longitude': vessel['lon'], 'time_utc': now},
+                'Message': {'PositionReport': {
+                    'UserID': vessel['mmsi'],
+                    'Latitude': vessel['lat'],
+                    'Longitude': vessel['lon'],
+                    'Sog': vessel['sog'],
+                    'Cog': vessel['cog'],
+                    'TrueHeading': int(vessel['cog']),
+                    'NavigationalStatus': 0,
+                }},
+            })
@@ -0,0 +1,73 @@
+"""
+Benchmark the fetch -> parse -> write ingestion path
+Usage:
+    AIS_PROVIDER_STANDIN_URL=http://127.0.0.1:8780 python manage.py benchmark_ingest --rounds 5
+    python manage.py benchmark_ingest --limit 1000 --by-mmsi --no-write
+Point it at provider_standin for reproducible numbers without the network
+"""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from apps.vessels.area_planner import poll_by_area
+from apps.vessels.models import Vessel
+from apps.vessels.polling import AsyncAISPoller
+from apps.vessels.services import VesselService
+
+
+class Command(BaseCommand):
+    help = 'Measure fetch/parse and database write throughput of vessel polling'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=3)
+        parser.add_argument('--limit', type=int, help='Poll at most this many tracked vessels')
+        parser.add_argument('--by-mmsi', action='store_true', help='Look every vessel up by MMSI instead of by area')
+        parser.add_argument('--no-write', action='store_true', help='Fetch and parse only')
+    
+    def handle(self, *args, **options):
+        standin = getattr(settings, 'AIS_PROVIDER_STANDIN_URL', '')
+        if not standin:
+            self.stdout.write(self.style.WARNING("AIS_PROVIDER_STANDIN_URL is not set: benchmarking the live providers"))
+        
+        vessels = Vessel.objects.filter(is_tracked=True, is_deleted=False).order_by('mmsi')
+        if options['limit']:
+            vessels = vessels[:options['limit']]
+        vessels = {vessel.mmsi: vessel for vessel in vessels}
+        batch_size = getattr(settings, 'AIS_WRITE_BATCH_SIZE', 500)
+        poller = AsyncAISPoller(use_mock_fallback=False)
+        
+        totals = {'fetch': 0.0, 'write': 0.0, 'positions': 0}
+        for round_number in range(1, options['rounds'] + 1):
+            started = time.monotonic()
+            if options['by_mmsi']:
+                positions = poller.poll(list(vessels))
+            else:
+                positions = poll_by_area(vessels.values(), poller=poller)
+            fetched = time.monotonic()
+            
+            updates = [(vessels[mmsi], data) for mmsi, data in positions.items() if mmsi in vessels]
+            if not options['no_write']:
+                for i in range(0, len(updates), batch_size):
+                    VesselService.apply_position_batch(updates[i:i + batch_size])
+            written = time.monotonic()
+            
+            totals['fetch'] += fetched - started
+            totals['write'] += written - fetched
+            totals['positions'] += len(updates)
+            self.stdout.write(
+                f"Round {round_number}: {len(updates)}/{len(vessels)} positions, "
+                f"fetch+parse {fetched - started:.2f}s ({self.rate(len(updates), fetched - started)}/s), "
+                f"write {written - fetched:.2f}s ({self.rate(len(updates), written - fetched)}/s)"
+            )
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Total: {totals['positions']} positions, "
+            f"fetch+parse {self.rate(totals['positions'], totals['fetch'])}/s, "
+            f"write {self.rate(totals['positions'], totals['write'])}/s, "
+            f"end to end {self.rate(totals['positions'], totals['fetch'] + totals['write'])}/s"
+        ))
+    
+    def rate(self, count, seconds):
+        return f"{count / seconds:.0f}" if seconds > 0 else '-'
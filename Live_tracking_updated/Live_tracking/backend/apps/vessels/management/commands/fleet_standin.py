@@ -0,0 +1,155 @@
+"""
+Serve the deterministic fleet simulator as AISHub- and MarineSia-compatible HTTP APIs
+Usage:
+    python manage.py fleet_standin --fleet-size 50000 --create-vessels
+    python manage.py fleet_standin --port 8790 --time-scale 10 --latency-ms 80
+Then run web and workers with AIS_PROVIDER_STANDIN_URL=http://127.0.0.1:8790
+(and the same AIS_SIMULATOR_* settings to get identical fleets in-process)
+"""
+
+import json
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qsl, urlsplit
+
+from django.core.management.base import BaseCommand
+
+from apps.vessels.recording import StandinServer
+from apps.vessels.simulator import FleetSimulator, create_fleet_vessels
+
+NAVSTAT_CODES = {'underway': '0', 'at_anchor': '1', 'moored': '5'}
+TYPE_CODES = {'cargo': '70', 'tanker': '80', 'passenger': '60', 'tug': '52', 'other': '90'}
+
+
+def aishub_record(position):
+    return {
+        'MMSI': position['mmsi'],
+        'TIME': position['timestamp'].strftime('%Y-%m-%d %H:%M:%S GMT'),
+        'LATITUDE': position['latitude'],
+        'LONGITUDE': position['longitude'],
+        'SOG': position['speed_over_ground'],
+        'COG': position['course_over_ground'],
+        'HEADING': position['heading'],
+        'NAVSTAT': NAVSTAT_CODES.get(position['navigational_status'], '15'),
+        'NAME': position['vessel_name'],
+        'TYPE': TYPE_CODES.get(position['vessel_type'], '90'),
+        'DESTINATION': position['destination'],
+        'ETA': position['eta'],
+    }
+
+
+class Command(BaseCommand):
+    help = 'Serve simulated vessel positions over HTTP in the AISHub and MarineSia formats'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8790)
+        parser.add_argument('--fleet-size', type=int, help='Vessels in the fleet (default AIS_SIMULATOR_FLEET_SIZE)')
+        parser.add_argument('--seed', type=int, help='Fleet seed (default AIS_SIMULATOR_SEED)')
+        parser.add_argument('--mmsi-start', type=int, help='First fleet MMSI (default AIS_SIMULATOR_MMSI_START)')
+        parser.add_argument('--time-scale', type=float, help='Simulated seconds per real second')
+        parser.add_argument('--latency-ms', type=float, default=0.0, help='Delay added to every response')
+        parser.add_argument('--create-vessels', action='store_true', help='Create tracked Vessel rows for the fleet first')
+        parser.add_argument('--stats-interval', type=float, default=30.0, help='Seconds between request counts')
+    
+    def handle(self, *args, **options):
+        simulator = FleetSimulator(
+            size=options['fleet_size'],
+            seed=options['seed'],
+            mmsi_start=options['mmsi_start'],
+            time_scale=options['time_scale'],
+        )
+        if options['create_vessels']:
+            created = create_fleet_vessels(simulator)
+            self.stdout.write(f"Created {created} vessels (existing MMSIs kept)")
+        
+        server = StandinServer((options['host'], options['port']), self.handler_class(simulator, options))
+        server.counts = Counter()
+        self.stdout.write(
+            f"Simulating {simulator.size} vessels from MMSI {simulator.mmsi_start} (seed {simulator.seed}, "
+            f"time x{simulator.time_scale}) on http://{options['host']}:{options['port']}"
+        )
+        threading.Thread(target=self.report, args=(server, options['stats_interval']), daemon=True).start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served: {dict(server.counts)}")
+    
+    def report(self, server, interval):
+        while True:
+            time.sleep(interval)
+            self.stdout.write(f"Served: {dict(server.counts)}")
+    
+    def handler_class(self, simulator, options):
+        class FleetHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+            
+            def do_GET(self):
+                if options['latency_ms']:
+                    time.sleep(options['latency_ms'] / 1000)
+                url = urlsplit(self.path)
+                provider, _, path = url.path.lstrip('/').partition('/')
+                query = dict(parse_qsl(url.query))
+                parts = path.strip('/').split('/')
+                
+                if provider == 'aishub':
+                    self.aishub(query)
+                elif provider == 'marinesia' and len(parts) >= 3 and parts[0] == 'vessel':
+                    self.marinesia(parts[1], '/'.join(parts[2:]))
+                else:
+                    self.respond(404, {'error': 'Not simulated'}, 'missing')
+            
+            def aishub(self, query):
+                if 'mmsi' in query:
+                    position = simulator.position(query['mmsi'])
+                    records = [aishub_record(position)] if position else []
+                else:
+                    try:
+                        bbox = [float(query[name]) for name in ('latmin', 'latmax', 'lonmin', 'lonmax')]
+                    except (KeyError, ValueError):
+                        self.respond(400, {'ERROR': 'True', 'ERROR_MESSAGE': 'Missing parameters'}, 'errors')
+                        return
+                    records = [aishub_record(position) for position in simulator.in_area(*bbox)]
+                self.respond(200, {'ERROR': 'False', 'data': records}, 'aishub')
+            
+            def marinesia(self, mmsi, resource):
+                position = simulator.position(mmsi)
+                if position is None:
+                    self.respond(404, {'error': 'Vessel not found'}, 'missing')
+                elif resource == 'location/latest':
+                    self.respond(200, {
+                        'mmsi': position['mmsi'],
+                        'latitude': position['latitude'],
+                        'longitude': position['longitude'],
+                        'speed': position['speed_over_ground'],
+                        'course': position['course_over_ground'],
+                        'heading': position['heading'],
+                        'status': position['navigational_status'],
+                        'destination': position['destination'],
+                        'eta': position['eta'],
+                        'timestamp': position['timestamp'].isoformat(),
+                    }, 'marinesia')
+                elif resource == 'profile':
+                    self.respond(200, {'mmsi': position['mmsi'], 'name': position['vessel_name'], 'type': position['vessel_type']}, 'marinesia')
+                else:
+                    self.respond(404, {'error': 'Not simulated'}, 'missing')
+            
+            def respond(self, status, data, counter):
+                self.server.counts[counter] += 1
+                payload = json.dumps(data).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return FleetHandler
@@ -0,0 +1,99 @@
+"""
+Import AIS history archives into vessel positions
+Usage:
+    python manage.py import_positions AIS_2023_01_01.zip AIS_2023_01_02.zip --workers 4
+    python manage.py import_positions /data/ais/*.csv.gz --checkpoint /data/ais/import.json
+    python manage.py import_positions ais.parquet --known-only
+MarineCadastre columns (MMSI, BaseDateTime, LAT, LON, SOG, COG, Heading, VesselName, ...)
+or the model's own field names. Rerun with the same --checkpoint to resume.
+"""
+
+import os
+import time
+from collections import deque
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.vessels.archive_import import (
+    ArchiveWriter, ImportCheckpoint, csv_blocks, is_parquet, parquet_groups, parse_csv_block, parse_parquet_group,
+)
+from apps.vessels.bulk_load import PositionBulkLoader, ordered_map
+
+
+class Command(BaseCommand):
+    help = 'Bulk-import AIS position history from CSV (.csv, .gz, .zip) or Parquet archives'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+')
+        parser.add_argument('--checkpoint', default='import_positions.json', help='Resume state file ("" to disable)')
+        parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1), help='Parser processes (0 = inline)')
+        parser.add_argument('--block-mb', type=float, default=16.0, help='CSV bytes per parsed block')
+        parser.add_argument('--known-only', action='store_true', help='Skip MMSIs that are not vessels yet')
+        parser.add_argument('--track', action='store_true', help='Mark created vessels as tracked')
+        parser.add_argument('--keep-indexes', action='store_true', help='Maintain secondary indexes during the load')
+        parser.add_argument('--stats-interval', type=float, default=10.0, help='Seconds between progress lines')
+    
+    def handle(self, *args, **options):
+        for path in options['files']:
+            if not os.path.exists(path):
+                raise CommandError(f"No such file: {path}")
+        
+        checkpoint = ImportCheckpoint(options['checkpoint'])
+        loader = PositionBulkLoader(defer_indexes=not options['keep_indexes'])
+        self.writer = ArchiveWriter(loader, track=options['track'], create_vessels=not options['known_only'])
+        self.started = self.reported_at = time.monotonic()
+        self.stats_interval = options['stats_interval']
+        
+        with loader:
+            for path in options['files']:
+                offset, done = checkpoint.get(path)
+                if done:
+                    self.stdout.write(f"{path}: already imported")
+                    continue
+                self.stdout.write(f"{path}: importing" + (f" from offset {offset}" if offset else ''))
+                try:
+                    self.import_file(path, offset, checkpoint, options)
+                except (OSError, ValueError, ImportError) as e:
+                    raise CommandError(f"{path}: {str(e)}")
+            if loader.deferred:
+                tables = {table for *_, table in loader.deferred}
+                self.stdout.write(f"Rebuilding {len(loader.deferred)} deferred indexes on {len(tables)} tables")
+        self.report(final=True)
+    
+    def import_file(self, path, offset, checkpoint, options):
+        # Offsets of the blocks handed to the parsers, in order; one is popped per written block
+        ends = deque()
+        
+        def tasks():
+            if is_parquet(path):
+                for task in parquet_groups(path, offset):
+                    ends.append(task[1] + 1)
+                    yield task
+            else:
+                for header, _, end, data in csv_blocks(path, offset, int(options['block_mb'] * 1024 * 1024)):
+                    ends.append(end)
+                    yield header, data
+        
+        parse = parse_parquet_group if is_parquet(path) else parse_csv_block
+        end = offset
+        for block in ordered_map(parse, tasks(), options['workers']):
+            self.writer.write(block)
+            end = ends.popleft()
+            checkpoint.set(path, end)
+            if time.monotonic() - self.reported_at >= self.stats_interval:
+                self.report()
+        checkpoint.set(path, end, done=True)
+    
+    def report(self, final=False):
+        now = time.monotonic()
+        self.reported_at = now
+        elapsed = max(now - self.started, 1e-9)
+        stats = self.writer.stats
+        line = (
+            f"{stats['rows']} rows in {elapsed:.1f}s ({stats['rows'] / elapsed:.0f} rows/s), "
+            f"{stats['inserted']} positions inserted, {stats['rejected']} rejected, {stats['unknown']} unknown, "
+            f"{stats['vessels_created']} vessels created, {stats['static_updates']} static updates"
+        )
+        if final:
+            line += f", index rebuild {self.writer.loader.stats['index_rebuild_seconds']:.1f}s"
+        self.stdout.write(self.style.SUCCESS(line) if final else line)
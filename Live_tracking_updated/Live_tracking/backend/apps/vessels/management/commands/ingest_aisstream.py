@@ -0,0 +1,112 @@
+"""
+Django management command to stream AIS positions from AISStream.io
+Usage:
+    python manage.py ingest_aisstream                      # boxes around tracked vessels
+    python manage.py ingest_aisstream --bbox 50,52,0,3     # min_lat,max_lat,min_lon,max_lon
+    python manage.py ingest_aisstream --url ws://localhost:8765 --api-key test
+"""
+
+import asyncio
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.vessels.aisstream import AISStreamIngester, MAX_MMSI_FILTERS
+from apps.vessels.area_planner import AreaPollPlanner
+from apps.vessels.ingest import PositionBatchWriter
+from apps.vessels.models import Vessel
+
+
+class Command(BaseCommand):
+    help = 'Long-running AISStream websocket consumer writing positions in micro-batches'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--bbox', action='append', default=[],
+                            help='min_lat,max_lat,min_lon,max_lon (repeatable); default: boxes around tracked vessels')
+        parser.add_argument('--global', dest='global_box', action='store_true', help='Subscribe to the whole globe')
+        parser.add_argument('--url', help='Websocket URL (default settings.AISSTREAM_URL)')
+        parser.add_argument('--api-key', help='AISStream API key (default settings.AISSTREAM_API_KEY)')
+        parser.add_argument('--batch-size', type=int, help='Messages per database batch')
+        parser.add_argument('--flush-interval', type=float, help='Seconds between flushes of a partial batch')
+        parser.add_argument('--stats-interval', type=float, default=30.0, help='Seconds between progress lines')
+        parser.add_argument('--dry-run', action='store_true', help='Normalise messages but write nothing')
+    
+    def handle(self, *args, **options):
+        api_key = options['api_key'] if options['api_key'] is not None else getattr(settings, 'AISSTREAM_API_KEY', '')
+        if not api_key:
+            raise CommandError('AISSTREAM_API_KEY is not set (or pass --api-key)')
+        
+        boxes, mmsis = self.subscription_scope(options)
+        self.stdout.write(f'Subscribing to {len(boxes)} bounding boxes' + (f' and {len(mmsis)} MMSIs' if mmsis else ''))
+        
+        writer = PositionBatchWriter(
+            batch_size=options['batch_size'],
+            flush_interval=options['flush_interval'],
+            dry_run=options['dry_run'],
+        )
+        self.ingester = AISStreamIngester(boxes, mmsis=mmsis, url=options['url'], api_key=api_key, writer=writer)
+        self.stats_interval = options['stats_interval']
+        self.started = time.monotonic()
+        
+        try:
+            asyncio.run(self.run())
+        except KeyboardInterrupt:
+            pass
+        self.report(final=True)
+    
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(signum, self.ingester.stop)
+            except (NotImplementedError, RuntimeError):
+                pass
+        
+        reporter = asyncio.create_task(self.report_periodically())
+        try:
+            await self.ingester.run()
+        finally:
+            reporter.cancel()
+    
+    async def report_periodically(self):
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            self.report()
+    
+    def report(self, final=False):
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        stats, writer = self.ingester.stats, self.ingester.writer.stats
+        line = (
+            f"{stats['received']} messages in {elapsed:.0f}s ({stats['received'] / elapsed:.0f}/s), "
+            f"{writer['positions']} positions written, {writer['static_updates']} static updates, "
+            f"{writer['unknown']} from unknown MMSIs, {stats['dropped']} dropped, "
+            f"{stats['reconnects']} reconnects"
+        )
+        self.stdout.write(self.style.SUCCESS(line) if final else line)
+    
+    def subscription_scope(self, options):
+        """Bounding boxes (min_lat, max_lat, min_lon, max_lon) and MMSI filters to subscribe to"""
+        if options['global_box']:
+            return [(-90.0, 90.0, -180.0, 180.0)], []
+        
+        if options['bbox']:
+            boxes = []
+            for value in options['bbox']:
+                try:
+                    min_lat, max_lat, min_lon, max_lon = (float(part) for part in value.split(','))
+                except ValueError:
+                    raise CommandError(f"Invalid --bbox '{value}', expected min_lat,max_lat,min_lon,max_lon")
+                boxes.append((min_lat, max_lat, min_lon, max_lon))
+            return boxes, []
+        
+        # Boxes around every tracked vessel with a known position
+        tracked = list(Vessel.objects.filter(is_tracked=True, is_deleted=False).only('mmsi', 'latitude', 'longitude'))
+        plan = AreaPollPlanner(min_vessels=1).plan(tracked)
+        boxes = [box[:4] for box in plan.boxes]
+        if not boxes:
+            return [(-90.0, 90.0, -180.0, 180.0)], []
+        # A small fleet can be narrowed to its own MMSIs
+        mmsis = [str(v.mmsi) for v in tracked] if len(tracked) <= MAX_MMSI_FILTERS else []
+        return boxes, mmsis
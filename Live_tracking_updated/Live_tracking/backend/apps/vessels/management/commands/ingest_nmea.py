@@ -0,0 +1,150 @@
+"""
+Django management command to ingest raw AIS NMEA sentences
+Usage:
+    python manage.py ingest_nmea --file /var/log/ais/nmea.log
+    python manage.py ingest_nmea --tcp 192.168.1.20:10110
+    python manage.py ingest_nmea --udp 0.0.0.0:10110
+"""
+
+import socket
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.vessels.ingest import PositionBatchWriter
+from apps.vessels.nmea import NmeaDecoder
+
+
+class Command(BaseCommand):
+    help = 'Ingest raw AIS NMEA sentences (!AIVDM/!AIVDO) from a log file, TCP feed or UDP port'
+    
+    def add_arguments(self, parser):
+        source = parser.add_mutually_exclusive_group(required=True)
+        source.add_argument('--file', help='Log file with one sentence per line ("-" for stdin)')
+        source.add_argument('--tcp', help='host:port of a receiver serving NMEA over TCP')
+        source.add_argument('--udp', help='[host:]port to listen on for NMEA datagrams')
+        parser.add_argument('--batch-size', type=int, help='Position reports per database batch')
+        parser.add_argument('--flush-interval', type=float, help='Seconds between flushes of a partial batch')
+        parser.add_argument('--stats-interval', type=float, default=10.0, help='Seconds between progress lines')
+        parser.add_argument('--dry-run', action='store_true', help='Decode only, write nothing')
+        parser.add_argument('--no-checksum', action='store_true', help='Skip NMEA checksum verification')
+    
+    def handle(self, *args, **options):
+        self.decoder = NmeaDecoder(verify_checksum=not options['no_checksum'])
+        self.writer = PositionBatchWriter(
+            batch_size=options['batch_size'],
+            flush_interval=options['flush_interval'],
+            dry_run=options['dry_run'],
+        )
+        self.stats_interval = options['stats_interval']
+        
+        if options['file']:
+            lines = self.file_lines(options['file'])
+        elif options['tcp']:
+            lines = self.tcp_lines(*self.parse_address(options['tcp']))
+        else:
+            lines = self.udp_lines(*self.parse_address(options['udp'], default_host='0.0.0.0'))
+        
+        self.started = time.monotonic()
+        self.reported_at = self.started
+        try:
+            self.consume(lines)
+        except KeyboardInterrupt:
+            self.stdout.write('Interrupted, flushing buffered messages...')
+        finally:
+            self.writer.flush()
+            self.report(final=True)
+    
+    def consume(self, lines):
+        decode = self.decoder.decode_line
+        add = self.writer.add
+        for count, line in enumerate(lines):
+            if line is not None:
+                message = decode(line)
+                if message is not None:
+                    add(message)
+            if line is None or count % 4096 == 0:
+                self.writer.maybe_flush()
+                if time.monotonic() - self.reported_at >= self.stats_interval:
+                    self.report()
+    
+    def report(self, final=False):
+        now = time.monotonic()
+        self.reported_at = now
+        elapsed = max(now - self.started, 1e-9)
+        decoder, writer = self.decoder.stats, self.writer.stats
+        line = (
+            f"{decoder['sentences']} sentences in {elapsed:.1f}s "
+            f"({decoder['sentences'] / elapsed:.0f}/s), "
+            f"{writer['positions']} positions written, {writer['static_updates']} static updates, "
+            f"{writer['unknown']} from unknown MMSIs, "
+            f"{decoder['bad_checksum']} bad checksums, {decoder['invalid']} invalid"
+        )
+        self.stdout.write(self.style.SUCCESS(line) if final else line)
+    
+    def parse_address(self, value, default_host='127.0.0.1'):
+        host, _, port = value.rpartition(':')
+        try:
+            return host or default_host, int(port)
+        except ValueError:
+            raise CommandError(f"Invalid address '{value}', expected host:port")
+    
+    def file_lines(self, path):
+        if path == '-':
+            yield from sys.stdin
+            return
+        try:
+            with open(path, 'r', encoding='ascii', errors='replace') as handle:
+                yield from handle
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {str(e)}")
+    
+    def tcp_lines(self, host, port):
+        """Lines from a TCP feed, reconnecting with backoff; None while idle"""
+        delay = 1
+        while True:
+            try:
+                with socket.create_connection((host, port), timeout=10) as sock:
+                    self.stdout.write(f'Connected to {host}:{port}')
+                    delay = 1
+                    sock.settimeout(self.writer.flush_interval)
+                    yield from self.stream_lines(sock)
+                self.stderr.write(f'Connection to {host}:{port} closed by peer')
+            except OSError as e:
+                self.stderr.write(f'Connection to {host}:{port} failed: {str(e)}')
+            self.writer.flush()
+            time.sleep(delay)
+            delay = min(delay * 2, 30)
+    
+    def stream_lines(self, sock):
+        buffer = b''
+        while True:
+            try:
+                chunk = sock.recv(65536)
+            except socket.timeout:
+                yield None
+                continue
+            if not chunk:
+                return
+            buffer += chunk
+            *complete, buffer = buffer.split(b'\n')
+            for raw in complete:
+                yield raw.decode('ascii', 'replace')
+    
+    def udp_lines(self, host, port):
+        """Lines from NMEA datagrams (one or more sentences each); None while idle"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4 * 1024 * 1024)
+        sock.bind((host, port))
+        sock.settimeout(self.writer.flush_interval)
+        self.stdout.write(f'Listening for NMEA on udp://{host}:{port}')
+        with sock:
+            while True:
+                try:
+                    datagram, _ = sock.recvfrom(65535)
+                except socket.timeout:
+                    yield None
+                    continue
+                for raw in datagram.splitlines():
+                    yield raw.decode('ascii', 'replace')
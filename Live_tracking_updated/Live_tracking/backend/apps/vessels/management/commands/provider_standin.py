@@ -0,0 +1,124 @@
+"""
+Local HTTP stand-in that replays recorded provider responses
+Usage:
+    python manage.py provider_standin recorded.jsonl --port 8780
+    python manage.py provider_standin recorded.jsonl --latency-ms 150 --jitter-ms 50 --error-rate 0.02 --payload-scale 10
+Then run workers with AIS_PROVIDER_STANDIN_URL=http://127.0.0.1:8780
+Recordings come from AIS_RECORD_PATH or manage.py record_providers
+"""
+
+import json
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler
+from urllib.parse import parse_qsl, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.vessels.recording import ReplayIndex, StandinServer, scale_payload
+
+
+class Command(BaseCommand):
+    help = 'Serve recorded provider responses with configurable latency, errors and payload size'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('recordings', nargs='+', help='JSON lines files written by the provider recorder')
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=8780)
+        parser.add_argument('--latency-ms', type=float, help='Fixed response latency (default: as recorded)')
+        parser.add_argument('--latency-scale', type=float, default=1.0, help='Multiplier for recorded latencies')
+        parser.add_argument('--jitter-ms', type=float, default=0.0, help='Uniform random latency added to every response')
+        parser.add_argument('--error-rate', type=float, default=0.0, help='Share of requests answered with 503')
+        parser.add_argument('--throttle-rate', type=float, default=0.0, help='Share of requests answered with 429')
+        parser.add_argument('--payload-scale', type=float, default=1.0, help='Grow the largest list in each payload by this factor')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--stats-interval', type=float, default=30.0, help='Seconds between request counts')
+    
+    def handle(self, *args, **options):
+        try:
+            index = ReplayIndex.from_files(options['recordings'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot load recordings: {str(e)}")
+        if not index.size:
+            raise CommandError("No recorded responses found")
+        
+        server = StandinServer((options['host'], options['port']), self.handler_class(index, options))
+        server.counts = Counter()
+        self.stdout.write(
+            f"Replaying {index.size} recorded responses on http://{options['host']}:{options['port']} "
+            f"(set AIS_PROVIDER_STANDIN_URL to this address)"
+        )
+        threading.Thread(target=self.report, args=(server, options['stats_interval']), daemon=True).start()
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(f"Served: {dict(server.counts)}")
+    
+    def report(self, server, interval):
+        while True:
+            time.sleep(interval)
+            self.stdout.write(f"Served: {dict(server.counts)}")
+    
+    def handler_class(self, index, options):
+        rng = random.Random(options['seed'])
+        rng_lock = threading.Lock()
+        
+        def draw():
+            with rng_lock:
+                return rng.random()
+        
+        class ReplayHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, like the real providers
+            # Headers and body go out as separate writes; Nagle would hold the body back
+            disable_nagle_algorithm = True
+            
+            def do_GET(self):
+                self.replay('GET')
+            
+            def do_POST(self):
+                self.replay('POST')
+            
+            def replay(self, method):
+                url = urlsplit(self.path)
+                provider, _, path = url.path.lstrip('/').partition('/')
+                record = index.lookup(provider, method, '/' + path, dict(parse_qsl(url.query)))
+                
+                if options['latency_ms'] is not None:
+                    latency = options['latency_ms']
+                else:
+                    latency = (record or {}).get('latency_ms', 0) * options['latency_scale']
+                latency += draw() * options['jitter_ms']
+                if latency > 0:
+                    time.sleep(latency / 1000)
+                
+                roll = draw()
+                if record is None:
+                    self.respond(404, 'application/json', json.dumps({'error': 'Not recorded'}), 'missing')
+                elif roll < options['error_rate']:
+                    self.respond(503, 'application/json', json.dumps({'error': 'Injected failure'}), 'errors')
+                elif roll < options['error_rate'] + options['throttle_rate']:
+                    self.respond(429, 'application/json', json.dumps({'error': 'Injected throttling'}), 'throttled', retry_after=1)
+                else:
+                    body = scale_payload(record['body'], options['payload_scale'])
+                    self.respond(record['status'], record.get('content_type') or 'application/json', body, provider)
+            
+            def respond(self, status, content_type, body, counter, retry_after=None):
+                self.server.counts[counter] += 1
+                payload = body.encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(payload)))
+                if retry_after:
+                    self.send_header('Retry-After', str(retry_after))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def log_message(self, format, *args):
+                pass
+        
+        return ReplayHandler
@@ -0,0 +1,48 @@
+"""
+Record one polling run's provider responses for later replay
+Usage:
+    python manage.py record_providers --output recorded.jsonl
+    python manage.py record_providers --output recorded.jsonl --limit 500 --by-mmsi
+Positions are fetched but not stored; replay with manage.py provider_standin
+"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from apps.vessels.area_planner import poll_by_area
+from apps.vessels.models import Vessel
+from apps.vessels.polling import AsyncAISPoller
+from apps.vessels.recording import start_recording, stop_recording
+
+
+class Command(BaseCommand):
+    help = 'Poll tracked vessels once and record every provider response to a JSON lines file'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--output', required=True, help='JSON lines file to append to')
+        parser.add_argument('--limit', type=int, help='Record at most this many tracked vessels')
+        parser.add_argument('--by-mmsi', action='store_true', help='Look every vessel up by MMSI instead of by area')
+    
+    def handle(self, *args, **options):
+        vessels = Vessel.objects.filter(is_tracked=True, is_deleted=False).order_by('mmsi')
+        if options['limit']:
+            vessels = vessels[:options['limit']]
+        vessels = list(vessels)
+        
+        # Mock positions are generated locally and have nothing to record
+        poller = AsyncAISPoller(use_mock_fallback=False)
+        recorder = start_recording(options['output'])
+        started = time.monotonic()
+        try:
+            if options['by_mmsi']:
+                positions = poller.poll([vessel.mmsi for vessel in vessels])
+            else:
+                positions = poll_by_area(vessels, poller=poller)
+        finally:
+            stop_recording()
+        
+        self.stdout.write(
+            f"Recorded {recorder.count} responses for {len(vessels)} vessels "
+            f"({len(positions)} positions) in {time.monotonic() - started:.1f}s to {options['output']}"
+        )
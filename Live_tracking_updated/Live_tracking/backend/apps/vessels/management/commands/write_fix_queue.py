@@ -0,0 +1,70 @@
+"""
+Django management command to run the ingestion queue writer
+Usage:
+    python manage.py write_fix_queue
+    python manage.py write_fix_queue --batch-size 2000 --max-wait-ms 250
+Requires AIS_QUEUE_BACKEND=redis; run one or more per deployment
+"""
+
+import signal
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from apps.vessels.fix_queue import FixQueueWriter, RedisFixQueue
+
+
+class Command(BaseCommand):
+    help = 'Drain the Redis ingestion queue into the database in batches'
+    
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', help='Consumer name in the group (default host-pid)')
+        parser.add_argument('--batch-size', type=int, help='Rows per database batch')
+        parser.add_argument('--max-wait-ms', type=int, help='Longest wait to fill a batch')
+        parser.add_argument('--stats-interval', type=float, default=30.0, help='Seconds between progress lines')
+    
+    def handle(self, *args, **options):
+        if getattr(settings, 'AIS_QUEUE_BACKEND', '') != 'redis':
+            raise CommandError("write_fix_queue needs AIS_QUEUE_BACKEND=redis (the local backend writes in-process)")
+        
+        self.queue = RedisFixQueue()
+        self.writer = FixQueueWriter(
+            self.queue,
+            consumer=options['consumer'],
+            batch_size=options['batch_size'],
+            max_wait_ms=options['max_wait_ms'],
+        )
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, lambda *_: self.writer.stop())
+        
+        self.stdout.write(
+            f"Writing from stream {self.queue.stream} as {self.writer.consumer} "
+            f"(batches of {self.writer.batch_size} rows or {self.writer.max_wait_ms}ms)"
+        )
+        self.started = time.monotonic()
+        self.stats_interval = options['stats_interval']
+        self.reported_at = self.started
+        
+        self.writer.run(tick=self.maybe_report)
+        self.report(final=True)
+    
+    def maybe_report(self):
+        if time.monotonic() - self.reported_at >= self.stats_interval:
+            self.report()
+    
+    def report(self, final=False):
+        now = time.monotonic()
+        self.reported_at = now
+        elapsed = max(now - self.started, 1e-9)
+        stats = self.writer.stats
+        try:
+            queue = self.queue.stats()
+            backlog = f"depth {queue['depth']}, pending {queue['pending']}, lag {queue['lag_seconds']}s"
+        except Exception as e:
+            backlog = f"queue stats unavailable: {str(e)}"
+        line = (
+            f"{stats['written']} fixes written in {elapsed:.0f}s ({stats['written'] / elapsed:.0f}/s), "
+            f"{stats['shed']} shed, {stats['unknown']} unknown, {stats['failed_batches']} failed batches; {backlog}"
+        )
+        self.stdout.write(self.style.SUCCESS(line) if final else line)
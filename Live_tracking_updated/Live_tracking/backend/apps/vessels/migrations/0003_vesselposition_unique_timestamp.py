@@ -0,0 +1,41 @@
+# Generated by Django 4.2.8 on 2026-10-17 02:51
+
+from django.db import migrations, models
+
+
+def remove_duplicate_positions(apps, schema_editor):
+    """Keep the first stored row of every (vessel, timestamp) pair"""
+    connection = schema_editor.connection
+    table = connection.ops.quote_name("vessel_positions")
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                f"DELETE FROM {table} a USING {table} b "
+                f"WHERE a.vessel_id = b.vessel_id AND a.timestamp = b.timestamp AND a.id > b.id"
+            )
+        else:
+            cursor.execute(
+                f"DELETE FROM {table} WHERE id NOT IN "
+                f"(SELECT MIN(id) FROM {table} GROUP BY vessel_id, timestamp)"
+            )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("vessels", "0002_vesselassignment"),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_positions, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="vesselposition",
+            constraint=models.UniqueConstraint(
+                fields=("vessel", "timestamp"), name="unique_vessel_position_timestamp"
+            ),
+        ),
+        # Covered by the unique constraint's index
+        migrations.RemoveIndex(
+            model_name="vesselposition",
+            name="vessel_posi_vessel__372247_idx",
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.8 on 2026-10-17 03:30
+
+from django.conf import settings
+from django.db import migrations
+
+
+def partition_positions(apps, schema_editor):
+    """Move vessel_positions onto time-partitioned storage (see apps/vessels/partitions.py)"""
+    if not getattr(settings, "AIS_POSITION_PARTITIONING", False):
+        return
+    from apps.vessels.partitions import partition_positions as convert
+
+    convert(using=schema_editor.connection.alias)
+
+
+def unpartition_positions(apps, schema_editor):
+    """Back to a plain vessel_positions table; a no-op when it was never partitioned"""
+    from apps.vessels.partitions import unpartition_positions as revert
+
+    revert(using=schema_editor.connection.alias)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("vessels", "0003_vesselposition_unique_timestamp"),
+    ]
+
+    operations = [
+        migrations.RunPython(partition_positions, unpartition_positions),
+        migrations.AlterModelOptions(
+            name="vesselposition",
+            options={
+                "ordering": ["-timestamp"],
+                "select_on_save": True,
+                "verbose_name": "Vessel Position",
+                "verbose_name_plural": "Vessel Positions",
+            },
+        ),
+    ]
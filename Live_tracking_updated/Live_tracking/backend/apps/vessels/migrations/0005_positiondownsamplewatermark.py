@@ -0,0 +1,35 @@
+# Generated by Django 4.2.8 on 2026-10-17 03:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("vessels", "0004_partition_vessel_positions"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PositionDownsampleWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("resolution_seconds", models.PositiveIntegerField(unique=True)),
+                ("processed_until", models.DateTimeField()),
+            ],
+            options={
+                "verbose_name": "Position Downsample Watermark",
+                "verbose_name_plural": "Position Downsample Watermarks",
+                "db_table": "position_downsample_watermarks",
+            },
+        ),
+    ]
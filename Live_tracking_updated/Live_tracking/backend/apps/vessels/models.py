@@ -128,16 +128,43 @@ class VesselPosition(TimeStampedModel):
         verbose_name = 'Vessel Position'
         verbose_name_plural = 'Vessel Positions'
         ordering = ['-timestamp']
+        # Updates through the partitioned SQLite view report no affected rows,
+        # so save() checks existence rather than trusting the UPDATE count
+        select_on_save = True
         indexes = [
-            models.Index(fields=['vessel', 'timestamp']),
             models.Index(fields=['timestamp']),
             models.Index(fields=['latitude', 'longitude']),
         ]
+        constraints = [
+            # One fix per vessel and timestamp: retried or replayed batches are
+            # inserted with ignore_conflicts, and the unique index also serves
+            # (vessel, timestamp) lookups
+            models.UniqueConstraint(fields=['vessel', 'timestamp'], name='unique_vessel_position_timestamp'),
+        ]
     
     def __str__(self):
         return f"{self.vessel.vessel_name} at ({self.latitude}, {self.longitude}) - {self.timestamp}"
 
 
+class PositionDownsampleWatermark(TimeStampedModel):
+    """
+    Progress of the tiered downsampling of vessel_positions
+    Positions before processed_until have been thinned to one fix per
+    resolution_seconds (see apps/vessels/downsampling.py)
+    """
+    
+    resolution_seconds = models.PositiveIntegerField(unique=True)
+    processed_until = models.DateTimeField()
+    
+    class Meta:
+        db_table = 'position_downsample_watermarks'
+        verbose_name = 'Position Downsample Watermark'
+        verbose_name_plural = 'Position Downsample Watermarks'
+    
+    def __str__(self):
+        return f"1 fix per {self.resolution_seconds}s until {self.processed_until}"
+
+
 class VesselNote(TimeStampedModel):
     """
     User notes about vessels
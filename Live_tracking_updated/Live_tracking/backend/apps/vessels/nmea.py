@@ -0,0 +1,360 @@
+"""
+Decoder for raw AIS NMEA 0183 sentences (!AIVDM / !AIVDO)
+Handles 6-bit payload armoring, multi-fragment reassembly and message types
+1/2/3 and 18/19 (position reports), 5 and 24 (static and voyage data).
+Position reports come out in the dict shape accepted by
+VesselService.update_vessel_position / apply_position_batch.
+"""
+
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Payload character -> its 6 bits as a '0'/'1' string, for str.translate
+_ARMOR_TABLE = {}
+for _code in list(range(48, 88)) + list(range(96, 120)):
+    _value = _code - 48
+    if _value > 40:
+        _value -= 8
+    _ARMOR_TABLE[_code] = format(_value, '06b')
+
+# 6-bit value -> ASCII character for text fields
+_SIXBIT_ASCII = ''.join(chr(v + 64) if v < 32 else chr(v) for v in range(64))
+
+NAV_STATUS = {
+    0: 'underway',
+    1: 'at_anchor',
+    2: 'not_under_command',
+    3: 'restricted_maneuverability',
+    4: 'restricted_maneuverability',
+    5: 'moored',
+    6: 'aground',
+    7: 'fishing',
+    8: 'under_sail',
+}
+
+# Vessel fields filled from static/voyage messages (types 5, 19 and 24)
+STATIC_FIELDS = ('vessel_name', 'call_sign', 'imo_number', 'vessel_type', 'destination', 'eta',
+                 'draft', 'length_overall', 'beam')
+
+POSITION_TYPES = (1, 2, 3, 18, 19)
+
+
+def map_ship_type(code):
+    """Map an AIS ship type code to Vessel.VESSEL_TYPE_CHOICES"""
+    if code is None:
+        return None
+    if code == 30:
+        return 'fishing'
+    if code in (31, 32, 52):
+        return 'tug'
+    if code == 35:
+        return 'military'
+    if code == 36:
+        return 'sailing'
+    if 60 <= code <= 69:
+        return 'passenger'
+    if 70 <= code <= 79:
+        return 'cargo'
+    if 80 <= code <= 89:
+        return 'tanker'
+    return 'other' if code else None
+
+
+def nmea_checksum(body):
+    """XOR of every character between the leading '!' and the '*'"""
+    checksum = 0
+    for char in body.encode('ascii', 'replace'):
+        checksum ^= char
+    return checksum
+
+
+class _Payload:
+    """De-armored payload with field accessors (bit offsets per ITU-R M.1371)"""
+    
+    __slots__ = ('bits',)
+    
+    def __init__(self, payload, fill_bits=0):
+        bits = payload.translate(_ARMOR_TABLE)
+        if fill_bits:
+            bits = bits[:-fill_bits]
+        self.bits = bits
+    
+    def __len__(self):
+        return len(self.bits)
+    
+    def uint(self, start, width):
+        field = self.bits[start:start + width]
+        return int(field, 2) if len(field) == width else None
+    
+    def sint(self, start, width):
+        value = self.uint(start, width)
+        if value is not None and value >= 1 << (width - 1):
+            value -= 1 << width
+        return value
+    
+    def text(self, start, width):
+        field = self.bits[start:start + width]
+        chars = [_SIXBIT_ASCII[int(field[i:i + 6], 2)] for i in range(0, len(field) - 5, 6)]
+        return ''.join(chars).split('@', 1)[0].strip() or None
+
+
+class NmeaDecoder:
+    """
+    Stateful sentence decoder
+    
+    decode_line() returns a dict per complete AIS message (None for fragments,
+    invalid sentences and unsupported types). Fragments of multi-sentence
+    messages are buffered per (talker, sequence id) and dropped after
+    fragment_timeout seconds. Counters are kept in self.stats.
+    """
+    
+    def __init__(self, fragment_timeout=10.0, verify_checksum=True):
+        self.fragment_timeout = fragment_timeout
+        self.verify_checksum = verify_checksum
+        self.stats = Counter()
+        self._pending = {}
+        self._purged_at = time.monotonic()
+    
+    def decode_line(self, line, received_at=None):
+        self.stats['sentences'] += 1
+        start = line.find('!')
+        if start < 0:
+            self.stats['invalid'] += 1
+            return None
+        
+        # Optional NMEA 4.0 tag block (\s:station,c:unix_time*hh\) carries the receive time
+        if start > 0 and received_at is None:
+            received_at = self._tag_block_time(line[:start])
+        
+        sentence = line[start:].strip()
+        star = sentence.rfind('*')
+        if star < 0:
+            self.stats['invalid'] += 1
+            return None
+        body = sentence[1:star]
+        if self.verify_checksum:
+            try:
+                valid = int(sentence[star + 1:star + 3], 16) == nmea_checksum(body)
+            except ValueError:
+                valid = False
+            if not valid:
+                self.stats['bad_checksum'] += 1
+                return None
+        
+        fields = body.split(',')
+        if len(fields) != 7 or not fields[0].endswith(('VDM', 'VDO')):
+            self.stats['invalid'] += 1
+            return None
+        
+        try:
+            count = int(fields[1])
+            index = int(fields[2])
+            fill_bits = int(fields[6] or 0)
+        except ValueError:
+            self.stats['invalid'] += 1
+            return None
+        
+        if count == 1:
+            return self.decode_payload(fields[5], fill_bits, received_at)
+        return self._add_fragment(fields[0], fields[3], count, index, fields[5], fill_bits, received_at)
+    
+    def _add_fragment(self, talker, seq_id, count, index, payload, fill_bits, received_at):
+        now = time.monotonic()
+        if now - self._purged_at > self.fragment_timeout:
+            self._purge(now)
+        
+        key = (talker, seq_id)
+        entry = self._pending.get(key)
+        if entry is None or entry['count'] != count or index in entry['parts']:
+            # A repeated index means the sequence id was reused: start over
+            if entry is not None:
+                self.stats['fragments_dropped'] += len(entry['parts'])
+            entry = {'count': count, 'parts': {}, 'started': now}
+            self._pending[key] = entry
+        entry['parts'][index] = payload
+        if index == count:
+            entry['fill_bits'] = fill_bits
+        
+        if len(entry['parts']) < count:
+            return None
+        del self._pending[key]
+        joined = ''.join(entry['parts'][i] for i in range(1, count + 1) if i in entry['parts'])
+        return self.decode_payload(joined, entry.get('fill_bits', 0), received_at)
+    
+    def _purge(self, now):
+        self._purged_at = now
+        expired = [key for key, entry in self._pending.items() if now - entry['started'] > self.fragment_timeout]
+        for key in expired:
+            self.stats['fragments_dropped'] += len(self._pending.pop(key)['parts'])
+    
+    def _tag_block_time(self, prefix):
+        for param in prefix.strip('\\').split('*', 1)[0].split(','):
+            if param.startswith('c:'):
+                try:
+                    seconds = int(param[2:])
+                    # Some receivers send milliseconds
+                    if seconds > 10 ** 11:
+                        seconds /= 1000
+                    return datetime.fromtimestamp(seconds, tz=dt_timezone.utc)
+                except (ValueError, OverflowError, OSError):
+                    return None
+        return None
+    
+    def decode_payload(self, payload, fill_bits=0, received_at=None):
+        """Decode one complete (reassembled) payload"""
+        try:
+            bits = _Payload(payload, fill_bits)
+            msg_type = bits.uint(0, 6)
+        except (ValueError, IndexError):
+            self.stats['invalid'] += 1
+            return None
+        
+        decoder = _DECODERS.get(msg_type)
+        if decoder is None:
+            self.stats['unsupported'] += 1
+            return None
+        
+        try:
+            message = decoder(bits)
+        except (ValueError, IndexError, TypeError) as e:
+            logger.debug(f"Could not decode AIS type {msg_type} payload {payload}: {str(e)}")
+            message = None
+        if message is None:
+            self.stats['invalid'] += 1
+            return None
+        
+        message['message_type'] = msg_type
+        message['mmsi'] = str(bits.uint(8, 30)).zfill(9)
+        if msg_type in POSITION_TYPES:
+            if message.get('latitude') is None:
+                self.stats['no_position'] += 1
+                return None
+            message['timestamp'] = received_at or timezone.now()
+            message['data_source'] = 'nmea'
+        self.stats[f"type_{msg_type}"] += 1
+        return message
+
+
+def _position(bits, lon_at, lat_at, sog_at, cog_at, heading_at):
+    """Fields shared by class A and class B position reports"""
+    lon = bits.sint(lon_at, 28)
+    lat = bits.sint(lat_at, 27)
+    sog = bits.uint(sog_at, 10)
+    cog = bits.uint(cog_at, 12)
+    heading = bits.uint(heading_at, 9)
+    if lon is None or lat is None:
+        return None
+    
+    lon = lon / 600000.0
+    lat = lat / 600000.0
+    valid = -90 <= lat <= 90 and -180 <= lon <= 180
+    return {
+        'latitude': round(lat, 7) if valid else None,
+        'longitude': round(lon, 7) if valid else None,
+        'speed_over_ground': sog / 10.0 if sog is not None and sog != 1023 else None,
+        'course_over_ground': cog / 10.0 if cog is not None and cog < 3600 else None,
+        'heading': heading if heading is not None and heading < 360 else None,
+    }
+
+
+def _dimensions(bits, start):
+    to_bow = bits.uint(start, 9)
+    to_stern = bits.uint(start + 9, 9)
+    to_port = bits.uint(start + 18, 6)
+    to_starboard = bits.uint(start + 24, 6)
+    dims = {}
+    if to_bow is not None and to_stern is not None and to_bow + to_stern:
+        dims['length_overall'] = to_bow + to_stern
+    if to_port is not None and to_starboard is not None and to_port + to_starboard:
+        dims['beam'] = to_port + to_starboard
+    return dims
+
+
+def _decode_class_a_position(bits):
+    message = _position(bits, 61, 89, 50, 116, 128)
+    if message is not None:
+        message['navigational_status'] = NAV_STATUS.get(bits.uint(38, 4), 'underway')
+    return message
+
+
+def _decode_class_b_position(bits):
+    message = _position(bits, 57, 85, 46, 112, 124)
+    if message is not None:
+        message['navigational_status'] = None
+    return message
+
+
+def _decode_class_b_extended(bits):
+    message = _decode_class_b_position(bits)
+    if message is None or len(bits) < 301:
+        return message
+    message['vessel_name'] = bits.text(143, 120)
+    message['vessel_type'] = map_ship_type(bits.uint(263, 8))
+    message.update(_dimensions(bits, 271))
+    return message
+
+
+def _decode_static_voyage(bits):
+    """Type 5: class A static and voyage related data (two sentences)"""
+    if len(bits) < 420:
+        return None
+    imo = bits.uint(40, 30)
+    draught = bits.uint(294, 8)
+    message = {
+        'imo_number': str(imo) if imo and imo < 10 ** 7 else None,
+        'call_sign': bits.text(70, 42),
+        'vessel_name': bits.text(112, 120),
+        'vessel_type': map_ship_type(bits.uint(232, 8)),
+        'eta': _eta(bits.uint(274, 4), bits.uint(278, 5), bits.uint(283, 5), bits.uint(288, 6)),
+        'draft': draught / 10.0 if draught else None,
+        'destination': bits.text(302, 120),
+    }
+    message.update(_dimensions(bits, 240))
+    return message
+
+
+def _decode_static_class_b(bits):
+    """Type 24: part A carries the name, part B type, call sign and dimensions"""
+    part = bits.uint(38, 2)
+    if part == 0:
+        return {'vessel_name': bits.text(40, 120)}
+    if part == 1 and len(bits) >= 162:
+        message = {
+            'vessel_type': map_ship_type(bits.uint(40, 8)),
+            'call_sign': bits.text(90, 42),
+        }
+        message.update(_dimensions(bits, 132))
+        return message
+    return None
+
+
+def _eta(month, day, hour, minute):
+    """AIS ETA has no year: take the next occurrence from now"""
+    if not month or not day or month > 12 or day > 31 or hour is None or hour > 23 or minute is None or minute > 59:
+        return None
+    now = timezone.now()
+    for year in (now.year, now.year + 1):
+        try:
+            eta = datetime(year, month, day, hour, minute, tzinfo=dt_timezone.utc)
+        except ValueError:
+            return None
+        if eta >= now - timedelta(days=1):
+            return eta
+    return None
+
+
+_DECODERS = {
+    1: _decode_class_a_position,
+    2: _decode_class_a_position,
+    3: _decode_class_a_position,
+    5: _decode_static_voyage,
+    18: _decode_class_b_position,
+    19: _decode_class_b_extended,
+    24: _decode_static_class_b,
+}
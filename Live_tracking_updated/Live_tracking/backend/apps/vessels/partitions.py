@@ -0,0 +1,548 @@
+"""
+Time-partitioned storage for vessel_positions
+PostgreSQL: native RANGE partitions on timestamp, one per month (or week),
+plus a DEFAULT partition for fixes outside every range. Queries filtered on
+timestamp are pruned to the matching partitions, and retention drops whole
+partitions instead of deleting rows.
+SQLite: shard tables with the same columns and indexes behind a
+vessel_positions view; INSTEAD OF triggers route inserts by timestamp and
+apply updates/deletes, so the VesselPosition model works unchanged. A time
+filter costs one index probe per shard. SQLite cannot report keys or row
+counts from inside a trigger: objects created through the view come back
+without a primary key (as with bulk_create(ignore_conflicts)) and
+update()/delete() report 0 rows.
+
+Opt-in: migration 0004 converts the table only with AIS_POSITION_PARTITIONING
+set, and reversing it turns vessel_positions back into a plain table.
+
+Partitions are created ahead of time by the ensure_position_partitions task
+and for historical ranges by the bulk loaders; rows that arrive before their
+partition exists wait in the default partition and are moved on creation.
+"""
+
+import logging
+import re
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+TABLE = 'vessel_positions'
+PARTITION_PREFIX = 'vessel_positions_p'
+DEFAULT_PARTITION = 'vessel_positions_default'
+# SQLite has no partition catalog: shard names and ranges are kept here
+SQLITE_CATALOG = 'vessel_positions_partitions'
+
+# SQLite shard ids start at ordinal << 40 so keys stay unique across shards
+SQLITE_ID_SHIFT = 40
+
+# Serializes partition maintenance between workers (PostgreSQL advisory lock key)
+LOCK_KEY = 7240311
+
+Partition = namedtuple('Partition', 'name start end')
+
+_PG_BOUND = re.compile(r"FROM \('([^']+)'\) TO \('([^']+)'\)")
+
+
+def partition_interval():
+    interval = getattr(settings, 'AIS_POSITION_PARTITION_INTERVAL', 'month')
+    if interval not in ('month', 'week'):
+        raise ValueError(f"AIS_POSITION_PARTITION_INTERVAL must be 'month' or 'week', not '{interval}'")
+    return interval
+
+
+def period_start(moment, interval):
+    """Start (UTC midnight) of the month or ISO week containing moment"""
+    moment = moment.astimezone(dt_timezone.utc)
+    day = datetime(moment.year, moment.month, moment.day, tzinfo=dt_timezone.utc)
+    if interval == 'week':
+        return day - timedelta(days=day.weekday())
+    return day.replace(day=1)
+
+
+def period_end(start, interval):
+    if interval == 'week':
+        return start + timedelta(days=7)
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def plan_partitions(start, end, existing, interval):
+    """Ranges to create so that [start, end) is covered, without overlapping existing partitions"""
+    ranges = []
+    cursor = period_start(start, interval)
+    taken = sorted((p.start, p.end) for p in existing)
+    while cursor < end:
+        inside = next(((s, e) for s, e in taken if s <= cursor < e), None)
+        if inside:
+            cursor = inside[1]
+            continue
+        stop = period_end(period_start(cursor, interval), interval)
+        following = [s for s, _ in taken if cursor < s < stop]
+        stop = min(following) if following else stop
+        ranges.append((cursor, stop))
+        cursor = stop
+    return ranges
+
+
+def _name(start):
+    return f"{PARTITION_PREFIX}{start:%Y%m%d}"
+
+
+def _text(moment):
+    """SQLite's stored datetime text for a UTC moment"""
+    return moment.astimezone(dt_timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+
+
+def shard_index_sql(sql, index, shard):
+    """The default shard's CREATE INDEX statement rewritten for another SQLite shard"""
+    sql = sql.replace(f'"{index}"', f'"{shard}__{index}"', 1)
+    return sql.replace(f'"{DEFAULT_PARTITION}"', f'"{shard}"')
+
+
+class PostgresPartitioner:
+    """Native range partitioning of vessel_positions on PostgreSQL"""
+    
+    def __init__(self, connection):
+        self.connection = connection
+        self.quote = connection.ops.quote_name
+    
+    def is_partitioned(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT relkind FROM pg_class WHERE relname = %s AND pg_table_is_visible(oid)", [TABLE]
+            )
+            row = cursor.fetchone()
+        return bool(row) and row[0] == 'p'
+    
+    def partitions(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT child.relname, pg_get_expr(child.relpartbound, child.oid) FROM pg_inherits "
+                "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+                "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+                "WHERE parent.relname = %s AND pg_table_is_visible(parent.oid)",
+                [TABLE],
+            )
+            rows = cursor.fetchall()
+        partitions = []
+        for name, bound in rows:
+            match = _PG_BOUND.search(bound or '')
+            if match:
+                start, end = (datetime.fromisoformat(value) for value in match.groups())
+                partitions.append(Partition(name, start, end))
+        return sorted(partitions, key=lambda p: p.start)
+    
+    def create(self, cursor, start, end):
+        name = _name(start)
+        table, partition, default = self.quote(TABLE), self.quote(name), self.quote(DEFAULT_PARTITION)
+        cursor.execute(f"SELECT 1 FROM {default} WHERE timestamp >= %s AND timestamp < %s LIMIT 1", [start, end])
+        if cursor.fetchone() is None:
+            cursor.execute(f"CREATE TABLE {partition} PARTITION OF {table} FOR VALUES FROM (%s) TO (%s)", [start, end])
+            return name
+        # Fixes that arrived early wait in the default partition; attaching over them would fail
+        cursor.execute(f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)")
+        cursor.execute(
+            f"WITH moved AS (DELETE FROM {default} WHERE timestamp >= %s AND timestamp < %s RETURNING *) "
+            f"INSERT INTO {partition} SELECT * FROM moved",
+            [start, end],
+        )
+        moved = cursor.rowcount
+        cursor.execute(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES FROM (%s) TO (%s)", [start, end])
+        logger.info(f"Moved {moved} positions from {DEFAULT_PARTITION} into {name}")
+        return name
+    
+    def ensure(self, start, end, interval):
+        created = []
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [LOCK_KEY])
+            for range_start, range_end in plan_partitions(start, end, self.partitions(), interval):
+                created.append(self.create(cursor, range_start, range_end))
+        return created
+    
+    def drop_before(self, cutoff):
+        """Drop partitions that end at or before cutoff and expired rows of the default partition"""
+        dropped = []
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [LOCK_KEY])
+            for partition in self.partitions():
+                if partition.end <= cutoff:
+                    cursor.execute(f"DROP TABLE {self.quote(partition.name)}")
+                    dropped.append(partition.name)
+            cursor.execute(f"DELETE FROM {self.quote(DEFAULT_PARTITION)} WHERE timestamp < %s", [cutoff])
+            deleted = cursor.rowcount
+        return dropped, deleted
+    
+    def convert(self, start, end, interval):
+        """
+        Rebuild the plain vessel_positions table as a partitioned one
+        Partition bounds must be part of every unique key, so the primary key
+        becomes (id, timestamp); ids keep coming from one sequence. Rows before
+        start go to the default partition.
+        """
+        legacy = f"{TABLE}_unpartitioned"
+        table, old = self.quote(TABLE), self.quote(legacy)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND schemaname = current_schema()",
+                [TABLE],
+            )
+            indexes = cursor.fetchall()
+            cursor.execute(
+                "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass",
+                [TABLE],
+            )
+            constraints = cursor.fetchall()
+            constraint_indexes = {name for name, kind, _ in constraints if kind in ('p', 'u')}
+            legacy_sequence = self.sequence(cursor)
+            
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {old}")
+            # Index names are schema-wide: free them for the new table
+            for name, kind, _ in constraints:
+                if kind == 'p':
+                    cursor.execute(f"ALTER TABLE {old} RENAME CONSTRAINT {self.quote(name)} TO {self.quote(legacy + '_pkey')}")
+                elif kind == 'u':
+                    cursor.execute(f"ALTER TABLE {old} DROP CONSTRAINT {self.quote(name)}")
+            for name, _ in indexes:
+                if name not in constraint_indexes:
+                    cursor.execute(f"DROP INDEX {self.quote(name)}")
+            
+            cursor.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS) PARTITION BY RANGE (timestamp)")
+            sequence = self.quote(f"{TABLE}_id_seq")
+            if legacy_sequence:
+                # Serial or identity sequence, whatever its name; dropped with the old table
+                cursor.execute(f"ALTER SEQUENCE {legacy_sequence} RENAME TO {self.quote(legacy + '_id_seq')}")
+            cursor.execute(f"CREATE SEQUENCE {sequence} OWNED BY {table}.id")
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id SET DEFAULT nextval('{TABLE}_id_seq')")
+            for name, kind, definition in constraints:
+                if kind == 'p':
+                    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {self.quote(name)} PRIMARY KEY (id, timestamp)")
+                elif kind in ('u', 'f'):
+                    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {self.quote(name)} {definition}")
+            for name, definition in indexes:
+                if name not in constraint_indexes:
+                    cursor.execute(definition)
+            cursor.execute(f"CREATE TABLE {self.quote(DEFAULT_PARTITION)} PARTITION OF {table} DEFAULT")
+            
+            for range_start, range_end in plan_partitions(start, end, [], interval):
+                self.create(cursor, range_start, range_end)
+            
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+            cursor.execute(f"SELECT setval('{TABLE}_id_seq', COALESCE((SELECT MAX(id) FROM {old}), 0) + 1, false)")
+            cursor.execute(f"DROP TABLE {old}")
+    
+    def sequence(self, cursor):
+        """Qualified name of the sequence behind vessel_positions.id, or None"""
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [TABLE])
+        return cursor.fetchone()[0]
+    
+    def revert(self):
+        """
+        Rebuild vessel_positions as a plain table holding every partition's rows
+        The primary key goes back to (id) on an identity column, as Django
+        creates it.
+        """
+        partitioned = f"{TABLE}_partitioned"
+        table, old = self.quote(TABLE), self.quote(partitioned)
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT indexname, indexdef FROM pg_indexes WHERE tablename = %s AND schemaname = current_schema()",
+                [TABLE],
+            )
+            indexes = cursor.fetchall()
+            cursor.execute(
+                "SELECT conname, contype, pg_get_constraintdef(oid) FROM pg_constraint "
+                "WHERE conrelid = %s::regclass",
+                [TABLE],
+            )
+            constraints = cursor.fetchall()
+            constraint_indexes = {name for name, kind, _ in constraints if kind in ('p', 'u')}
+            sequence = self.sequence(cursor)
+            
+            cursor.execute(f"ALTER TABLE {table} RENAME TO {old}")
+            for name, kind, _ in constraints:
+                if kind == 'p':
+                    cursor.execute(f"ALTER TABLE {old} RENAME CONSTRAINT {self.quote(name)} TO {self.quote(partitioned + '_pkey')}")
+                elif kind == 'u':
+                    cursor.execute(f"ALTER TABLE {old} DROP CONSTRAINT {self.quote(name)}")
+            for name, _ in indexes:
+                if name not in constraint_indexes:
+                    cursor.execute(f"DROP INDEX {self.quote(name)}")
+            cursor.execute(f"ALTER TABLE {old} ALTER COLUMN id DROP DEFAULT")
+            if sequence:
+                cursor.execute(f"DROP SEQUENCE {sequence}")
+            
+            cursor.execute(f"CREATE TABLE {table} (LIKE {old} INCLUDING DEFAULTS)")
+            cursor.execute(f"ALTER TABLE {table} ALTER COLUMN id ADD GENERATED BY DEFAULT AS IDENTITY")
+            for name, kind, definition in constraints:
+                if kind == 'p':
+                    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {self.quote(name)} PRIMARY KEY (id)")
+                elif kind in ('u', 'f'):
+                    cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {self.quote(name)} {definition}")
+            for name, definition in indexes:
+                if name not in constraint_indexes:
+                    cursor.execute(definition.replace(' ON ONLY ', ' ON ', 1))
+            
+            cursor.execute(f"INSERT INTO {table} SELECT * FROM {old}")
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE((SELECT MAX(id) FROM {table}), 0) + 1, false)",
+                [TABLE],
+            )
+            cursor.execute(f"DROP TABLE {old}")
+
+
+class SQLitePartitioner:
+    """Shard tables behind a vessel_positions view on SQLite"""
+    
+    def __init__(self, connection):
+        self.connection = connection
+        self.quote = connection.ops.quote_name
+    
+    def is_partitioned(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute("SELECT type FROM sqlite_master WHERE name = %s", [TABLE])
+            row = cursor.fetchone()
+        return bool(row) and row[0] == 'view'
+    
+    def partitions(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"SELECT name, range_start, range_end FROM {SQLITE_CATALOG} ORDER BY range_start")
+            return [
+                Partition(name, datetime.fromisoformat(start), datetime.fromisoformat(end))
+                for name, start, end in cursor.fetchall()
+            ]
+    
+    def tables(self, start=None, end=None):
+        """Shard tables, optionally only those that can hold timestamps in [start, end)"""
+        partitions = [p for p in self.partitions() if start is None or (p.start < end and start < p.end)]
+        return [DEFAULT_PARTITION] + [p.name for p in partitions]
+    
+    def columns(self, cursor):
+        cursor.execute(f"PRAGMA table_info({self.quote(DEFAULT_PARTITION)})")
+        return [row[1] for row in cursor.fetchall()]
+    
+    def create(self, cursor, start, end):
+        """Create a shard from the default shard's DDL and move its rows over"""
+        name = _name(start)
+        cursor.execute("SELECT type, name, sql FROM sqlite_master WHERE tbl_name = %s AND sql IS NOT NULL", [DEFAULT_PARTITION])
+        schema = cursor.fetchall()
+        for kind, object_name, sql in sorted(schema, key=lambda row: row[0] != 'table'):
+            if kind == 'index':
+                cursor.execute(shard_index_sql(sql, object_name, name))
+            else:
+                cursor.execute(sql.replace(f'"{DEFAULT_PARTITION}"', f'"{name}"'))
+        ordinal = (start.year - 2000) * 60 + (start.month - 1) * 5 + (start.day - 1) // 7 + 1
+        cursor.execute("INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [name, ordinal << SQLITE_ID_SHIFT])
+        
+        columns = ', '.join(self.quote(column) for column in self.columns(cursor))
+        bounds = [_text(start), _text(end)]
+        cursor.execute(
+            f"INSERT INTO {self.quote(name)} ({columns}) SELECT {columns} FROM {self.quote(DEFAULT_PARTITION)} "
+            f"WHERE timestamp >= %s AND timestamp < %s",
+            bounds,
+        )
+        if cursor.rowcount:
+            logger.info(f"Moved {cursor.rowcount} positions from {DEFAULT_PARTITION} into {name}")
+            cursor.execute(f"DELETE FROM {self.quote(DEFAULT_PARTITION)} WHERE timestamp >= %s AND timestamp < %s", bounds)
+        cursor.execute(f"INSERT INTO {SQLITE_CATALOG} (name, range_start, range_end) VALUES (%s, %s, %s)", [name, start.isoformat(), end.isoformat()])
+        return name
+    
+    def route(self, rows, index):
+        """{table: rows} for rows whose stored timestamp text is at position index"""
+        partitions = [(_text(p.start), _text(p.end), p.name) for p in self.partitions()]
+        routed = {}
+        for row in rows:
+            stamp = row[index]
+            table = next((name for start, end, name in partitions if start <= stamp < end), DEFAULT_PARTITION)
+            routed.setdefault(table, []).append(row)
+        return routed
+    
+    def ensure(self, start, end, interval):
+        created = []
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            for range_start, range_end in plan_partitions(start, end, self.partitions(), interval):
+                created.append(self.create(cursor, range_start, range_end))
+            if created:
+                self.rebuild_view(cursor)
+        return created
+    
+    def drop_before(self, cutoff):
+        dropped = []
+        with transaction.atomic(using=self.connection.alias), self.connection.cursor() as cursor:
+            for partition in self.partitions():
+                if partition.end <= cutoff:
+                    cursor.execute(f"DROP TABLE {self.quote(partition.name)}")
+                    cursor.execute(f"DELETE FROM {SQLITE_CATALOG} WHERE name = %s", [partition.name])
+                    dropped.append(partition.name)
+            cursor.execute(f"DELETE FROM {self.quote(DEFAULT_PARTITION)} WHERE timestamp < %s", [_text(cutoff)])
+            deleted = cursor.rowcount
+            if dropped:
+                self.rebuild_view(cursor)
+        return dropped, deleted
+    
+    def rebuild_view(self, cursor):
+        """(Re)create the vessel_positions view and its routing triggers for the current shards"""
+        view = self.quote(TABLE)
+        columns = self.columns(cursor)
+        column_list = ', '.join(self.quote(column) for column in columns)
+        new_values = ', '.join(f"NEW.{self.quote(column)}" for column in columns)
+        assignments = ', '.join(f"{self.quote(column)} = NEW.{self.quote(column)}" for column in columns if column != 'id')
+        
+        partitions = self.partitions()
+        ranges = [(self.quote(p.name), f"'{_text(p.start)}'", f"'{_text(p.end)}'") for p in partitions]
+        default = self.quote(DEFAULT_PARTITION)
+        covered = ' OR '.join(f"(NEW.timestamp >= {start} AND NEW.timestamp < {end})" for _, start, end in ranges) or '0'
+        tables = [default] + [name for name, _, _ in ranges]
+        
+        cursor.execute(f"DROP VIEW IF EXISTS {view}")
+        cursor.execute(f"CREATE VIEW {view} AS " + ' UNION ALL '.join(f"SELECT * FROM {table}" for table in tables))
+        inserts = [
+            f"INSERT INTO {name} ({column_list}) SELECT {new_values} "
+            f"WHERE NEW.timestamp >= {start} AND NEW.timestamp < {end};"
+            for name, start, end in ranges
+        ]
+        inserts.append(f"INSERT INTO {default} ({column_list}) SELECT {new_values} WHERE NOT ({covered});")
+        cursor.execute(f"CREATE TRIGGER {self.quote(TABLE + '_insert')} INSTEAD OF INSERT ON {view} BEGIN {' '.join(inserts)} END")
+        cursor.execute(
+            f"CREATE TRIGGER {self.quote(TABLE + '_update')} INSTEAD OF UPDATE ON {view} BEGIN "
+            + ' '.join(f"UPDATE {table} SET {assignments} WHERE id = OLD.id;" for table in tables)
+            + " END"
+        )
+        cursor.execute(
+            f"CREATE TRIGGER {self.quote(TABLE + '_delete')} INSTEAD OF DELETE ON {view} BEGIN "
+            + ' '.join(f"DELETE FROM {table} WHERE id = OLD.id;" for table in tables)
+            + " END"
+        )
+    
+    def convert(self, start, end, interval):
+        """Turn the vessel_positions table into the default shard and put the view in its place"""
+        with self.connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {self.quote(TABLE)} RENAME TO {self.quote(DEFAULT_PARTITION)}")
+            cursor.execute(f"CREATE TABLE {SQLITE_CATALOG} (name varchar(100) PRIMARY KEY, range_start varchar(32) NOT NULL, range_end varchar(32) NOT NULL)")
+            for range_start, range_end in plan_partitions(start, end, [], interval):
+                self.create(cursor, range_start, range_end)
+            self.rebuild_view(cursor)
+    
+    def revert(self):
+        """Put every shard's rows back into one vessel_positions table (the default shard, renamed)"""
+        shards = [p.name for p in self.partitions()]
+        with self.connection.cursor() as cursor:
+            columns = ', '.join(self.quote(column) for column in self.columns(cursor))
+            # Dropping the view drops its routing triggers
+            cursor.execute(f"DROP VIEW {self.quote(TABLE)}")
+            cursor.execute(f"ALTER TABLE {self.quote(DEFAULT_PARTITION)} RENAME TO {self.quote(TABLE)}")
+            for shard in shards:
+                cursor.execute(f"INSERT INTO {self.quote(TABLE)} ({columns}) SELECT {columns} FROM {self.quote(shard)}")
+                cursor.execute(f"DROP TABLE {self.quote(shard)}")
+            cursor.execute(f"DROP TABLE {SQLITE_CATALOG}")
+
+
+def get_partitioner(using='default'):
+    """Partitioner for the database behind using, or None where partitioning is unsupported"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        return PostgresPartitioner(connection)
+    if connection.vendor == 'sqlite':
+        return SQLitePartitioner(connection)
+    return None
+
+
+def _window():
+    """
+    Default coverage: from the retention cutoff (or now, when history is kept)
+    up to AIS_POSITION_PARTITIONS_AHEAD periods ahead
+    """
+    interval = partition_interval()
+    now = timezone.now()
+    start = now - timedelta(days=getattr(settings, 'AIS_POSITION_RETENTION_DAYS', 0))
+    end = period_start(now, interval)
+    for _ in range(getattr(settings, 'AIS_POSITION_PARTITIONS_AHEAD', 3) + 1):
+        end = period_end(end, interval)
+    return start, end, interval
+
+
+def ensure_partitions(start=None, end=None, using='default'):
+    """
+    Create the partitions needed to cover [start, end) (default: retention
+    window plus the partitions ahead); returns the names created
+    """
+    partitioner = get_partitioner(using)
+    if partitioner is None or not partitioner.is_partitioned():
+        return []
+    default_start, default_end, interval = _window()
+    created = partitioner.ensure(start or default_start, end or default_end, interval)
+    if created:
+        logger.info(f"Created position partitions: {', '.join(created)}")
+    return created
+
+
+def drop_expired_partitions(cutoff, using='default'):
+    """
+    Retention for partitioned storage: drops partitions wholly older than
+    cutoff; returns (dropped names, rows deleted from the default partition),
+    or None when vessel_positions is not partitioned
+    """
+    partitioner = get_partitioner(using)
+    if partitioner is None or not partitioner.is_partitioned():
+        return None
+    return partitioner.drop_before(cutoff)
+
+
+def partition_positions(using='default'):
+    """Convert an unpartitioned vessel_positions table in place (used by the migration)"""
+    partitioner = get_partitioner(using)
+    if partitioner is None or partitioner.is_partitioned():
+        return False
+    start, end, interval = _window()
+    with partitioner.connection.cursor() as cursor:
+        cursor.execute(f"SELECT MIN(timestamp) FROM {partitioner.quote(TABLE)}")
+        earliest = cursor.fetchone()[0]
+    if earliest is not None:
+        # Kept history gets partitions too, rather than piling up in the default partition
+        if isinstance(earliest, str):
+            earliest = datetime.fromisoformat(earliest).replace(tzinfo=dt_timezone.utc)
+        start = min(start, earliest)
+    partitioner.convert(start, end, interval)
+    return True
+
+
+def unpartition_positions(using='default'):
+    """Turn partitioned vessel_positions back into a plain table (reverse of the migration)"""
+    partitioner = get_partitioner(using)
+    if partitioner is None or not partitioner.is_partitioned():
+        return False
+    partitioner.revert()
+    return True
+
+
+def delete_positions(ids, start, end, using='default', batch_size=500):
+    """
+    Delete positions by id, all timestamped within [start, end); returns the
+    number deleted. Only the partitions (SQLite shards) of that range are
+    touched; SQLite shards are written directly rather than through the view.
+    """
+    from .models import VesselPosition
+    
+    ids = list(ids)
+    partitioner = get_partitioner(using)
+    deleted = 0
+    if isinstance(partitioner, SQLitePartitioner) and partitioner.is_partitioned():
+        with transaction.atomic(using=using), partitioner.connection.cursor() as cursor:
+            for table in partitioner.tables(start, end):
+                for i in range(0, len(ids), batch_size):
+                    batch = ids[i:i + batch_size]
+                    cursor.execute(
+                        f"DELETE FROM {partitioner.quote(table)} WHERE id IN ({', '.join(['%s'] * len(batch))})", batch
+                    )
+                    deleted += cursor.rowcount
+        return deleted
+    with transaction.atomic(using=using):
+        for i in range(0, len(ids), batch_size):
+            deleted += VesselPosition.objects.using(using).filter(
+                timestamp__gte=start, timestamp__lt=end, id__in=ids[i:i + batch_size]
+            ).delete()[0]
+    return deleted
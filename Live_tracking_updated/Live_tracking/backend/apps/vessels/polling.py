@@ -0,0 +1,229 @@
+"""
+Concurrent AIS polling engine
+Fetches positions for many vessels at once using asyncio + httpx
+instead of walking the provider chain one MMSI at a time
+"""
+
+import asyncio
+import logging
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from .providers import get_async_provider_client, run_async
+from .profile_cache import profile_cache
+from .services import AISIntegrationService
+from .simulator import get_simulator, simulator_enabled
+
+logger = logging.getLogger(__name__)
+
+# Maximum in-flight requests per provider (overridable via AIS_PROVIDER_CONCURRENCY)
+DEFAULT_PROVIDER_CONCURRENCY = {
+    'marinesia': 50,
+    'aishub': 10,
+    'marinetraffic': 5,
+}
+
+
+
+class AsyncAISPoller:
+    """
+    Polls the MarineSia -> AISHub -> MarineTraffic chain for many MMSIs concurrently
+    
+    Every provider has its own semaphore so a slow or rate-limited provider
+    cannot starve the others. Requests go through the process-wide pooled
+    provider clients, so connections stay alive between polling runs.
+    Parsing is delegated to AISIntegrationService so both paths return
+    the same position dict shape.
+    """
+    
+    def __init__(self, ais_service=None, concurrency=None, use_mock_fallback=True):
+        self.ais = ais_service or AISIntegrationService()
+        self.concurrency = dict(DEFAULT_PROVIDER_CONCURRENCY)
+        self.concurrency.update(getattr(settings, 'AIS_PROVIDER_CONCURRENCY', {}))
+        if concurrency:
+            self.concurrency.update(concurrency)
+        self.use_mock_fallback = use_mock_fallback
+        self.stats = defaultdict(dict)
+        self._semaphores = {}
+    
+    def poll(self, mmsis):
+        """
+        Fetch positions for all MMSIs
+        Returns {mmsi: position_data} for every vessel that produced a fix
+        """
+        return run_async(self.poll_async(mmsis))
+    
+    def poll_plan(self, plan):
+        """
+        Fetch positions for an AreaPollPlan
+        Each box is queried once; only vessels missing from every box
+        are looked up individually
+        """
+        return run_async(self.poll_plan_async(plan))
+    
+    async def poll_async(self, mmsis):
+        """Async entry point - usable from an already running event loop"""
+        mmsis = [str(mmsi) for mmsi in mmsis]
+        self._reset_stats()
+        started = time.monotonic()
+        
+        self._open_semaphores()
+        positions = await self._poll_many(mmsis)
+        
+        self._log_run(len(mmsis), positions, started)
+        return positions
+    
+    async def poll_plan_async(self, plan):
+        """Async version of poll_plan"""
+        self._reset_stats()
+        started = time.monotonic()
+        
+        self._open_semaphores()
+        positions = {}
+        for found in await asyncio.gather(*(self._poll_box(box) for box in plan.boxes)):
+            positions.update(found)
+        
+        missing = list(plan.individual)
+        missing.extend(mmsi for box in plan.boxes for mmsi in box[4] if mmsi not in positions)
+        positions.update(await self._poll_many(missing))
+        
+        total = len(plan.individual) + sum(len(box[4]) for box in plan.boxes)
+        self._log_run(total, positions, started)
+        return positions
+    
+    def _reset_stats(self):
+        self.stats = defaultdict(lambda: {'requests': 0, 'hits': 0, 'errors': 0})
+    
+    def _log_run(self, vessel_count, positions, started):
+        elapsed = time.monotonic() - started
+        logger.info(
+            f"Polled {vessel_count} vessels in {elapsed:.2f}s "
+            f"({len(positions)} positions, stats={dict(self.stats)})"
+        )
+    
+    async def _poll_many(self, mmsis):
+        if simulator_enabled():
+            # One vectorized call instead of a coroutine per vessel
+            positions = get_simulator().positions(mmsis)
+            self.stats['simulator']['requests'] += len(mmsis)
+            self.stats['simulator']['hits'] += len(positions)
+            return positions
+        results = await asyncio.gather(*(self._poll_one(mmsi) for mmsi in mmsis))
+        return {mmsi: position for mmsi, position in zip(mmsis, results) if position}
+    
+    def _open_semaphores(self):
+        """Per-provider concurrency limits for one polling run"""
+        self._semaphores = {
+            name: asyncio.Semaphore(limit) for name, limit in self.concurrency.items()
+        }
+    
+    async def _poll_one(self, mmsi):
+        """Walk the (health-ordered) provider chain for a single MMSI"""
+        fetchers = {
+            'marinesia': self._fetch_from_marinesia,
+            'aishub': self._fetch_from_aishub,
+            'marinetraffic': self._fetch_from_marinetraffic,
+        }
+        
+        # Re-read per vessel so a breaker that opens mid-run takes effect immediately
+        for provider in self.ais.position_chain():
+            fetch = fetchers[provider]
+            self.stats[provider]['requests'] += 1
+            try:
+                position = await fetch(mmsi)
+            except Exception as e:
+                self.stats[provider]['errors'] += 1
+                logger.debug(f"Error fetching from {provider} for MMSI {mmsi}: {str(e)}")
+                continue
+            if position:
+                self.stats[provider]['hits'] += 1
+                return position
+        
+        if self.use_mock_fallback:
+            self.stats['mock']['hits'] += 1
+            return self.ais._mock_vessel_position(mmsi)
+        return None
+    
+    async def _poll_box(self, box):
+        """
+        Query one bounding box and keep only the tracked MMSIs inside it
+        AISHub is asked first; MarineTraffic only if vessels are still missing
+        """
+        min_lat, max_lat, min_lon, max_lon, mmsis = box
+        wanted = set(mmsis)
+        found = {}
+        
+        chain = [('aishub_area', self._fetch_area_from_aishub)]
+        if simulator_enabled():
+            chain = [('simulator_area', self._fetch_area_from_simulator)]
+        elif self.ais.api_key:
+            chain.append(('marinetraffic_area', self._fetch_area_from_marinetraffic))
+        
+        for provider, fetch in chain:
+            self.stats[provider]['requests'] += 1
+            try:
+                positions = await fetch(min_lat, max_lat, min_lon, max_lon)
+            except Exception as e:
+                self.stats[provider]['errors'] += 1
+                logger.debug(f"Error fetching area from {provider}: {str(e)}")
+                continue
+            
+            for position in positions:
+                mmsi = str(position.get('mmsi'))
+                if mmsi in wanted and mmsi not in found:
+                    found[mmsi] = position
+                    self.stats[provider]['hits'] += 1
+            
+            if len(found) == len(wanted):
+                break
+        
+        return found
+    
+    async def _get_json(self, provider, url, params=None, headers=None):
+        """GET a provider URL under that provider's concurrency limit"""
+        async with self._semaphores[provider]:
+            response = await get_async_provider_client(provider).get(url, params=params, headers=headers)
+        response.raise_for_status()
+        return response.json()
+    
+    async def _fetch_from_marinesia(self, mmsi):
+        params = {}
+        if self.ais.marinesia_api_key:
+            params['key'] = self.ais.marinesia_api_key
+        
+        location_data = await self._get_json(
+            'marinesia', f"{self.ais.marinesia_url}/vessel/{mmsi}/location/latest", params
+        )
+        if not location_data:
+            return None
+        
+        # Profiles come from the long-lived cache; unknown ones are filled in the background
+        profile_data = profile_cache.get(mmsi, self.ais._fetch_marinesia_profile, wait=False)
+        
+        return self.ais._parse_marinesia_position(mmsi, location_data, profile_data)
+    
+    async def _fetch_from_aishub(self, mmsi):
+        data = await self._get_json('aishub', self.ais.aishub_url, self.ais._aishub_params(mmsi=mmsi))
+        return self.ais._parse_aishub_position(data)
+    
+    async def _fetch_from_marinetraffic(self, mmsi):
+        url = f"{self.ais.base_url}/exportvessel/v:8/{self.ais.api_key}/timespan:10/mmsi:{mmsi}/protocol:json"
+        data = await self._get_json('marinetraffic', url)
+        return self.ais._parse_marinetraffic_position(data)
+    
+    async def _fetch_area_from_aishub(self, min_lat, max_lat, min_lon, max_lon):
+        params = self.ais._aishub_params(latmin=min_lat, latmax=max_lat, lonmin=min_lon, lonmax=max_lon)
+        data = await self._get_json('aishub', self.ais.aishub_url, params)
+        return [self.ais._area_record_to_position(record) for record in self.ais._parse_aishub_area(data)]
+    
+    async def _fetch_area_from_simulator(self, min_lat, max_lat, min_lon, max_lon):
+        return get_simulator().in_area(min_lat, max_lat, min_lon, max_lon)
+    
+    async def _fetch_area_from_marinetraffic(self, min_lat, max_lat, min_lon, max_lon):
+        url = f"{self.ais.base_url}/exportvessels/v:8/{self.ais.api_key}/"
+        url += f"minlat:{min_lat}/maxlat:{max_lat}/minlon:{min_lon}/maxlon:{max_lon}/"
+        url += "protocol:json"
+        data = await self._get_json('marinetraffic', url)
+        return [self.ais._area_record_to_position(record) for record in self.ais._parse_marinetraffic_area(data)]
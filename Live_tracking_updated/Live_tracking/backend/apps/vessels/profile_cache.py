@@ -0,0 +1,171 @@
+"""
+Vessel static-profile cache
+Name, type and dimensions of a ship almost never change, so MarineSia
+profiles are fetched once per vessel and kept for AIS_PROFILE_TTL_DAYS in the
+shared cache, fronted by a per-process LRU. Profiles older than
+AIS_PROFILE_REFRESH_DAYS are still served and refreshed in the background,
+so the polling path only requests the latest location.
+"""
+
+import logging
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DAY = 86400
+
+
+class VesselProfileCache:
+    """
+    Two-level (local LRU, shared cache) store of vessel profiles by MMSI
+    
+    Entries are {'profile': dict, 'fetched_at': epoch}; an empty profile means
+    the provider has none and is kept for AIS_PROFILE_MISSING_TTL only.
+    fetch(mmsi) returns the profile dict, {} when the vessel has no profile,
+    and raises on transport errors (which are never cached).
+    """
+    
+    def __init__(self, namespace='ais:profile', local_size=None):
+        self.namespace = namespace
+        self.local_size = local_size or getattr(settings, 'AIS_PROFILE_LOCAL_SIZE', 10000)
+        self._local = OrderedDict()
+        self._lock = threading.Lock()
+        self._refreshing = set()
+        self._executor = None
+        self.stats = Counter()
+    
+    def _key(self, mmsi):
+        return f"{self.namespace}:{mmsi}"
+    
+    def _is_stale(self, entry, now):
+        refresh_after = getattr(settings, 'AIS_PROFILE_REFRESH_DAYS', 7) * DAY
+        if not entry['profile']:
+            refresh_after = getattr(settings, 'AIS_PROFILE_MISSING_TTL', DAY)
+        return now - entry['fetched_at'] >= refresh_after
+    
+    def _remember_local(self, mmsi, entry):
+        with self._lock:
+            self._local[mmsi] = entry
+            self._local.move_to_end(mmsi)
+            while len(self._local) > self.local_size:
+                self._local.popitem(last=False)
+    
+    def get(self, mmsi, fetch, wait=True):
+        """
+        Cached profile for a vessel, or None when it is not known yet
+        A vessel seen for the first time is fetched right away, or in the
+        background with wait=False (callers running inside an event loop)
+        """
+        mmsi = str(mmsi)
+        now = time.time()
+        with self._lock:
+            entry = self._local.get(mmsi)
+            if entry is not None:
+                self._local.move_to_end(mmsi)
+        if entry is not None and not self._is_stale(entry, now):
+            self.stats['local_hits'] += 1
+            return entry['profile']
+        
+        # Stale locally: another process may already have refreshed it
+        try:
+            shared = cache.get(self._key(mmsi))
+        except Exception as e:
+            logger.warning(f"Profile cache read failed: {str(e)}")
+            shared = None
+        if shared is not None and (entry is None or shared['fetched_at'] > entry['fetched_at']):
+            entry = shared
+            self._remember_local(mmsi, entry)
+        
+        if entry is not None:
+            self.stats['shared_hits'] += 1
+            if self._is_stale(entry, now):
+                self._refresh_later(mmsi, fetch)
+            return entry['profile']
+        
+        self.stats['misses'] += 1
+        if not wait:
+            self._refresh_later(mmsi, fetch)
+            return None
+        if not self._claim(mmsi):
+            return None
+        entry = self._fill(mmsi, fetch)
+        return entry['profile'] if entry else None
+    
+    def _claim(self, mmsi):
+        """
+        One fetch per vessel per AIS_PROFILE_RETRY_INTERVAL across processes,
+        which also backs off vessels whose profile fetch keeps failing
+        """
+        retry = getattr(settings, 'AIS_PROFILE_RETRY_INTERVAL', 300)
+        try:
+            return cache.add(f"{self._key(mmsi)}:fetching", 1, retry)
+        except Exception:
+            return True
+    
+    def _fill(self, mmsi, fetch):
+        try:
+            profile = fetch(mmsi) or {}
+        except Exception as e:
+            self.stats['errors'] += 1
+            logger.debug(f"Could not fetch profile for MMSI {mmsi}: {str(e)}")
+            return None
+        self.stats['fetches'] += 1
+        entry = {'profile': profile, 'fetched_at': time.time()}
+        ttl = getattr(settings, 'AIS_PROFILE_TTL_DAYS', 30) * DAY
+        if not profile:
+            ttl = getattr(settings, 'AIS_PROFILE_MISSING_TTL', DAY)
+        try:
+            cache.set(self._key(mmsi), entry, ttl)
+        except Exception as e:
+            logger.warning(f"Profile cache write failed: {str(e)}")
+        self._remember_local(mmsi, entry)
+        return entry
+    
+    def _refresh_later(self, mmsi, fetch):
+        """Fetch a profile off the polling path, once across processes"""
+        with self._lock:
+            if mmsi in self._refreshing:
+                return
+            self._refreshing.add(mmsi)
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'AIS_PROFILE_REFRESH_WORKERS', 2),
+                    thread_name_prefix='profile-refresh',
+                )
+        if not self._claim(mmsi):
+            with self._lock:
+                self._refreshing.discard(mmsi)
+            return
+        self.stats['refreshes'] += 1
+        self._executor.submit(self._refresh, mmsi, fetch)
+    
+    def _refresh(self, mmsi, fetch):
+        try:
+            self._fill(mmsi, fetch)
+        finally:
+            with self._lock:
+                self._refreshing.discard(mmsi)
+    
+    def invalidate(self, mmsi):
+        mmsi = str(mmsi)
+        with self._lock:
+            self._local.pop(mmsi, None)
+        try:
+            cache.delete(self._key(mmsi))
+        except Exception as e:
+            logger.warning(f"Profile cache delete failed: {str(e)}")
+
+
+profile_cache = VesselProfileCache()
+
+
+def profile_cache_stats():
+    stats = dict(profile_cache.stats)
+    stats['local_entries'] = len(profile_cache._local)
+    return stats
@@ -0,0 +1,277 @@
+"""
+Provider health tracking for the AIS provider chain
+Per-provider circuit breakers and a rolling latency/success score,
+shared across workers through the Django cache (Redis in production,
+local memory in development and tests)
+"""
+
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHAIN = ['marinesia', 'aishub', 'marinetraffic']
+
+LATENCY_ALPHA = 0.2  # EWMA weight of the newest latency sample
+SUCCESS_ALPHA = 0.1  # EWMA weight of the newest success/failure sample
+
+
+def _cache_get(key, default=None):
+    try:
+        return cache.get(key, default)
+    except Exception as e:
+        logger.debug(f"Provider health cache read failed for {key}: {str(e)}")
+        return default
+
+
+def _cache_set(key, value, timeout):
+    try:
+        cache.set(key, value, timeout)
+    except Exception as e:
+        logger.debug(f"Provider health cache write failed for {key}: {str(e)}")
+
+
+def _cache_add(key, value, timeout):
+    try:
+        return cache.add(key, value, timeout)
+    except Exception as e:
+        logger.debug(f"Provider health cache add failed for {key}: {str(e)}")
+        return True
+
+
+def _cache_delete(*keys):
+    try:
+        cache.delete_many(keys)
+    except Exception as e:
+        logger.debug(f"Provider health cache delete failed for {keys}: {str(e)}")
+
+
+class ProviderHealth:
+    """
+    Circuit breaker and rolling score for one provider
+    
+    Closed: requests flow normally. After AIS_BREAKER_FAILURE_THRESHOLD
+    consecutive failures the breaker opens for AIS_BREAKER_COOLDOWN seconds
+    and every worker skips the provider. When the cooldown expires a single
+    worker (whoever wins a cache.add) sends a probe request; success closes
+    the breaker, failure reopens it with a doubled cooldown.
+    """
+    
+    def __init__(self, name):
+        self.name = name
+        self.failure_threshold = getattr(settings, 'AIS_BREAKER_FAILURE_THRESHOLD', 5)
+        self.base_cooldown = getattr(settings, 'AIS_BREAKER_COOLDOWN', 30)
+        self.max_cooldown = getattr(settings, 'AIS_BREAKER_MAX_COOLDOWN', 600)
+        self.sync_interval = getattr(settings, 'AIS_HEALTH_SYNC_INTERVAL', 2)
+        
+        self.breaker_key = f"ais:breaker:{name}"
+        self.probe_key = f"ais:breaker:{name}:probe"
+        self.score_key = f"ais:health:{name}"
+        
+        self._lock = threading.Lock()
+        self.consecutive_failures = 0
+        self.latency_ms = None
+        self.success_rate = None
+        self.breaker = None  # {'open_until': ts, 'cooldown': seconds} when open
+        self._probing = False
+        self._probe_started = 0
+        self._breaker_synced_at = 0
+        self._score_synced_at = 0
+        self._shared_score = None
+    
+    # Circuit breaker
+    
+    def allow_request(self):
+        """Whether a request to this provider may be sent right now"""
+        now = time.time()
+        self._sync_breaker(now)
+        breaker = self.breaker
+        if breaker is None:
+            return True
+        if now < breaker['open_until']:
+            return False
+        
+        # Cooldown over: half-open, one probe across all workers; only the call that wins it passes
+        probe_timeout = getattr(settings, 'AIS_BREAKER_PROBE_TIMEOUT', 30)
+        with self._lock:
+            if self._probing and now - self._probe_started < probe_timeout:
+                return False
+            if not _cache_add(self.probe_key, os.getpid(), probe_timeout):
+                return False
+            self._probing = True
+            self._probe_started = now
+        logger.info(f"Circuit breaker for {self.name} half-open, sending probe")
+        return True
+    
+    def is_open(self):
+        """Whether the breaker is open and still cooling down (afterwards a probe may be sent)"""
+        now = time.time()
+        self._sync_breaker(now)
+        return self.breaker is not None and now < self.breaker['open_until']
+    
+    def _sync_breaker(self, now):
+        if now - self._breaker_synced_at < self.sync_interval:
+            return
+        self._breaker_synced_at = now
+        try:
+            # A missing key means another worker closed the breaker (or it expired)
+            self.breaker = cache.get(self.breaker_key)
+        except Exception as e:
+            logger.debug(f"Provider health cache read failed for {self.breaker_key}: {str(e)}")
+            return
+        if self.breaker is None:
+            self._probing = False
+    
+    def _open(self, cooldown):
+        cooldown = min(cooldown, self.max_cooldown)
+        self.breaker = {'open_until': time.time() + cooldown, 'cooldown': cooldown}
+        self._probing = False
+        # Remember the breaker well past the cooldown so the next probe doubles it
+        _cache_set(self.breaker_key, self.breaker, max(1, int(cooldown * 4)))
+        _cache_delete(self.probe_key)
+        logger.warning(f"Circuit breaker for {self.name} opened for {cooldown:.0f}s")
+    
+    def _close(self):
+        self.breaker = None
+        self._probing = False
+        _cache_delete(self.breaker_key, self.probe_key)
+        logger.info(f"Circuit breaker for {self.name} closed")
+    
+    # Recording outcomes
+    
+    def record_success(self, latency):
+        with self._lock:
+            self.consecutive_failures = 0
+            self._update_score(latency, 1.0)
+            if self.breaker is not None:
+                self._close()
+        self._publish_score()
+    
+    def record_failure(self, latency=None):
+        with self._lock:
+            self.consecutive_failures += 1
+            self._update_score(latency, 0.0)
+            if self._probing:
+                self._open((self.breaker or {}).get('cooldown', self.base_cooldown) * 2)
+            elif self.breaker is None and self.consecutive_failures >= self.failure_threshold:
+                self._open(self.base_cooldown)
+        self._publish_score()
+    
+    def _update_score(self, latency, success):
+        if latency is not None:
+            latency_ms = latency * 1000
+            if self.latency_ms is None:
+                self.latency_ms = latency_ms
+            else:
+                self.latency_ms += LATENCY_ALPHA * (latency_ms - self.latency_ms)
+        if self.success_rate is None:
+            self.success_rate = success
+        else:
+            self.success_rate += SUCCESS_ALPHA * (success - self.success_rate)
+    
+    # Rolling score
+    
+    def _publish_score(self):
+        """Blend this worker's view into the shared score every sync interval"""
+        now = time.time()
+        if now - self._score_synced_at < self.sync_interval or self.success_rate is None:
+            return
+        self._score_synced_at = now
+        
+        shared = _cache_get(self.score_key)
+        latency_ms = self.latency_ms
+        success_rate = self.success_rate
+        if shared:
+            if latency_ms is None:
+                latency_ms = shared['latency_ms']
+            elif shared['latency_ms'] is not None:
+                latency_ms = (latency_ms + shared['latency_ms']) / 2
+            success_rate = (success_rate + shared['success_rate']) / 2
+        
+        self._shared_score = {'latency_ms': latency_ms, 'success_rate': success_rate, 'updated': now}
+        _cache_set(self.score_key, self._shared_score, 300)
+    
+    def score(self):
+        """
+        Higher is better: success rate discounted by latency
+        Providers with no history score as healthy so they get tried
+        """
+        if self.is_open():
+            return 0.0
+        data = self._shared_score or {'latency_ms': self.latency_ms, 'success_rate': self.success_rate}
+        if data['success_rate'] is None:
+            return 1.0
+        latency_s = (data['latency_ms'] or 0) / 1000
+        return data['success_rate'] / (1 + latency_s)
+    
+    def snapshot(self):
+        return {
+            'state': 'open' if self.is_open() else ('half_open' if self.breaker is not None else 'closed'),
+            'consecutive_failures': self.consecutive_failures,
+            'latency_ms': round(self.latency_ms, 1) if self.latency_ms is not None else None,
+            'success_rate': round(self.success_rate, 3) if self.success_rate is not None else None,
+            'score': round(self.score(), 3),
+            'open_until': self.breaker['open_until'] if self.breaker else None,
+        }
+
+
+_registry_lock = threading.Lock()
+_registry = {}
+
+
+def get_provider_health(name):
+    """Process-wide ProviderHealth for a provider"""
+    health = _registry.get(name)
+    if health is None:
+        with _registry_lock:
+            health = _registry.setdefault(name, ProviderHealth(name))
+    return health
+
+
+def order_providers(names=None):
+    """
+    Order a provider chain by health
+    Providers with an open breaker are dropped. A provider only jumps ahead
+    of an earlier one when its score is better by AIS_HEALTH_REORDER_MARGIN,
+    so the configured order wins while providers are comparable.
+    """
+    margin = getattr(settings, 'AIS_HEALTH_REORDER_MARGIN', 0.2)
+    candidates = [name for name in (names or DEFAULT_CHAIN) if not get_provider_health(name).is_open()]
+    scores = {name: get_provider_health(name).score() for name in candidates}
+    
+    ordered = []
+    for name in candidates:
+        position = len(ordered)
+        while position > 0 and scores[name] > scores[ordered[position - 1]] * (1 + margin):
+            position -= 1
+        ordered.insert(position, name)
+    return ordered
+
+
+def health_snapshot():
+    """Health of every provider seen by this process"""
+    return {name: health.snapshot() for name, health in list(_registry.items())}
+
+
+def get_remembered_endpoint(key):
+    """
+    Endpoint previously found to work for a provider feature
+    Returns None when unknown and '' when every candidate failed recently
+    """
+    return _cache_get(f"ais:endpoint:{key}")
+
+
+def remember_endpoint(key, url, timeout=None):
+    """Remember a working endpoint ('' remembers that none worked)"""
+    if timeout is None:
+        timeout = 86400 if url else getattr(settings, 'AIS_ENDPOINT_RETRY_INTERVAL', 3600)
+    _cache_set(f"ais:endpoint:{key}", url, timeout)
+
+
+def forget_endpoint(key):
+    _cache_delete(f"ais:endpoint:{key}")
@@ -0,0 +1,376 @@
+"""
+Pooled HTTP clients for external AIS and weather providers
+One keep-alive connection pool per provider for the life of the process,
+with per-provider timeouts, jittered retries, cluster-wide rate limits
+and utilisation stats
+"""
+
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+from .provider_health import get_provider_health
+from .rate_limit import ProviderRateLimited, get_rate_limiter, rate_limit_stats
+from .recording import get_recorder
+
+logger = logging.getLogger(__name__)
+
+# Defaults per provider; override any key through settings.AIS_PROVIDERS
+PROVIDER_DEFAULTS = {
+    'marinesia': {
+        'base_url': 'https://api.marinesia.com/api/v1',
+        'timeout': 10,
+        'pool_maxsize': 50,
+    },
+    'aishub': {
+        'base_url': 'http://data.aishub.net/ws.php',
+        'timeout': 10,
+        'pool_maxsize': 10,
+    },
+    'marinetraffic': {
+        'base_url': 'https://services.marinetraffic.com/api',
+        'timeout': 10,
+        'pool_maxsize': 5,
+    },
+    'stormglass': {
+        'base_url': 'https://api.stormglass.io/v2',
+        'timeout': 10,
+        'pool_maxsize': 4,
+    },
+}
+
+COMMON_DEFAULTS = {
+    'max_retries': 2,
+    'backoff_base': 0.25,  # seconds, doubled per attempt
+    'backoff_max': 4.0,  # cap for a single sleep
+    'keepalive_expiry': 60,  # seconds an idle async connection is kept
+    'rate': None,  # requests per second across the cluster (None: unlimited)
+    'burst': None,  # bucket size, defaults to one second's worth
+    'max_queue_wait': 10,  # seconds a request may wait for a token before giving up
+}
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class ProviderUnavailable(Exception):
+    """Raised instead of sending a request while a provider's circuit breaker is open"""
+
+
+def get_provider_config(name):
+    """
+    Merge built-in defaults with settings.AIS_PROVIDERS[name]
+    With AIS_PROVIDER_STANDIN_URL set every provider is served by the local
+    replay stand-in (manage.py provider_standin) under /<provider>, which has
+    no quota to protect, so rate limits are off
+    """
+    config = dict(COMMON_DEFAULTS)
+    config.update(PROVIDER_DEFAULTS.get(name, {}))
+    config.update(getattr(settings, 'AIS_PROVIDERS', {}).get(name, {}))
+    standin = getattr(settings, 'AIS_PROVIDER_STANDIN_URL', '')
+    if standin:
+        config['base_url'] = f"{standin.rstrip('/')}/{name}"
+        config['rate'] = None
+    return config
+
+
+class _ProviderClientBase:
+    """Retry policy and counters shared by the sync and async clients"""
+    
+    def __init__(self, name, config=None):
+        self.name = name
+        self.config = config or get_provider_config(name)
+        self.timeout = self.config['timeout']
+        self.pool_maxsize = self.config['pool_maxsize']
+        self.health = get_provider_health(name)
+        self.limiter = get_rate_limiter(name, self.config)
+        self._stats_lock = threading.Lock()
+        self.counters = {
+            'requests': 0,
+            'retries': 0,
+            'errors': 0,
+            'rejected': 0,
+            'throttled': 0,
+            'in_flight': 0,
+            'peak_in_flight': 0,
+            'total_time': 0.0,
+        }
+    
+    def _is_failure(self, response):
+        """
+        Server errors count against the provider's health, and so does
+        throttling unless a rate limiter is there to absorb it
+        """
+        if response.status_code == 429 and self.limiter:
+            return False
+        return response.status_code >= 500 or response.status_code == 429
+    
+    def _throttled(self, response):
+        """Hold every process back from a provider that answered 429"""
+        if response is None or response.status_code != 429 or not self.limiter:
+            return
+        retry_after = response.headers.get('Retry-After', '')
+        self.limiter.pause(float(retry_after) if retry_after.isdigit() else self.config['backoff_max'])
+    
+    def _record(self, method, response, started):
+        recorder = get_recorder()
+        if recorder is not None:
+            recorder.record(
+                self.name, self.config['base_url'], method, str(response.url), response.status_code,
+                response.headers.get('Content-Type', ''), response.text, time.monotonic() - started,
+            )
+    
+    def _count_throttled(self):
+        with self._stats_lock:
+            self.counters['throttled'] += 1
+    
+    def _should_retry(self, attempt, response=None):
+        if attempt >= self.config['max_retries']:
+            return False
+        return response is None or response.status_code in RETRY_STATUS_CODES
+    
+    def _backoff_delay(self, attempt, response=None):
+        """Full-jitter exponential backoff, honouring a numeric Retry-After"""
+        cap = min(self.config['backoff_max'], self.config['backoff_base'] * (2 ** attempt))
+        delay = random.uniform(0, cap)
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                delay = max(delay, min(float(retry_after), self.config['backoff_max']))
+        return delay
+    
+    def _start(self):
+        if not self.health.allow_request():
+            with self._stats_lock:
+                self.counters['rejected'] += 1
+            raise ProviderUnavailable(f"Circuit breaker open for provider {self.name}")
+        with self._stats_lock:
+            self.counters['requests'] += 1
+            self.counters['in_flight'] += 1
+            self.counters['peak_in_flight'] = max(self.counters['peak_in_flight'], self.counters['in_flight'])
+    
+    def _finish(self, started, error=False):
+        """Release the in-flight slot; error=None (not a provider outcome) leaves health untouched"""
+        elapsed = time.monotonic() - started
+        with self._stats_lock:
+            self.counters['in_flight'] -= 1
+            self.counters['total_time'] += elapsed
+            if error:
+                self.counters['errors'] += 1
+        if error:
+            self.health.record_failure(elapsed)
+        elif error is not None:
+            self.health.record_success(elapsed)
+    
+    def _count_retry(self):
+        with self._stats_lock:
+            self.counters['retries'] += 1
+    
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self.counters)
+        stats['pool_maxsize'] = self.pool_maxsize
+        stats['utilisation'] = round(stats['in_flight'] / self.pool_maxsize, 3) if self.pool_maxsize else 0
+        stats['avg_latency_ms'] = round(1000 * stats['total_time'] / stats['requests'], 1) if stats['requests'] else 0
+        stats['total_time'] = round(stats['total_time'], 3)
+        return stats
+
+
+class ProviderClient(_ProviderClientBase):
+    """
+    Synchronous provider client backed by a requests.Session
+    The session's connection pool is reused across calls, so repeated
+    requests to the same provider skip the TCP+TLS handshake
+    """
+    
+    def __init__(self, name, config=None):
+        super().__init__(name, config)
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=self.config.get('pool_connections', 4),
+            pool_maxsize=self.pool_maxsize,
+            max_retries=0,
+        )
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+    
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+    
+    def request(self, method, url, timeout=None, **kwargs):
+        """
+        Send a request, retrying connection errors and 429/5xx responses
+        The final response is returned as-is; callers decide whether to raise_for_status
+        """
+        attempt = 0
+        while True:
+            if self.limiter:
+                try:
+                    self.limiter.wait()
+                except ProviderRateLimited:
+                    self._count_throttled()
+                    raise
+            started = time.monotonic()
+            self._start()
+            response = None
+            finished = False
+            try:
+                response = self.session.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except requests.exceptions.RequestException:
+                finished = True
+                self._finish(started, error=True)
+                if not self._should_retry(attempt):
+                    raise
+            else:
+                finished = True
+                self._finish(started, error=self._is_failure(response))
+                self._record(method, response, started)
+            finally:
+                # Anything else (bad URL, cancellation) still gives the slot back and propagates
+                if not finished:
+                    self._finish(started, error=None)
+            self._throttled(response)
+            if not self._should_retry(attempt, response):
+                return response
+            time.sleep(self._backoff_delay(attempt, response))
+            self._count_retry()
+            attempt += 1
+    
+    def stats(self):
+        stats = super().stats()
+        pools = list(self.adapter.poolmanager.pools._container.values())
+        stats['hosts'] = len(pools)
+        stats['connections_opened'] = sum(pool.num_connections for pool in pools)
+        return stats
+
+
+class AsyncProviderClient(_ProviderClientBase):
+    """
+    Asynchronous provider client backed by an httpx.AsyncClient
+    Bound to the event loop it was created on (see run_async)
+    """
+    
+    def __init__(self, name, config=None):
+        super().__init__(name, config)
+        self.client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(
+                max_connections=self.pool_maxsize,
+                max_keepalive_connections=self.pool_maxsize,
+                keepalive_expiry=self.config['keepalive_expiry'],
+            ),
+        )
+    
+    async def get(self, url, **kwargs):
+        return await self.request('GET', url, **kwargs)
+    
+    async def request(self, method, url, timeout=None, **kwargs):
+        attempt = 0
+        while True:
+            if self.limiter:
+                try:
+                    await self.limiter.wait_async()
+                except ProviderRateLimited:
+                    self._count_throttled()
+                    raise
+            started = time.monotonic()
+            self._start()
+            response = None
+            finished = False
+            try:
+                response = await self.client.request(method, url, timeout=timeout or self.timeout, **kwargs)
+            except httpx.HTTPError:
+                finished = True
+                self._finish(started, error=True)
+                if not self._should_retry(attempt):
+                    raise
+            else:
+                finished = True
+                self._finish(started, error=self._is_failure(response))
+                self._record(method, response, started)
+            finally:
+                # Anything else (bad URL, cancellation) still gives the slot back and propagates
+                if not finished:
+                    self._finish(started, error=None)
+            self._throttled(response)
+            if not self._should_retry(attempt, response):
+                return response
+            await asyncio.sleep(self._backoff_delay(attempt, response))
+            self._count_retry()
+            attempt += 1
+
+
+_registry_lock = threading.Lock()
+_sync_clients = {}
+_async_clients = {}
+_loop_state = threading.local()
+
+
+def get_provider_client(name):
+    """
+    Process-wide synchronous client for a provider
+    Recreated after fork so Celery prefork children never share sockets
+    """
+    key = (os.getpid(), name)
+    client = _sync_clients.get(key)
+    if client is None:
+        with _registry_lock:
+            client = _sync_clients.get(key)
+            if client is None:
+                client = ProviderClient(name)
+                _sync_clients[key] = client
+    return client
+
+
+def _get_loop():
+    """Event loop reused by every run_async call on this thread"""
+    loop = getattr(_loop_state, 'loop', None)
+    if loop is None or loop.is_closed() or _loop_state.pid != os.getpid():
+        loop = asyncio.new_event_loop()
+        _loop_state.loop = loop
+        _loop_state.pid = os.getpid()
+        _loop_state.clients = {}
+    return loop
+
+
+def run_async(coro):
+    """
+    Run a coroutine on this thread's persistent event loop
+    Unlike asyncio.run the loop (and the async clients bound to it)
+    survives between calls, so keep-alive connections are reused
+    """
+    return _get_loop().run_until_complete(coro)
+
+
+def get_async_provider_client(name):
+    """Async client for a provider, bound to this thread's persistent loop"""
+    _get_loop()
+    client = _loop_state.clients.get(name)
+    if client is None:
+        client = AsyncProviderClient(name)
+        _loop_state.clients[name] = client
+        with _registry_lock:
+            _async_clients[(os.getpid(), threading.get_ident(), name)] = client
+    return client
+
+
+def provider_pool_stats():
+    """
+    Pool utilisation and rate limiter stats for every provider client in this process
+    """
+    stats = {'pid': os.getpid(), 'sync': {}, 'async': {}}
+    for (pid, name), client in list(_sync_clients.items()):
+        if pid == stats['pid']:
+            stats['sync'][name] = client.stats()
+    for (pid, thread_id, name), client in list(_async_clients.items()):
+        if pid == stats['pid']:
+            stats['async'][f"{name}@{thread_id}"] = client.stats()
+    stats['rate_limits'] = rate_limit_stats()
+    return stats
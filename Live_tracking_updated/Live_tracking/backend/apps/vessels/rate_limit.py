@@ -0,0 +1,192 @@
+"""
+Cluster-wide rate limiting of upstream providers
+Every provider with a configured 'rate' gets a token bucket in Redis shared by
+all web and worker processes, refilled at 'rate' requests per second up to
+'burst'. Requests wait for a token (up to 'max_queue_wait' seconds) instead of
+being sent and answered with a 429. While Redis is unreachable each process
+falls back to a local bucket with the same settings.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from apps.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+# KEYS[1] bucket hash; ARGV: rate/s, burst, tokens wanted
+# Returns 0 when the tokens were taken, else milliseconds until they will be there
+_ACQUIRE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local wanted = tonumber(ARGV[3])
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+local state = redis.call('hmget', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens >= wanted then
+    tokens = tokens - wanted
+else
+    wait = math.ceil((wanted - tokens) / rate * 1000)
+end
+redis.call('hset', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('pexpire', KEYS[1], math.ceil(burst / rate * 1000) + 1000)
+return wait
+"""
+
+# KEYS[1] bucket hash; ARGV: rate/s, seconds without tokens
+_PAUSE_SCRIPT = """
+local t = redis.call('time')
+local now = tonumber(t[1]) + tonumber(t[2]) / 1000000
+redis.call('hset', KEYS[1], 'tokens', -tonumber(ARGV[1]) * tonumber(ARGV[2]), 'ts', now)
+redis.call('pexpire', KEYS[1], math.ceil(tonumber(ARGV[2]) * 1000) + 60000)
+return 1
+"""
+
+_redis_retry_at = 0.0
+
+
+class ProviderRateLimited(Exception):
+    """Raised when no token became available within the provider's max_queue_wait"""
+
+
+class _LocalBucket:
+    """In-process token bucket used while Redis is unavailable"""
+    
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.ts = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def take(self, wanted=1):
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+            self.ts = now
+            if self.tokens >= wanted:
+                self.tokens -= wanted
+                return 0.0
+            return (wanted - self.tokens) / self.rate
+    
+    def pause(self, seconds):
+        with self._lock:
+            self.tokens = -self.rate * seconds
+            self.ts = time.monotonic()
+
+
+class TokenBucket:
+    """
+    Shared token bucket for one provider
+    take() never blocks: it returns 0 when a token was taken, or the seconds
+    to wait before trying again. wait() and wait_async() queue for a token.
+    """
+    
+    def __init__(self, name, rate, burst=None, max_queue_wait=None):
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst or max(1.0, self.rate))
+        self.max_queue_wait = max_queue_wait if max_queue_wait is not None else 10.0
+        self.key = f"ais:ratelimit:{name}"
+        self._local = _LocalBucket(self.rate, self.burst)
+        self.stats = Counter()
+    
+    def take(self, tokens=1):
+        global _redis_retry_at
+        if time.time() >= _redis_retry_at:
+            try:
+                wait_ms = get_redis().eval(_ACQUIRE_SCRIPT, 1, self.key, self.rate, self.burst, tokens)
+                return int(wait_ms) / 1000.0
+            except RedisError as e:
+                _redis_retry_at = time.time() + getattr(settings, 'AIS_RATE_LIMIT_REDIS_RETRY', 30)
+                logger.warning(f"Rate limiter falling back to local buckets: {str(e)}")
+        self.stats['local'] += 1
+        return self._local.take(tokens)
+    
+    def _next_delay(self, deadline):
+        """Seconds to sleep before the next attempt, 0 once a token was taken"""
+        delay = self.take()
+        if delay <= 0:
+            self.stats['granted'] += 1
+            return 0.0
+        if time.monotonic() + delay > deadline:
+            self.stats['rejected'] += 1
+            raise ProviderRateLimited(f"Rate limit of provider {self.name} reached ({self.rate}/s)")
+        self.stats['waits'] += 1
+        return delay
+    
+    def wait(self):
+        """Block until a token is taken; raises ProviderRateLimited past max_queue_wait"""
+        started = time.monotonic()
+        deadline = started + self.max_queue_wait
+        while True:
+            delay = self._next_delay(deadline)
+            if not delay:
+                break
+            time.sleep(delay)
+        self.stats['wait_time'] += time.monotonic() - started
+    
+    async def wait_async(self):
+        started = time.monotonic()
+        deadline = started + self.max_queue_wait
+        while True:
+            delay = self._next_delay(deadline)
+            if not delay:
+                break
+            await asyncio.sleep(delay)
+        self.stats['wait_time'] += time.monotonic() - started
+    
+    def pause(self, seconds):
+        """Stop every process from calling the provider for a while (after a 429)"""
+        global _redis_retry_at
+        self.stats['pauses'] += 1
+        self._local.pause(seconds)
+        if time.time() >= _redis_retry_at:
+            try:
+                get_redis().eval(_PAUSE_SCRIPT, 1, self.key, self.rate, seconds)
+            except RedisError as e:
+                _redis_retry_at = time.time() + getattr(settings, 'AIS_RATE_LIMIT_REDIS_RETRY', 30)
+                logger.warning(f"Could not pause shared rate limit of {self.name}: {str(e)}")
+    
+    def snapshot(self):
+        stats = dict(self.stats)
+        stats['wait_time'] = round(stats.get('wait_time', 0.0), 3)
+        stats['rate'] = self.rate
+        stats['burst'] = self.burst
+        return stats
+
+
+_registry_lock = threading.Lock()
+_buckets = {}
+
+
+def get_rate_limiter(name, config):
+    """
+    Process-wide bucket for a provider, shared by its sync and async clients
+    None when the provider config has no 'rate'
+    """
+    if not config.get('rate'):
+        return None
+    key = (os.getpid(), name)
+    with _registry_lock:
+        bucket = _buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(name, config['rate'], config.get('burst'), config.get('max_queue_wait'))
+            _buckets[key] = bucket
+    return bucket
+
+
+def rate_limit_stats():
+    pid = os.getpid()
+    return {name: bucket.snapshot() for (bucket_pid, name), bucket in list(_buckets.items()) if bucket_pid == pid}
@@ -0,0 +1,206 @@
+"""
+Record and replay of provider traffic
+With AIS_RECORD_PATH set (or start_recording() called) every response a
+provider client receives is appended to a JSON lines file, without API keys.
+The provider_standin command serves such files back over HTTP, and setting
+AIS_PROVIDER_STANDIN_URL points every provider client at it, so fetch, parse
+and write throughput can be benchmarked reproducibly without the network.
+"""
+
+import json
+import logging
+import random
+import re
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Query parameters that carry credentials and are never written to disk
+REDACTED_PARAMS = {'key', 'api_key', 'apikey', 'username', 'token'}
+
+# MMSIs (9 digits) in paths and queries match any MMSI on replay
+_MMSI_PATTERN = re.compile(r'\b\d{9}\b')
+
+# MarineTraffic carries the API key in the path: /exportvessel/v:8/<key>/...
+_PATH_KEY_PATTERN = re.compile(r'(/v:\d+/)[^/]+')
+
+
+def _redact_path(path):
+    return _PATH_KEY_PATTERN.sub(r'\1*', path)
+
+
+def _relative_path(base_url, url):
+    """Path of url below the provider's base_url path, without credentials"""
+    base_path = urlsplit(base_url).path.rstrip('/')
+    path = urlsplit(url).path
+    if base_path and path.startswith(base_path):
+        path = path[len(base_path):]
+    return _redact_path(path) or '/'
+
+
+def _query(url):
+    return {name: value for name, value in parse_qsl(urlsplit(url).query) if name.lower() not in REDACTED_PARAMS}
+
+
+class ProviderRecorder:
+    """Appends provider responses to a JSON lines file (thread-safe)"""
+    
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+        self._handle = open(path, 'a', encoding='utf-8')
+    
+    def record(self, provider, base_url, method, url, status, content_type, body, latency):
+        line = json.dumps({
+            'provider': provider,
+            'method': method,
+            'path': _relative_path(base_url, url),
+            'query': _query(url),
+            'status': status,
+            'content_type': content_type,
+            'body': body,
+            'latency_ms': round(latency * 1000, 1),
+        })
+        with self._lock:
+            self._handle.write(line + '\n')
+            self._handle.flush()
+            self.count += 1
+    
+    def close(self):
+        with self._lock:
+            self._handle.close()
+
+
+_recorder = None
+_recorder_lock = threading.Lock()
+
+
+def start_recording(path):
+    global _recorder
+    with _recorder_lock:
+        if _recorder is not None:
+            _recorder.close()
+        _recorder = ProviderRecorder(path)
+    logger.info(f"Recording provider responses to {path}")
+    return _recorder
+
+
+def stop_recording():
+    global _recorder
+    with _recorder_lock:
+        recorder, _recorder = _recorder, None
+    if recorder is not None:
+        recorder.close()
+    return recorder
+
+
+def get_recorder():
+    """Active recorder, started from AIS_RECORD_PATH on first use"""
+    global _recorder
+    if _recorder is None and getattr(settings, 'AIS_RECORD_PATH', ''):
+        with _recorder_lock:
+            if _recorder is None:
+                _recorder = ProviderRecorder(settings.AIS_RECORD_PATH)
+    return _recorder
+
+
+class StandinServer(ThreadingHTTPServer):
+    """Threaded HTTP server for the local provider stand-ins"""
+    daemon_threads = True
+    # Pollers open dozens of connections at once; the default backlog of 5 drops their SYNs
+    request_queue_size = 1024
+    
+    def handle_error(self, request, client_address):
+        # Clients dropping pooled keep-alive connections is routine, not an error
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+
+def _template(value):
+    return _MMSI_PATTERN.sub('*', value)
+
+
+class ReplayIndex:
+    """
+    Recorded responses looked up by request
+    Exact (provider, method, path, query) matches are served first, then
+    responses for the same request with any MMSI, then any response for the
+    same provider path. Repeated requests cycle through what was recorded.
+    """
+    
+    def __init__(self, records):
+        self.exact = {}
+        self.templated = {}
+        self.by_path = {}
+        self._cursors = {}
+        self._lock = threading.Lock()
+        self.size = 0
+        for record in records:
+            self.add(record)
+    
+    @classmethod
+    def from_files(cls, paths):
+        def records():
+            for path in paths:
+                with open(path, encoding='utf-8') as handle:
+                    for line in handle:
+                        if line.strip():
+                            yield json.loads(line)
+        return cls(records())
+    
+    def _keys(self, provider, method, path, query):
+        path = _redact_path(path)
+        items = sorted(query.items())
+        exact = (provider, method, path, tuple(items))
+        templated = (provider, method, _template(path), tuple((name, _template(value)) for name, value in items))
+        return exact, templated, (provider, method, _template(path))
+    
+    def add(self, record):
+        exact, templated, by_path = self._keys(record['provider'], record.get('method', 'GET'), record['path'], record.get('query') or {})
+        for index, key in ((self.exact, exact), (self.templated, templated), (self.by_path, by_path)):
+            index.setdefault(key, []).append(record)
+        self.size += 1
+    
+    def lookup(self, provider, method, path, query):
+        query = {name: value for name, value in query.items() if name.lower() not in REDACTED_PARAMS}
+        for index, key in zip((self.exact, self.templated, self.by_path), self._keys(provider, method, path, query)):
+            candidates = index.get(key)
+            if candidates:
+                with self._lock:
+                    cursor = self._cursors.get(key, 0)
+                    self._cursors[key] = cursor + 1
+                return candidates[cursor % len(candidates)]
+        return None
+
+
+def scale_payload(body, factor, rng=random):
+    """
+    Grow (or shrink) the largest list in a JSON payload by factor, to test
+    parsing and writing with bigger responses than were recorded
+    """
+    if factor == 1:
+        return body
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return body
+    
+    # The payload itself or one level down: AISHub answers [meta, [vessels]]
+    children = data.values() if isinstance(data, dict) else data if isinstance(data, list) else []
+    lists = [item for item in [*children, data] if isinstance(item, list) and item]
+    if not lists:
+        return body
+    # Ties go to the nested list, so [meta, [vessel, vessel]] grows its vessels
+    largest = max(lists, key=len)
+    count = max(1, int(len(largest) * factor))
+    scaled = [largest[index % len(largest)] for index in range(count)]
+    if factor < 1:
+        scaled = rng.sample(largest, count)
+    largest[:] = scaled
+    return json.dumps(data)
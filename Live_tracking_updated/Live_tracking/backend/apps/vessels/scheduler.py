@@ -0,0 +1,183 @@
+"""
+Frequency-aware polling schedule
+Tracked vessels live in a Redis sorted set scored by the time their next
+poll is due. Each scheduler tick polls only the vessels that are due and
+puts them back at now + their own interval:
+- Vessel.ais_update_frequency by default
+- AIS_SCHEDULER_WATCHED_INTERVAL while a user is viewing the vessel
+- multiplied by AIS_SCHEDULER_STATIONARY_FACTOR when moored or at anchor
+so upstream load follows what users actually watch
+"""
+
+import logging
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from redis.exceptions import RedisError
+
+from apps.core.redis_client import get_redis
+
+logger = logging.getLogger(__name__)
+
+SCHEDULE_KEY = 'ais:poll:schedule'
+WATCHED_KEY = 'ais:poll:watched'
+LOCK_KEY = 'ais:poll:lock'
+SYNC_KEY = 'ais:poll:synced'
+
+STATIONARY_STATUSES = ('moored', 'at_anchor', 'aground')
+
+# Delete the lock only if we still own it
+_RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+_watch_retry_at = 0.0
+
+
+def _decode(members):
+    return [m.decode() if isinstance(m, bytes) else m for m in members]
+
+
+class PollScheduler:
+    """Sorted-set schedule of tracked vessels keyed by next-due time"""
+    
+    def __init__(self, client=None):
+        self.redis = client or get_redis()
+    
+    def acquire(self):
+        """
+        Take the poll lock; returns an owner token, or None when the previous
+        run is still going. The lock expires on its own if a worker dies
+        """
+        token = uuid.uuid4().hex
+        ttl = getattr(settings, 'AIS_SCHEDULER_LOCK_TTL', 300)
+        return token if self.redis.set(LOCK_KEY, token, nx=True, ex=ttl) else None
+    
+    def release(self, token):
+        try:
+            self.redis.eval(_RELEASE_SCRIPT, 1, LOCK_KEY, token)
+        except RedisError as e:
+            logger.warning(f"Could not release poll lock (it will expire): {str(e)}")
+    
+    @contextmanager
+    def lock(self):
+        """Yields True when this run owns the poll lock, False otherwise"""
+        token = self.acquire()
+        try:
+            yield token is not None
+        finally:
+            if token:
+                self.release(token)
+    
+    def needs_sync(self):
+        """True at most once per AIS_SCHEDULER_SYNC_INTERVAL across all workers"""
+        interval = getattr(settings, 'AIS_SCHEDULER_SYNC_INTERVAL', 60)
+        return bool(self.redis.set(SYNC_KEY, 1, nx=True, ex=interval))
+    
+    def sync(self, tracked_mmsis):
+        """Add newly tracked vessels (due now) and drop untracked ones"""
+        tracked = set(tracked_mmsis)
+        scheduled = set(_decode(self.redis.zrange(SCHEDULE_KEY, 0, -1)))
+        added = tracked - scheduled
+        removed = scheduled - tracked
+        
+        pipe = self.redis.pipeline()
+        if removed:
+            pipe.zrem(SCHEDULE_KEY, *removed)
+        if added:
+            pipe.zadd(SCHEDULE_KEY, {mmsi: time.time() for mmsi in added}, nx=True)
+        pipe.execute()
+        if added or removed:
+            logger.info(f"Poll schedule synced: {len(added)} added, {len(removed)} removed, {len(tracked)} scheduled")
+        return len(added), len(removed)
+    
+    def due(self, now=None, limit=None):
+        """MMSIs whose next poll is due, most overdue first"""
+        now = now or time.time()
+        limit = limit or getattr(settings, 'AIS_SCHEDULER_MAX_PER_TICK', 5000)
+        return _decode(self.redis.zrangebyscore(SCHEDULE_KEY, '-inf', now, start=0, num=limit))
+    
+    def watched(self, now=None):
+        now = now or time.time()
+        pipe = self.redis.pipeline()
+        pipe.zremrangebyscore(WATCHED_KEY, '-inf', now)
+        pipe.zrangebyscore(WATCHED_KEY, now, '+inf')
+        return set(_decode(pipe.execute()[1]))
+    
+    def interval(self, vessel, navigational_status=None, watched=False):
+        """Seconds until the next poll of this vessel"""
+        interval = vessel.ais_update_frequency or getattr(settings, 'VESSEL_UPDATE_INTERVAL', 60)
+        if watched:
+            interval = min(interval, getattr(settings, 'AIS_SCHEDULER_WATCHED_INTERVAL', 15))
+        elif (navigational_status or vessel.status) in STATIONARY_STATUSES:
+            interval *= getattr(settings, 'AIS_SCHEDULER_STATIONARY_FACTOR', 5)
+        return max(
+            getattr(settings, 'AIS_SCHEDULER_MIN_INTERVAL', 10),
+            min(interval, getattr(settings, 'AIS_SCHEDULER_MAX_INTERVAL', 1800)),
+        )
+    
+    def reschedule(self, vessels, positions, now=None):
+        """
+        Put polled vessels back at now + interval
+        positions: {mmsi: position_data} from the poll, used for the latest
+        navigational status; vessels that were not found keep their own status
+        """
+        now = now or time.time()
+        watched = self.watched(now)
+        schedule = {}
+        for vessel in vessels:
+            status = (positions.get(vessel.mmsi) or {}).get('navigational_status')
+            interval = self.interval(vessel, status, vessel.mmsi in watched)
+            # Up to 10% jitter keeps vessels added together from staying in lockstep
+            schedule[vessel.mmsi] = now + interval * random.uniform(0.9, 1.0)
+        if schedule:
+            # xx: a vessel untracked while it was being polled stays removed
+            self.redis.zadd(SCHEDULE_KEY, schedule, xx=True)
+        return schedule
+    
+    def stats(self, now=None):
+        now = now or time.time()
+        pipe = self.redis.pipeline()
+        pipe.zcard(SCHEDULE_KEY)
+        pipe.zcount(SCHEDULE_KEY, '-inf', now)
+        pipe.zrange(SCHEDULE_KEY, 0, 0, withscores=True)
+        pipe.zcount(WATCHED_KEY, now, '+inf')
+        scheduled, due, oldest, watched = pipe.execute()
+        return {
+            'scheduled': scheduled,
+            'due': due,
+            'max_lag_seconds': round(max(0.0, now - oldest[0][1]), 1) if oldest else 0.0,
+            'watched': watched,
+        }
+
+
+def mark_watched(mmsis):
+    """
+    Record that a user is looking at these vessels
+    They are polled at the watched interval for AIS_SCHEDULER_WATCH_TTL seconds
+    and pulled forward in the schedule if their next poll is further away
+    """
+    global _watch_retry_at
+    mmsis = [str(mmsi) for mmsi in mmsis if mmsi]
+    now = time.time()
+    if not mmsis or now < _watch_retry_at:
+        return
+    ttl = getattr(settings, 'AIS_SCHEDULER_WATCH_TTL', 300)
+    boost = getattr(settings, 'AIS_SCHEDULER_WATCHED_INTERVAL', 15)
+    try:
+        pipe = get_redis().pipeline()
+        pipe.zadd(WATCHED_KEY, {mmsi: now + ttl for mmsi in mmsis})
+        # lt: only ever move a poll earlier; xx: only vessels that are tracked
+        pipe.zadd(SCHEDULE_KEY, {mmsi: now + boost for mmsi in mmsis}, xx=True, lt=True)
+        pipe.execute()
+    except RedisError as e:
+        # Called from request handlers: do not pay a connect timeout on every view
+        _watch_retry_at = now + getattr(settings, 'AIS_LIVE_PICTURE_RETRY_INTERVAL', 30)
+        logger.warning(f"Could not mark vessels as watched: {str(e)}")
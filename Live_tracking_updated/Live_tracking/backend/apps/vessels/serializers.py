@@ -126,6 +126,24 @@ class VesselPositionSerializer(serializers.ModelSerializer):
         return [float(obj.latitude), float(obj.longitude)]
 
 
+class VesselPositionBulkListSerializer(serializers.ListSerializer):
+    """Validates a whole batch of position updates with one MMSI lookup"""
+    
+    def to_internal_value(self, data):
+        attrs = super().to_internal_value(data)
+        mmsis = {item['mmsi'] for item in attrs}
+        known = set(Vessel.objects.filter(mmsi__in=mmsis).values_list('mmsi', flat=True))
+        if len(known) < len(mmsis):
+            # Raised here rather than in validate() to keep DRF's per-item error layout
+            errors = [
+                {} if item['mmsi'] in known
+                else {'mmsi': [f"Vessel with MMSI {item['mmsi']} not found"]}
+                for item in attrs
+            ]
+            raise serializers.ValidationError(errors)
+        return attrs
+
+
 class VesselPositionBulkSerializer(serializers.Serializer):
     """Serializer for bulk position updates"""
     
@@ -138,11 +156,9 @@ class VesselPositionBulkSerializer(serializers.Serializer):
     navigational_status = serializers.CharField(max_length=50, required=False)
     timestamp = serializers.DateTimeField()
     
-    def validate_mmsi(self, value):
-        """Validate vessel exists"""
-        if not Vessel.objects.filter(mmsi=value).exists():
-            raise serializers.ValidationError(f"Vessel with MMSI {value} not found")
-        return value
+    class Meta:
+        # Vessel existence is checked once per batch, not per item
+        list_serializer_class = VesselPositionBulkListSerializer
 
 
 class VesselNoteSerializer(serializers.ModelSerializer):
@@ -4,6 +4,7 @@ Handles AIS integration and business logic
 """
 
 from django.utils import timezone
+from django.db import connection, transaction
 from django.db.models import Q, Avg, Count
 from decimal import Decimal
 from datetime import timedelta
@@ -12,9 +13,23 @@ import requests
 from django.conf import settings
 
 from .models import Vessel, VesselPosition, VesselNote, VesselRoute
+from .providers import get_provider_client, get_provider_config
+from .provider_health import order_providers, get_remembered_endpoint, remember_endpoint, forget_endpoint
+from .tile_cache import TileCache
+from .weather_grid import WeatherGrid
+from .singleflight import area_flight, position_flight
+from .compression import position_filter
+from .profile_cache import profile_cache
+from .simulator import get_simulator, simulator_enabled
 
 logger = logging.getLogger(__name__)
 
+# Vessel fields refreshed by every position report
+POSITION_UPDATE_FIELDS = [
+    'latitude', 'longitude', 'speed_over_ground',
+    'course_over_ground', 'heading', 'last_position_update'
+]
+
 
 class VesselService:
     """
@@ -110,56 +125,155 @@ class VesselService:
     def update_vessel_position(vessel, position_data):
         """
         Update vessel's current position and create historical record
+        Returns the position as written (without a primary key, see
+        apply_position_batch), or None when the dead-band filter judged it a
+        duplicate of the last stored fix
         """
-        # Update vessel's current position
-        vessel.latitude = position_data['latitude']
-        vessel.longitude = position_data['longitude']
-        vessel.speed_over_ground = position_data.get('speed_over_ground')
-        vessel.course_over_ground = position_data.get('course_over_ground')
-        vessel.heading = position_data.get('heading')
-        vessel.last_position_update = timezone.now()
-        vessel.save(update_fields=[
-            'latitude', 'longitude', 'speed_over_ground',
-            'course_over_ground', 'heading', 'last_position_update'
-        ])
-        
-        # Create historical position record
-        position = VesselPosition.objects.create(
-            vessel=vessel,
-            latitude=position_data['latitude'],
-            longitude=position_data['longitude'],
-            speed_over_ground=position_data.get('speed_over_ground'),
-            course_over_ground=position_data.get('course_over_ground'),
-            heading=position_data.get('heading'),
-            navigational_status=position_data.get('navigational_status'),
-            timestamp=position_data.get('timestamp', timezone.now()),
-            data_source=position_data.get('data_source', 'api')
-        )
+        created = VesselService.apply_position_batch([(vessel, position_data)])
         
         logger.info(f"Updated position for vessel {vessel.vessel_name} (MMSI: {vessel.mmsi})")
-        return position
+        return created[0] if created else None
+    
+    @staticmethod
+    def apply_position_batch(updates):
+        """
+        Apply a batch of (vessel, position_data) pairs in a single transaction
+        One bulk_update for the vessels' current state and one bulk_create
+        for the position history instead of two queries per vessel
+        A vessel row takes the newest fix of the batch unless it already holds
+        a newer one; older fixes only go to the history. History rows the
+        dead-band filter considers duplicates are not stored (see compression.py)
+        Idempotent: a fix already stored for the same (vessel, timestamp) is
+        skipped by the database (ignore_conflicts), so batches can be retried.
+        Returned positions have no primary key
+        """
+        if not updates:
+            return []
+        
+        now = timezone.now()
+        latest = {}
+        positions = []
+        
+        # A vessel may report several times in one batch, in any order: every
+        # report goes to the history, the vessel row only gets the newest one
+        for vessel, position_data in updates:
+            timestamp = position_data.get('timestamp') or now
+            if vessel.pk not in latest or timestamp >= latest[vessel.pk][1]:
+                latest[vessel.pk] = (vessel, timestamp, position_data)
+            
+            positions.append(VesselPosition(
+                vessel=vessel,
+                latitude=position_data['latitude'],
+                longitude=position_data['longitude'],
+                speed_over_ground=position_data.get('speed_over_ground'),
+                course_over_ground=position_data.get('course_over_ground'),
+                heading=position_data.get('heading'),
+                navigational_status=position_data.get('navigational_status'),
+                timestamp=timestamp,
+                data_source=position_data.get('data_source', 'api')
+            ))
+        
+        vessels = []
+        for vessel, timestamp, position_data in latest.values():
+            # Reported times past the time of writing are not trusted
+            fixed_at = min(timestamp, now)
+            if vessel.last_position_update and fixed_at < vessel.last_position_update:
+                continue
+            vessel.latitude = position_data['latitude']
+            vessel.longitude = position_data['longitude']
+            vessel.speed_over_ground = position_data.get('speed_over_ground')
+            vessel.course_over_ground = position_data.get('course_over_ground')
+            vessel.heading = position_data.get('heading')
+            vessel.last_position_update = fixed_at
+            vessels.append(vessel)
+        
+        fixes = [(vessel.pk, position_data) for vessel, position_data in updates]
+        keep = position_filter.filter(fixes)
+        
+        batch_size = getattr(settings, 'AIS_WRITE_BATCH_SIZE', 500)
+        with transaction.atomic():
+            VesselService._write_current_state(vessels)
+            created = VesselPosition.objects.bulk_create(
+                [positions[i] for i in keep], batch_size=batch_size, ignore_conflicts=True
+            )
+            # Only once the caller's outermost transaction commits: a rolled back fix is no reference
+            stored = [fixes[i] for i in keep]
+            transaction.on_commit(lambda: position_filter.remember(stored))
+        
+        # ignore_conflicts does not report which rows were inserted, so this is what was sent, not what was new
+        logger.info(
+            f"Applied position batch: {len(vessels)} of {len(latest)} vessels updated, {len(created)} positions submitted "
+            f"(any already stored are dropped by the database), {len(positions) - len(created)} unchanged fixes skipped"
+        )
+        return created
+    
+    @staticmethod
+    def _write_current_state(vessels):
+        """
+        Write POSITION_UPDATE_FIELDS for many vessels with one executemany
+        Django's bulk_update builds a CASE expression per field and row,
+        which dominates the cost of large batches. Rows that meanwhile got a
+        newer fix from another writer are left alone
+        """
+        if not vessels:
+            return
+        
+        ops = connection.ops
+        fields = [Vessel._meta.get_field(name) for name in POSITION_UPDATE_FIELDS]
+        assignments = ', '.join(f"{ops.quote_name(field.column)} = %s" for field in fields)
+        fixed_at = ops.quote_name(fields[-1].column)  # last_position_update
+        sql = (
+            f"UPDATE {ops.quote_name(Vessel._meta.db_table)} SET {assignments} "
+            f"WHERE {ops.quote_name(Vessel._meta.pk.column)} = %s AND ({fixed_at} IS NULL OR {fixed_at} <= %s)"
+        )
+        rows = [
+            [field.get_db_prep_save(getattr(vessel, field.attname), connection) for field in fields]
+            + [vessel.pk, fields[-1].get_db_prep_save(vessel.last_position_update, connection)]
+            for vessel in vessels
+        ]
+        with connection.cursor() as cursor:
+            cursor.executemany(sql, rows)
     
     @staticmethod
     def bulk_update_positions(position_data_list):
         """
         Bulk update vessel positions from AIS data
+        One MMSI lookup for the whole batch, then apply_position_batch writes
+        all rows in a single transaction. If that fails the batch is retried
+        row by row so errors are still reported per MMSI
+        'updated' counts accepted fixes, 'stored' the history rows submitted
+        (fixes the dead-band filter dropped are accepted but not stored)
         """
         updated_count = 0
+        stored_count = 0
         errors = []
         
+        mmsis = {data['mmsi'] for data in position_data_list}
+        vessels = {v.mmsi: v for v in Vessel.objects.filter(mmsi__in=mmsis)}
+        
+        updates = []
         for data in position_data_list:
-            try:
-                vessel = Vessel.objects.get(mmsi=data['mmsi'])
-                VesselService.update_vessel_position(vessel, data)
-                updated_count += 1
-            except Vessel.DoesNotExist:
+            vessel = vessels.get(data['mmsi'])
+            if vessel is None:
                 errors.append(f"Vessel with MMSI {data['mmsi']} not found")
-            except Exception as e:
-                errors.append(f"Error updating {data.get('mmsi')}: {str(e)}")
-                logger.error(f"Error in bulk update: {str(e)}")
+            else:
+                updates.append((vessel, data))
         
-        logger.info(f"Bulk position update: {updated_count} successful, {len(errors)} errors")
-        return {'updated': updated_count, 'errors': errors}
+        try:
+            stored_count = len(VesselService.apply_position_batch(updates))
+            updated_count = len(updates)
+        except Exception as e:
+            logger.error(f"Error in bulk update, retrying {len(updates)} rows individually: {str(e)}")
+            for vessel, data in updates:
+                try:
+                    stored_count += len(VesselService.apply_position_batch([(vessel, data)]))
+                    updated_count += 1
+                except Exception as e:
+                    errors.append(f"Error updating {data.get('mmsi')}: {str(e)}")
+                    logger.error(f"Error in bulk update: {str(e)}")
+        
+        logger.info(f"Bulk position update: {updated_count} successful ({stored_count} stored), {len(errors)} errors")
+        return {'updated': updated_count, 'stored': stored_count, 'errors': errors}
     
     @staticmethod
     def get_vessels_in_area(min_lat, max_lat, min_lon, max_lon):
@@ -214,30 +328,34 @@ class AISIntegrationService:
         self.api_key = settings.MARINETRAFFIC_API_KEY
         self.marinesia_api_key = getattr(settings, 'MARINESIA_API_KEY', '')
         self.stormglass_api_key = getattr(settings, 'STORMGLASS_API_KEY', '')
-        self.base_url = 'https://services.marinetraffic.com/api'
-        self.marinesia_url = 'https://api.marinesia.com/api/v1'
-        self.aishub_url = 'http://data.aishub.net/ws.php'
-        self.aisstream_url = 'https://stream.aisstream.io/v0'
-        self.stormglass_url = 'https://api.stormglass.io/v2'
+        self.base_url = get_provider_config('marinetraffic')['base_url']
+        self.marinesia_url = get_provider_config('marinesia')['base_url']
+        self.aishub_url = get_provider_config('aishub')['base_url']
+        self.aisstream_url = getattr(settings, 'AISSTREAM_URL', 'wss://stream.aisstream.io/v0/stream')
+        self.stormglass_url = get_provider_config('stormglass')['base_url']
+        self._tile_cache = None
+        self._weather_grid = None
+    
+    def _http(self, provider):
+        """Pooled keep-alive client for a provider (shared by the whole process)"""
+        return get_provider_client(provider)
     
     def fetch_vessel_position(self, mmsi):
         """
         Fetch current position for a vessel by MMSI
-        Tries MarineSia (free) first, then AISHub, then MarineTraffic
+        Concurrent lookups of the same MMSI share one upstream fetch
         """
-        # Try MarineSia first (FREE API - Recommended)
-        position = self._fetch_from_marinesia(mmsi)
-        if position:
-            return position
-        
-        # Try AISHub (FREE - No API key required)
-        position = self._fetch_from_aishub(mmsi)
-        if position:
-            return position
-        
-        # Try MarineTraffic if API key is configured
-        if self.api_key:
-            position = self._fetch_from_marinetraffic(mmsi)
+        return position_flight.do(str(mmsi), lambda: self._fetch_vessel_position(mmsi))
+    
+    def _fetch_vessel_position(self, mmsi):
+        """
+        Walks the provider chain (MarineSia, AISHub, MarineTraffic) ordered by
+        recent health: providers with an open circuit breaker are skipped and
+        a consistently faster/more reliable provider is tried first
+        """
+        fetchers = self._position_fetchers()
+        for provider in self.position_chain():
+            position = fetchers[provider](mmsi)
             if position:
                 return position
         
@@ -245,13 +363,35 @@ class AISIntegrationService:
         logger.warning(f"Using mock data for MMSI {mmsi}")
         return self._mock_vessel_position(mmsi)
     
+    def position_chain(self):
+        """Per-MMSI provider chain ordered by provider health"""
+        if simulator_enabled():
+            return ['simulator']
+        chain = ['marinesia', 'aishub']
+        # MarineTraffic only if API key is configured
+        if self.api_key:
+            chain.append('marinetraffic')
+        return order_providers(chain)
+    
+    def _position_fetchers(self):
+        return {
+            'marinesia': self._fetch_from_marinesia,
+            'aishub': self._fetch_from_aishub,
+            'marinetraffic': self._fetch_from_marinetraffic,
+            'simulator': self._fetch_from_simulator,
+        }
+    
+    def _fetch_from_simulator(self, mmsi):
+        """Position from the in-process fleet simulator (AIS_SIMULATOR_ENABLED)"""
+        return get_simulator().position(mmsi)
+    
     def _fetch_from_marinesia(self, mmsi):
         """
         Fetch vessel data from MarineSia API (FREE service)
         API Docs: https://api.marinesia.com/redoc
         Endpoints:
         - GET /api/v1/vessel/{MMSI}/location/latest - Get latest position
-        - GET /api/v1/vessel/{MMSI}/profile - Get vessel profile
+        - GET /api/v1/vessel/{MMSI}/profile - Get vessel profile (cached, see profile_cache.py)
         """
         try:
             # Fetch latest location
@@ -260,144 +400,228 @@ class AISIntegrationService:
             if self.marinesia_api_key:
                 params['key'] = self.marinesia_api_key
             
-            response = requests.get(url, params=params, timeout=10)
+            response = self._http('marinesia').get(url, params=params)
             response.raise_for_status()
             
             location_data = response.json()
             
-            # Fetch vessel profile for additional details
-            profile_data = None
-            try:
-                profile_url = f"{self.marinesia_url}/vessel/{mmsi}/profile"
-                profile_params = {}
-                if self.marinesia_api_key:
-                    profile_params['key'] = self.marinesia_api_key
-                
-                profile_response = requests.get(profile_url, params=profile_params, timeout=10)
-                if profile_response.status_code == 200:
-                    profile_data = profile_response.json()
-            except Exception as e:
-                logger.debug(f"Could not fetch profile for MMSI {mmsi}: {str(e)}")
-            
-            if location_data:
-                return {
-                    'mmsi': str(mmsi),
-                    'latitude': float(location_data.get('latitude', 0)),
-                    'longitude': float(location_data.get('longitude', 0)),
-                    'speed_over_ground': float(location_data.get('speed', 0)) if location_data.get('speed') else 0,
-                    'course_over_ground': float(location_data.get('course', 0)) if location_data.get('course') else 0,
-                    'heading': int(location_data.get('heading', 0)) if location_data.get('heading') else None,
-                    'navigational_status': location_data.get('status', 'unknown'),
-                    'timestamp': timezone.now(),
-                    'data_source': 'marinesia',
-                    'vessel_name': profile_data.get('name', '') if profile_data else location_data.get('name', ''),
-                    'vessel_type': profile_data.get('type', '') if profile_data else '',
-                    'destination': location_data.get('destination', ''),
-                    'eta': location_data.get('eta', '')
-                }
+            # Static profile (name, type) comes from the long-lived profile cache
+            profile_data = profile_cache.get(mmsi, self._fetch_marinesia_profile)
             
-            return None
+            return self._parse_marinesia_position(mmsi, location_data, profile_data)
             
         except Exception as e:
             logger.debug(f"Error fetching from MarineSia for MMSI {mmsi}: {str(e)}")
             return None
     
+    def _fetch_marinesia_profile(self, mmsi):
+        """
+        Vessel profile from MarineSia; {} when it has none for this MMSI
+        Transport errors raise so they are not cached as a missing profile
+        """
+        url = f"{self.marinesia_url}/vessel/{mmsi}/profile"
+        params = {}
+        if self.marinesia_api_key:
+            params['key'] = self.marinesia_api_key
+        
+        response = self._http('marinesia').get(url, params=params)
+        if response.status_code == 404:
+            return {}
+        response.raise_for_status()
+        return response.json() or {}
+    
+    def _parse_marinesia_position(self, mmsi, location_data, profile_data=None):
+        """
+        Convert a MarineSia latest-location (and optional profile) payload
+        into the position dict accepted by VesselService.update_vessel_position
+        """
+        if not location_data:
+            return None
+        
+        return {
+            'mmsi': str(mmsi),
+            'latitude': float(location_data.get('latitude', 0)),
+            'longitude': float(location_data.get('longitude', 0)),
+            'speed_over_ground': float(location_data.get('speed', 0)) if location_data.get('speed') else 0,
+            'course_over_ground': float(location_data.get('course', 0)) if location_data.get('course') else 0,
+            'heading': int(location_data.get('heading', 0)) if location_data.get('heading') else None,
+            'navigational_status': location_data.get('status', 'unknown'),
+            'timestamp': timezone.now(),
+            'data_source': 'marinesia',
+            'vessel_name': profile_data.get('name', '') if profile_data else location_data.get('name', ''),
+            'vessel_type': profile_data.get('type', '') if profile_data else '',
+            'destination': location_data.get('destination', ''),
+            'eta': location_data.get('eta', '')
+        }
+    
     def _fetch_from_aishub(self, mmsi):
         """
         Fetch vessel data from AISHub (FREE service)
         API Docs: http://www.aishub.net/api
         """
         try:
-            params = {
-                'username': 'AH_DEMO',  # Free demo access
-                'format': 1,  # JSON format
-                'output': 'json',
-                'compress': 0,
-                'mmsi': mmsi
-            }
+            params = self._aishub_params(mmsi=mmsi)
             
-            response = requests.get(self.aishub_url, params=params, timeout=10)
+            response = self._http('aishub').get(self.aishub_url, params=params)
             response.raise_for_status()
             
-            data = response.json()
-            
-            if data and data.get('ERROR') == 'False' and len(data.get('data', [])) > 0:
-                vessel_data = data['data'][0]
-                return {
-                    'mmsi': vessel_data.get('MMSI'),
-                    'latitude': float(vessel_data.get('LATITUDE', 0)),
-                    'longitude': float(vessel_data.get('LONGITUDE', 0)),
-                    'speed_over_ground': float(vessel_data.get('SOG', 0)),
-                    'course_over_ground': float(vessel_data.get('COG', 0)),
-                    'heading': int(vessel_data.get('HEADING', 0)),
-                    'navigational_status': vessel_data.get('NAVSTAT', 'unknown'),
-                    'timestamp': timezone.now(),
-                    'data_source': 'aishub',
-                    'vessel_name': vessel_data.get('NAME', ''),
-                    'vessel_type': vessel_data.get('TYPE', ''),
-                    'destination': vessel_data.get('DESTINATION', ''),
-                    'eta': vessel_data.get('ETA', '')
-                }
-            
-            return None
+            return self._parse_aishub_position(response.json())
             
         except Exception as e:
             logger.error(f"Error fetching from AISHub for MMSI {mmsi}: {str(e)}")
             return None
     
+    def _aishub_params(self, **filters):
+        """Build AISHub query parameters (demo account, JSON output)"""
+        params = {
+            'username': 'AH_DEMO',  # Free demo access
+            'format': 1,  # JSON format
+            'output': 'json',
+            'compress': 0,
+        }
+        params.update(filters)
+        return params
+    
+    def _parse_aishub_position(self, data):
+        """
+        Convert an AISHub single-vessel response into a position dict
+        """
+        if data and data.get('ERROR') == 'False' and len(data.get('data', [])) > 0:
+            vessel_data = data['data'][0]
+            return {
+                'mmsi': vessel_data.get('MMSI'),
+                'latitude': float(vessel_data.get('LATITUDE', 0)),
+                'longitude': float(vessel_data.get('LONGITUDE', 0)),
+                'speed_over_ground': float(vessel_data.get('SOG', 0)),
+                'course_over_ground': float(vessel_data.get('COG', 0)),
+                'heading': int(vessel_data.get('HEADING', 0)),
+                'navigational_status': vessel_data.get('NAVSTAT', 'unknown'),
+                'timestamp': timezone.now(),
+                'data_source': 'aishub',
+                'vessel_name': vessel_data.get('NAME', ''),
+                'vessel_type': vessel_data.get('TYPE', ''),
+                'destination': vessel_data.get('DESTINATION', ''),
+                'eta': vessel_data.get('ETA', '')
+            }
+        
+        return None
+    
     def _fetch_from_marinetraffic(self, mmsi):
         """
         Fetch vessel data from MarineTraffic API (requires paid API key)
         """
         try:
             url = f"{self.base_url}/exportvessel/v:8/{self.api_key}/timespan:10/mmsi:{mmsi}/protocol:json"
-            response = requests.get(url, timeout=10)
+            response = self._http('marinetraffic').get(url)
             response.raise_for_status()
             
-            data = response.json()
-            if data and len(data) > 0:
-                vessel_data = data[0]
-                return {
-                    'mmsi': vessel_data.get('MMSI'),
-                    'latitude': vessel_data.get('LAT'),
-                    'longitude': vessel_data.get('LON'),
-                    'speed_over_ground': vessel_data.get('SPEED'),
-                    'course_over_ground': vessel_data.get('COURSE'),
-                    'heading': vessel_data.get('HEADING'),
-                    'navigational_status': vessel_data.get('STATUS'),
-                    'timestamp': timezone.now(),
-                    'data_source': 'marinetraffic'
-                }
-            
-            return None
+            return self._parse_marinetraffic_position(response.json())
             
         except Exception as e:
             logger.error(f"Error fetching from MarineTraffic for MMSI {mmsi}: {str(e)}")
             return None
     
+    def _parse_marinetraffic_position(self, data):
+        """
+        Convert a MarineTraffic exportvessel response into a position dict
+        """
+        if data and len(data) > 0:
+            vessel_data = data[0]
+            return {
+                'mmsi': vessel_data.get('MMSI'),
+                'latitude': vessel_data.get('LAT'),
+                'longitude': vessel_data.get('LON'),
+                'speed_over_ground': vessel_data.get('SPEED'),
+                'course_over_ground': vessel_data.get('COURSE'),
+                'heading': vessel_data.get('HEADING'),
+                'navigational_status': vessel_data.get('STATUS'),
+                'timestamp': timezone.now(),
+                'data_source': 'marinetraffic'
+            }
+        
+        return None
+    
     def fetch_vessels_in_area(self, min_lat, max_lat, min_lon, max_lon):
         """
         Fetch all vessels in a geographic area
+        Concurrent requests for the same bbox share one fetch
+        """
+        key = f"{float(min_lat):.4f}:{float(max_lat):.4f}:{float(min_lon):.4f}:{float(max_lon):.4f}"
+        return area_flight.do(key, lambda: self._fetch_vessels_in_area(min_lat, max_lat, min_lon, max_lon))
+    
+    def _fetch_vessels_in_area(self, min_lat, max_lat, min_lon, max_lon):
+        """
         Uses existing static data first, then enhances with MarineSia/AISHub APIs
+        Provider results are served from the area tile cache when enabled
         StormGlass API is used for weather data enhancement (not vessel positions)
         """
+        use_tile_cache = getattr(settings, 'AIS_TILE_CACHE_ENABLED', True)
+        vessels = self.fetch_area_records(min_lat, max_lat, min_lon, max_lon, use_tile_cache=use_tile_cache)
+        
+        # Enhance with weather data from StormGlass if API key is available
+        if vessels and self.stormglass_api_key:
+            try:
+                vessels = self._enhance_vessels_with_weather(vessels, min_lat, max_lat, min_lon, max_lon)
+            except Exception as e:
+                logger.warning(f"Failed to enhance with StormGlass weather data: {str(e)}")
+        
+        logger.info(f"Total {len(vessels)} vessels in area (static + API data)")
+        return vessels
+    
+    def fetch_area_records(self, min_lat, max_lat, min_lon, max_lon, use_tile_cache=True):
+        """
+        Database vessels in the area merged with provider results (no weather)
+        Database records win when a provider reports the same MMSI
+        """
         # Start with existing static/database vessels in the area
         vessels = self._fetch_static_vessels_in_area(min_lat, max_lat, min_lon, max_lon)
         
+        if use_tile_cache:
+            provider_vessels = self.tile_cache.get(min_lat, max_lat, min_lon, max_lon)
+        else:
+            provider_vessels = self._fetch_provider_area(min_lat, max_lat, min_lon, max_lon)
+        
+        # Merge with static vessels (avoid duplicates by MMSI)
+        existing_mmsis = {v.get('mmsi') for v in vessels}
+        for pv in provider_vessels:
+            if pv.get('mmsi') not in existing_mmsis:
+                existing_mmsis.add(pv.get('mmsi'))
+                vessels.append(pv)
+        
+        return vessels
+    
+    @property
+    def tile_cache(self):
+        if self._tile_cache is None:
+            self._tile_cache = TileCache(self._fetch_provider_area)
+        return self._tile_cache
+    
+    @property
+    def weather_grid(self):
+        if self._weather_grid is None:
+            self._weather_grid = WeatherGrid(self._fetch_weather_from_stormglass)
+        return self._weather_grid
+    
+    def _fetch_provider_area(self, min_lat, max_lat, min_lon, max_lon):
+        """
+        Query every area-capable provider for a bbox and merge the results
+        MarineSia first (FREE, recommended), then AISHub, then MarineTraffic if configured
+        The fleet simulator replaces all of them when AIS_SIMULATOR_ENABLED is set
+        """
+        if simulator_enabled():
+            return get_simulator().area_records(min_lat, max_lat, min_lon, max_lon)
+        
+        vessels = []
+        
         # Try to enhance with MarineSia API data (FREE API - Recommended)
         marinesia_vessels = self._fetch_area_from_marinesia(min_lat, max_lat, min_lon, max_lon)
         if marinesia_vessels:
             logger.info(f"Fetched {len(marinesia_vessels)} vessels from MarineSia")
-            # Merge with static vessels (avoid duplicates by MMSI)
-            existing_mmsis = {v.get('mmsi') for v in vessels}
-            for mv in marinesia_vessels:
-                if mv.get('mmsi') not in existing_mmsis:
-                    vessels.append(mv)
+            vessels.extend(marinesia_vessels)
         
         # Try AISHub (FREE) - Additional source for real vessel positions
         aishub_vessels = self._fetch_area_from_aishub(min_lat, max_lat, min_lon, max_lon)
         if aishub_vessels:
-            logger.info(f"Fetched {len(aishub_vessels)} vessels from AISHub")
             # Merge with existing vessels (avoid duplicates by MMSI)
             existing_mmsis = {v.get('mmsi') for v in vessels}
             for av in aishub_vessels:
@@ -413,14 +637,6 @@ class AISIntegrationService:
                     if mtv.get('mmsi') not in existing_mmsis:
                         vessels.append(mtv)
         
-        # Enhance with weather data from StormGlass if API key is available
-        if vessels and self.stormglass_api_key:
-            try:
-                vessels = self._enhance_vessels_with_weather(vessels, min_lat, max_lat, min_lon, max_lon)
-            except Exception as e:
-                logger.warning(f"Failed to enhance with StormGlass weather data: {str(e)}")
-        
-        logger.info(f"Total {len(vessels)} vessels in area (static + API data)")
         return vessels
     
     def _fetch_static_vessels_in_area(self, min_lat, max_lat, min_lon, max_lon):
@@ -444,6 +660,7 @@ class AISIntegrationService:
             for vessel in db_vessels:
                 if vessel.latitude and vessel.longitude:
                     formatted_vessels.append({
+                        'id': vessel.id,
                         'mmsi': str(vessel.mmsi),
                         'name': vessel.vessel_name,
                         'latitude': float(vessel.latitude),
@@ -482,6 +699,14 @@ class AISIntegrationService:
                 f"{self.marinesia_url}/vessels",
             ]
             
+            # Reuse the endpoint that worked last time instead of probing all three
+            remembered = get_remembered_endpoint('marinesia_area')
+            if remembered == '':
+                logger.debug("No MarineSia area endpoint available recently, skipping")
+                return []
+            if remembered:
+                endpoints_to_try = [remembered]
+            
             params = {
                 'min_lat': min_lat,
                 'max_lat': max_lat,
@@ -493,7 +718,7 @@ class AISIntegrationService:
             
             for url in endpoints_to_try:
                 try:
-                    response = requests.get(url, params=params, timeout=10)
+                    response = self._http('marinesia').get(url, params=params)
                     if response.status_code == 200:
                         data = response.json()
                         
@@ -507,6 +732,9 @@ class AISIntegrationService:
                         else:
                             continue
                         
+                        if url != remembered:
+                            remember_endpoint('marinesia_area', url)
+                        
                         formatted_vessels = []
                         for vessel_data in vessels_list:
                             try:
@@ -543,11 +771,16 @@ class AISIntegrationService:
                         
                         if formatted_vessels:
                             logger.info(f"Fetched {len(formatted_vessels)} vessels from MarineSia")
-                            return formatted_vessels
+                        return formatted_vessels
+                    elif url == remembered and response.status_code != 429 and response.status_code < 500:
+                        # The remembered endpoint no longer exists - probe all candidates next time
+                        forget_endpoint('marinesia_area')
                 except requests.exceptions.RequestException:
                     continue
             
             # If no endpoint works, return empty (will fallback to AISHub)
+            if not remembered:
+                remember_endpoint('marinesia_area', '')
             logger.debug("MarineSia area endpoint not available, will use AISHub fallback")
             return []
             
@@ -555,109 +788,23 @@ class AISIntegrationService:
             logger.debug(f"Error fetching area from MarineSia: {str(e)}")
             return []
     
-    def _enhance_vessels_with_weather(self, vessels, min_lat, max_lat, min_lon, max_lon):
-        """
-        Enhance vessel data with weather information from StormGlass API
-        Note: StormGlass provides weather data, not vessel positions
-        """
-        try:
-            # Get weather data for the center of the area
-            center_lat = (min_lat + max_lat) / 2
-            center_lon = (min_lon + max_lon) / 2
-            
-            weather = self._fetch_weather_from_stormglass(center_lat, center_lon)
-            
-            if weather:
-                # Add weather info to each vessel
-                for vessel in vessels:
-                    vessel['weather'] = weather
-                    vessel['weather_source'] = 'stormglass'
-                logger.info("Enhanced vessels with StormGlass weather data")
-            
-            return vessels
-        except Exception as e:
-            logger.warning(f"Error enhancing vessels with weather: {str(e)}")
-            return vessels
-    
-    def _fetch_weather_from_stormglass(self, lat, lon):
-        """
-        Fetch marine weather data from StormGlass API
-        API Documentation: https://docs.stormglass.io/
-        """
-        if not self.stormglass_api_key:
-            return None
-        
-        try:
-            url = f"{self.stormglass_url}/weather/point"
-            params = {
-                'lat': lat,
-                'lng': lon,
-                'params': 'waveHeight,waveDirection,windSpeed,windDirection,airTemperature,waterTemperature',
-                'source': 'noaa'
-            }
-            headers = {
-                'Authorization': self.stormglass_api_key
-            }
-            
-            response = requests.get(url, params=params, headers=headers, timeout=10)
-            response.raise_for_status()
-            
-            data = response.json()
-            if data and 'hours' in data and len(data['hours']) > 0:
-                current = data['hours'][0]
-                return {
-                    'wave_height': current.get('waveHeight', {}).get('noaa', 0),
-                    'wave_direction': current.get('waveDirection', {}).get('noaa', 0),
-                    'wind_speed': current.get('windSpeed', {}).get('noaa', 0),
-                    'wind_direction': current.get('windDirection', {}).get('noaa', 0),
-                    'air_temperature': current.get('airTemperature', {}).get('noaa', 0),
-                    'water_temperature': current.get('waterTemperature', {}).get('noaa', 0),
-                }
-            
-            return None
-        except Exception as e:
-            logger.warning(f"Error fetching weather from StormGlass: {str(e)}")
-            return None
-    
     def _fetch_area_from_aishub(self, min_lat, max_lat, min_lon, max_lon):
         """
         Fetch vessels in an area from AISHub (FREE service)
         Enhanced to fetch more comprehensive real-time AIS data
         """
         try:
-            params = {
-                'username': 'AH_DEMO',  # Free demo access
-                'format': 1,  # JSON format
-                'output': 'json',
-                'compress': 0,
-                'latmin': min_lat,
-                'latmax': max_lat,
-                'lonmin': min_lon,
-                'lonmax': max_lon
-            }
+            params = self._aishub_params(
+                latmin=min_lat,
+                latmax=max_lat,
+                lonmin=min_lon,
+                lonmax=max_lon
+            )
             
-            response = requests.get(self.aishub_url, params=params, timeout=30)
+            response = self._http('aishub').get(self.aishub_url, params=params, timeout=30)
             response.raise_for_status()
             
-            data = response.json()
-            formatted_vessels = []
-            
-            # AISHub returns data in different formats
-            if isinstance(data, dict):
-                # Format 1: {'ERROR': 'False', 'data': [...]}
-                if data.get('ERROR') == 'False':
-                    vessels_data = data.get('data', [])
-                    if isinstance(vessels_data, list):
-                        for vessel in vessels_data:
-                            parsed = self._parse_aishub_vessel(vessel)
-                            if parsed:
-                                formatted_vessels.append(parsed)
-            elif isinstance(data, list):
-                # Format 2: Direct list of vessels
-                for vessel in data:
-                    parsed = self._parse_aishub_vessel(vessel)
-                    if parsed:
-                        formatted_vessels.append(parsed)
+            formatted_vessels = self._parse_aishub_area(response.json())
             
             if formatted_vessels:
                 logger.info(f"Fetched {len(formatted_vessels)} vessels from AISHub")
@@ -668,6 +815,31 @@ class AISIntegrationService:
             logger.error(f"Error fetching area from AISHub: {str(e)}")
             return []
     
+    def _parse_aishub_area(self, data):
+        """
+        Parse an AISHub area response into a list of area records
+        """
+        formatted_vessels = []
+        
+        # AISHub returns data in different formats
+        if isinstance(data, dict):
+            # Format 1: {'ERROR': 'False', 'data': [...]}
+            if data.get('ERROR') == 'False':
+                vessels_data = data.get('data', [])
+                if isinstance(vessels_data, list):
+                    for vessel in vessels_data:
+                        parsed = self._parse_aishub_vessel(vessel)
+                        if parsed:
+                            formatted_vessels.append(parsed)
+        elif isinstance(data, list):
+            # Format 2: Direct list of vessels
+            for vessel in data:
+                parsed = self._parse_aishub_vessel(vessel)
+                if parsed:
+                    formatted_vessels.append(parsed)
+        
+        return formatted_vessels
+    
     def _parse_aishub_vessel(self, vessel_data):
         """
         Parse a single AISHub vessel record
@@ -706,6 +878,27 @@ class AISIntegrationService:
             logger.debug(f"Error parsing AISHub vessel data: {str(e)}")
             return None
     
+    def _area_record_to_position(self, record):
+        """
+        Convert an area record (as returned by the _fetch_area_* methods)
+        into the position dict accepted by VesselService.update_vessel_position
+        """
+        return {
+            'mmsi': str(record.get('mmsi')),
+            'latitude': record['latitude'],
+            'longitude': record['longitude'],
+            'speed_over_ground': record.get('speed'),
+            'course_over_ground': record.get('course'),
+            'heading': record.get('heading'),
+            'navigational_status': record.get('status'),
+            'timestamp': timezone.now(),
+            'data_source': record.get('source', 'ais'),
+            'vessel_name': record.get('name', ''),
+            'vessel_type': record.get('vessel_type', ''),
+            'destination': record.get('destination') or '',
+            'eta': record.get('eta', '')
+        }
+    
     def _map_nav_status(self, navstat_code):
         """Map AIS navigational status code to readable status"""
         status_map = {
@@ -749,35 +942,53 @@ class AISIntegrationService:
             url += f"minlat:{min_lat}/maxlat:{max_lat}/minlon:{min_lon}/maxlon:{max_lon}/"
             url += "protocol:json"
             
-            response = requests.get(url, timeout=30)
+            response = self._http('marinetraffic').get(url, timeout=30)
             response.raise_for_status()
             
-            return response.json()
+            return self._parse_marinetraffic_area(response.json())
             
         except Exception as e:
             logger.error(f"Error fetching area from MarineTraffic: {str(e)}")
             return []
     
+    def _parse_marinetraffic_area(self, data):
+        """
+        Parse a MarineTraffic exportvessels response into area records
+        (same shape as _parse_aishub_area)
+        """
+        formatted_vessels = []
+        for row in data or []:
+            try:
+                lat = float(row.get('LAT'))
+                lon = float(row.get('LON'))
+            except (TypeError, ValueError, AttributeError):
+                continue
+            formatted_vessels.append({
+                'mmsi': str(row.get('MMSI', '')),
+                'name': (row.get('SHIPNAME', '') or '').strip() or f"Vessel {row.get('MMSI', '')}",
+                'latitude': lat,
+                'longitude': lon,
+                'speed': float(row.get('SPEED', 0) or 0),
+                'course': float(row.get('COURSE', 0) or 0),
+                'heading': int(row.get('HEADING')) if row.get('HEADING') not in (None, '') else None,
+                'status': self._map_nav_status(row.get('STATUS', '')),
+                'vessel_type': self._map_vessel_type(row.get('SHIPTYPE', '')),
+                'destination': (row.get('DESTINATION', '') or '').strip() or None,
+                'eta': row.get('ETA', '') or '',
+                'timestamp': row.get('TIMESTAMP'),
+                'source': 'marinetraffic'
+            })
+        return formatted_vessels
+    
     def _enhance_vessels_with_weather(self, vessels, min_lat, max_lat, min_lon, max_lon):
         """
         Enhance vessel data with weather information from StormGlass API
+        Each vessel gets weather interpolated at its own position from the
+        cached weather grid; only grid nodes not cached yet cost API calls
         Note: StormGlass provides weather data, not vessel positions
         """
         try:
-            # Get weather data for the center of the area
-            center_lat = (min_lat + max_lat) / 2
-            center_lon = (min_lon + max_lon) / 2
-            
-            weather = self._fetch_weather_from_stormglass(center_lat, center_lon)
-            
-            if weather:
-                # Add weather info to each vessel
-                for vessel in vessels:
-                    vessel['weather'] = weather
-                    vessel['weather_source'] = 'stormglass'
-                logger.info("Enhanced vessels with StormGlass weather data")
-            
-            return vessels
+            return self.weather_grid.enhance(vessels)
         except Exception as e:
             logger.warning(f"Error enhancing vessels with weather: {str(e)}")
             return vessels
@@ -802,7 +1013,7 @@ class AISIntegrationService:
                 'Authorization': self.stormglass_api_key
             }
             
-            response = requests.get(url, params=params, headers=headers, timeout=10)
+            response = self._http('stormglass').get(url, params=params, headers=headers)
             response.raise_for_status()
             
             data = response.json()
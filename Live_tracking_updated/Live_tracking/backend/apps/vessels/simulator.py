@@ -0,0 +1,433 @@
+"""
+Deterministic fleet simulator
+Synthetic vessels shuttle along great-circle shipping lanes between real
+ports, with per-vessel speed, keep-right lane offset and anchorage/berth
+stops. A vessel's state is a pure function of (seed, MMSI, time), so every
+process - web, workers, the fleet_standin HTTP server - sees the same fleet
+without sharing state, and tracks are continuous at any polling rate.
+
+Used as an in-process provider (AIS_SIMULATOR_ENABLED) or over HTTP through
+manage.py fleet_standin and AIS_PROVIDER_STANDIN_URL.
+"""
+
+import logging
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_NM = 3440.065
+
+# Simulation time starts here; with AIS_SIMULATOR_TIME_SCALE > 1 it runs faster than real time
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc).timestamp()
+
+PORTS = {
+    'ROTTERDAM': (51.95, 4.05),
+    'HAMBURG': (53.55, 9.95),
+    'DOVER': (51.10, 1.35),
+    'CALAIS': (50.97, 1.85),
+    'NEW YORK': (40.48, -73.95),
+    'HOUSTON': (29.33, -94.70),
+    'SANTOS': (-23.98, -46.30),
+    'CAPE TOWN': (-33.90, 18.43),
+    'JEBEL ALI': (25.02, 55.05),
+    'SINGAPORE': (1.25, 103.83),
+    'HONG KONG': (22.28, 114.16),
+    'SHANGHAI': (31.23, 121.95),
+    'TOKYO': (35.45, 139.75),
+    'LOS ANGELES': (33.72, -118.27),
+}
+
+# name: (waypoints from the first to the last port, share of the fleet, speed kn, stop hours, lane width nm)
+LANES = {
+    'europe_asia': (
+        ['ROTTERDAM', (51.0, 1.6), (49.9, -2.5), (48.6, -5.8), (43.6, -9.9), (36.0, -6.3), (35.9, -5.4),
+         (37.2, 11.2), (34.0, 24.0), (31.6, 32.3), (29.9, 32.6), (27.5, 34.0), (20.0, 38.6), (12.6, 43.3),
+         (12.3, 47.5), (12.0, 53.5), (8.5, 72.0), (5.9, 80.6), (6.0, 95.0), (3.2, 100.6), 'SINGAPORE'],
+        0.16, (16.0, 22.0), (12, 36), 4.0,
+    ),
+    'intra_asia': (
+        ['SINGAPORE', (2.5, 105.0), (6.5, 107.0), (12.0, 110.0), (20.5, 114.0), 'HONG KONG',
+         (23.0, 117.0), (25.5, 120.5), (29.5, 122.8), 'SHANGHAI'],
+        0.14, (14.0, 20.0), (8, 24), 3.0,
+    ),
+    'gulf_asia': (
+        ['JEBEL ALI', (26.3, 56.1), (25.0, 57.8), (22.6, 60.5), (14.0, 70.0), (5.9, 80.6), (6.0, 95.0),
+         (3.2, 100.6), 'SINGAPORE'],
+        0.10, (12.0, 16.0), (24, 60), 4.0,
+    ),
+    'transpacific': (
+        ['SHANGHAI', (31.0, 126.0), (33.0, 130.0), (34.5, 141.0), (45.0, 170.0), (45.0, -160.0),
+         (38.0, -130.0), 'LOS ANGELES'],
+        0.10, (16.0, 21.0), (24, 48), 6.0,
+    ),
+    'transatlantic': (
+        ['ROTTERDAM', (51.0, 1.6), (49.9, -2.5), (49.3, -6.5), (45.0, -35.0), (41.0, -60.0), 'NEW YORK'],
+        0.10, (15.0, 20.0), (12, 36), 5.0,
+    ),
+    'gulf_europe': (
+        ['HOUSTON', (25.5, -88.0), (23.8, -83.0), (24.3, -80.5), (27.5, -79.6), (35.0, -74.5),
+         (45.0, -40.0), (49.3, -6.5), (49.9, -2.5), (51.0, 1.6), 'ROTTERDAM'],
+        0.08, (13.0, 16.0), (24, 48), 5.0,
+    ),
+    'south_atlantic': (
+        ['SANTOS', (-26.0, -43.0), (-32.0, -10.0), 'CAPE TOWN'],
+        0.06, (12.0, 15.0), (24, 72), 5.0,
+    ),
+    'japan_china': (
+        ['HONG KONG', (22.0, 119.0), (26.0, 123.0), (31.5, 131.0), (33.5, 136.5), (34.6, 139.8), 'TOKYO'],
+        0.08, (15.0, 20.0), (8, 24), 3.0,
+    ),
+    'north_sea_feeder': (
+        ['ROTTERDAM', (52.6, 4.2), (53.7, 6.5), (54.0, 8.2), (53.85, 8.9), 'HAMBURG'],
+        0.10, (11.0, 14.0), (4, 16), 1.5,
+    ),
+    'dover_ferry': (
+        ['DOVER', 'CALAIS'],
+        0.08, (17.0, 21.0), (0.75, 1.5), 0.3,
+    ),
+}
+
+VESSEL_TYPES = ('cargo', 'cargo', 'cargo', 'tanker', 'tanker', 'passenger', 'tug', 'other')
+
+# Share of a port stop spent waiting at the anchorage before berthing
+ANCHORAGE_SHARE = 0.3
+
+# Courses are taken toward the lane this far ahead
+LOOKAHEAD_NM = 10.0
+
+# Knots from the anchorage (2 nm out) to the berth, unless the stop is too short for it
+BERTHING_SPEED = 6.0
+
+STATUSES = np.array(['underway', 'at_anchor', 'moored'])
+UNDERWAY, AT_ANCHOR, MOORED = 0, 1, 2
+
+
+def _unit_vectors(lat, lon):
+    lat, lon = np.radians(lat), np.radians(lon)
+    return np.stack([np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)], axis=-1)
+
+
+def _lat_lon(points):
+    lat = np.degrees(np.arcsin(np.clip(points[..., 2], -1.0, 1.0)))
+    lon = np.degrees(np.arctan2(points[..., 1], points[..., 0]))
+    return lat, lon
+
+
+def _bearing(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    dlon = lon2 - lon1
+    y = np.sin(dlon) * np.cos(lat2)
+    x = np.cos(lat1) * np.sin(lat2) - np.sin(lat1) * np.cos(lat2) * np.cos(dlon)
+    return np.degrees(np.arctan2(y, x)) % 360
+
+
+def _uniform(mmsis, seed, salt):
+    """splitmix64 of (seed, MMSI, salt) as uniforms in [0, 1) - stable across processes"""
+    with np.errstate(over='ignore'):
+        x = mmsis.astype(np.uint64) * np.uint64(0x9E3779B97F4A7C15)
+        x += np.uint64((seed * 1000003 + salt) & 0xFFFFFFFFFFFFFFFF)
+        x ^= x >> np.uint64(30)
+        x *= np.uint64(0xBF58476D1CE4E5B9)
+        x ^= x >> np.uint64(27)
+        x *= np.uint64(0x94D049BB133111EB)
+        x ^= x >> np.uint64(31)
+    return (x >> np.uint64(11)).astype(np.float64) / float(1 << 53)
+
+
+class _Lane:
+    """A polyline of great-circle segments between two ports"""
+    
+    def __init__(self, name, waypoints, share, speed, stop_hours, width_nm):
+        self.name = name
+        self.ports = (waypoints[0], waypoints[-1])
+        coords = np.array([PORTS[point] if isinstance(point, str) else point for point in waypoints], dtype=float)
+        self.points = _unit_vectors(coords[:, 0], coords[:, 1])
+        dots = np.clip(np.sum(self.points[:-1] * self.points[1:], axis=1), -1.0, 1.0)
+        self.segments = np.maximum(np.arccos(dots), 1e-9)  # radians
+        self.cumulative = np.concatenate([[0.0], np.cumsum(self.segments)])
+        self.length_nm = self.cumulative[-1] * EARTH_RADIUS_NM
+        self.share = share
+        self.speed = speed
+        self.stop_hours = stop_hours
+        self.width_nm = width_nm
+    
+    def _point(self, d):
+        """Unit vectors at d radians along the lane, and the segment each lies on"""
+        segment = np.clip(np.searchsorted(self.cumulative, d, side='right') - 1, 0, len(self.segments) - 1)
+        omega = self.segments[segment]
+        f = ((d - self.cumulative[segment]) / omega)[:, None]
+        a, b = self.points[segment], self.points[segment + 1]
+        return (np.sin((1 - f) * omega[:, None]) * a + np.sin(f * omega[:, None]) * b) / np.sin(omega)[:, None], segment
+    
+    def locate(self, distance_nm, forward):
+        """
+        Points at distance_nm from the first port, and the course toward the
+        lane LOOKAHEAD_NM further on, so courses (and the keep-right offset)
+        turn gradually through waypoints instead of jumping
+        """
+        d = np.clip(distance_nm / EARTH_RADIUS_NM, 0.0, self.cumulative[-1])
+        point, segment = self._point(d)
+        ahead = np.clip(d + np.where(forward, 1, -1) * LOOKAHEAD_NM / EARTH_RADIUS_NM, 0.0, self.cumulative[-1])
+        target, _ = self._point(ahead)
+        # At the end of the lane: toward the segment's far end
+        at_end = (np.abs(ahead - d) < 1e-9)[:, None]
+        target = np.where(at_end, np.where(forward[:, None], self.points[segment + 1], self.points[segment]), target)
+        lat, lon = _lat_lon(point)
+        target_lat, target_lon = _lat_lon(target)
+        return lat, lon, _bearing(lat, lon, target_lat, target_lon)
+
+
+class FleetSimulator:
+    """
+    Fleet of `size` vessels with MMSIs mmsi_start .. mmsi_start + size - 1
+    Any other MMSI is simulated too (its lane and timing come from its hash),
+    so tracked vessels with real MMSIs get plausible tracks as well.
+    """
+    
+    def __init__(self, size=None, seed=None, mmsi_start=None, time_scale=None):
+        self.size = size or getattr(settings, 'AIS_SIMULATOR_FLEET_SIZE', 10000)
+        self.seed = seed if seed is not None else getattr(settings, 'AIS_SIMULATOR_SEED', 1)
+        self.mmsi_start = mmsi_start or getattr(settings, 'AIS_SIMULATOR_MMSI_START', 200000000)
+        self.time_scale = time_scale or getattr(settings, 'AIS_SIMULATOR_TIME_SCALE', 1.0)
+        self.lanes = [_Lane(name, *spec) for name, spec in LANES.items()]
+        shares = np.array([lane.share for lane in self.lanes])
+        self._lane_edges = np.cumsum(shares / shares.sum())
+        self._snapshot = None
+        self._snapshot_lock = threading.Lock()
+    
+    def sim_time(self, now=None):
+        """Simulated epoch seconds for a wall-clock time"""
+        now = time.time() if now is None else now
+        return EPOCH + (now - EPOCH) * self.time_scale
+    
+    def fleet_mmsis(self):
+        return np.arange(self.mmsi_start, self.mmsi_start + self.size, dtype=np.int64)
+    
+    def _parameters(self, mmsis):
+        lane = np.minimum(np.searchsorted(self._lane_edges, _uniform(mmsis, self.seed, 1), side='right'), len(self.lanes) - 1)
+        speed = np.empty(len(mmsis))
+        stop = np.empty(len(mmsis))
+        length = np.empty(len(mmsis))
+        width = np.empty(len(mmsis))
+        for index, spec in enumerate(self.lanes):
+            mask = lane == index
+            speed[mask] = spec.speed[0] + (spec.speed[1] - spec.speed[0]) * _uniform(mmsis[mask], self.seed, 2)
+            stop[mask] = spec.stop_hours[0] + (spec.stop_hours[1] - spec.stop_hours[0]) * _uniform(mmsis[mask], self.seed, 3)
+            length[mask] = spec.length_nm
+            width[mask] = spec.width_nm
+        # Voyages run from berth to the anchorage off the next port
+        anchorage = np.minimum(2.0, length / 4)
+        sail = (length - anchorage) / speed
+        period = 2 * (sail + stop)
+        return {
+            'lane': lane,
+            'length': length,
+            'anchorage': anchorage,
+            'shift': np.minimum(anchorage / BERTHING_SPEED, stop * (1 - ANCHORAGE_SHARE) / 2),
+            'speed': speed,
+            'stop': stop,
+            'sail': sail,
+            'period': period,
+            'phase': _uniform(mmsis, self.seed, 4) * period,
+            'offset': _uniform(mmsis, self.seed, 5) * width,
+            'type': (_uniform(mmsis, self.seed, 6) * len(VESSEL_TYPES)).astype(int),
+            'berth': _uniform(mmsis, self.seed, 7),
+        }
+    
+    def report_offsets(self, mmsis, interval):
+        """Whole-second offset of each vessel's reports within a reporting interval"""
+        return (_uniform(np.asarray(mmsis, dtype=np.int64), self.seed, 8) * interval).astype(np.int64)
+    
+    def state(self, mmsis, sim_time):
+        """Vectorized vessel state at sim_time (a scalar or one time per vessel) as a dict of arrays"""
+        mmsis = np.asarray(mmsis, dtype=np.int64)
+        p = self._parameters(mmsis)
+        hours = (sim_time - EPOCH) / 3600.0
+        tau = (hours + p['phase']) % p['period']
+        stop, sail, speed = p['stop'], p['sail'], p['speed']
+        
+        # Cycle: stop at the first port, sail out, stop at the second port, sail back
+        at_first = tau < stop
+        outbound = (tau >= stop) & (tau < stop + sail)
+        at_second = (tau >= stop + sail) & (tau < 2 * stop + sail)
+        inbound = tau >= 2 * stop + sail
+        forward = outbound | at_first
+        stop_elapsed = np.where(at_first, tau, tau - stop - sail)
+        sailed = np.where(outbound, tau - stop, tau - 2 * stop - sail)
+        
+        # A port stop: wait at the anchorage, shift to the berth, stay moored until departure
+        sailing = outbound | inbound
+        anchor_hours = stop * ANCHORAGE_SHARE
+        anchored = ~sailing & (stop_elapsed < anchor_hours)
+        shifting = ~sailing & ~anchored & (stop_elapsed < anchor_hours + p['shift'])
+        moving = sailing | shifting
+        # Direction along the lane; in port, that of the arrival and the shift to the berth
+        towards_end = outbound | at_second
+        
+        # Distance from the lane's first port
+        length, anchorage = p['length'], p['anchorage']
+        berthed = np.where(anchored, 0.0, np.where(shifting, (stop_elapsed - anchor_hours) / p['shift'], 1.0))
+        to_berth = anchorage * berthed
+        distance = np.where(outbound, sailed * speed, length - sailed * speed)
+        distance = np.where(at_first, anchorage - to_berth, distance)
+        distance = np.where(at_second, length - anchorage + to_berth, distance)
+        eta_hours = np.where(sailing, sail - sailed, (stop - stop_elapsed) + sail)
+        
+        n = len(mmsis)
+        lat, lon, course = np.zeros(n), np.zeros(n), np.zeros(n)
+        destination = np.empty(n, dtype=object)
+        for index, lane in enumerate(self.lanes):
+            mask = p['lane'] == index
+            if not mask.any():
+                continue
+            lane_lat, lane_lon, lane_course = lane.locate(distance[mask], towards_end[mask])
+            # Keep right of the lane centre, fading out towards the berths
+            offset_nm = p['offset'][mask] * np.sin(np.pi * distance[mask] / lane.length_nm)
+            right = np.radians(lane_course + 90)
+            lane_lat = lane_lat + offset_nm / 60.0 * np.cos(right)
+            lane_lon = lane_lon + offset_nm / 60.0 * np.sin(right) / np.maximum(np.cos(np.radians(lane_lat)), 0.05)
+            lat[mask], lon[mask], course[mask] = lane_lat, (lane_lon + 180) % 360 - 180, lane_course
+            destination[mask] = np.where(forward[mask], lane.ports[1], lane.ports[0])
+        
+        status = np.where(moving, UNDERWAY, np.where(anchored, AT_ANCHOR, MOORED))
+        
+        # Small speed variation while under way; drift at anchor; berthed vessels keep a fixed heading
+        wobble = np.sin(2 * np.pi * (hours / 3.0 + p['berth']))
+        sog = np.where(sailing, speed * (1 + 0.03 * wobble), np.where(status == AT_ANCHOR, 0.2, 0.0))
+        sog = np.where(shifting, anchorage / p['shift'], sog)
+        course = np.where(moving, course, (p['berth'] * 360) % 360)
+        heading = np.where(moving, (course + 2 * wobble) % 360, course)
+        return {
+            'mmsi': mmsis,
+            'latitude': lat,
+            'longitude': lon,
+            'speed_over_ground': sog,
+            'course_over_ground': course,
+            'heading': heading,
+            'status': status,
+            'type': p['type'],
+            'destination': destination,
+            'eta_hours': eta_hours,
+        }
+    
+    def snapshot(self, now=None):
+        """Whole-fleet state, recomputed at most once per simulated second"""
+        sim_time = float(int(self.sim_time(now)))
+        with self._snapshot_lock:
+            if self._snapshot is None or self._snapshot[0] != sim_time:
+                self._snapshot = (sim_time, self.state(self.fleet_mmsis(), sim_time))
+            return self._snapshot
+    
+    def positions(self, mmsis, now=None):
+        """{mmsi: position_data} in the shape VesselService.update_vessel_position accepts"""
+        mmsis = [str(mmsi) for mmsi in mmsis if str(mmsi).isdigit()]
+        if not mmsis:
+            return {}
+        sim_time = self.sim_time(now)
+        state = self.state(np.array([int(mmsi) for mmsi in mmsis], dtype=np.int64), sim_time)
+        return {position['mmsi']: position for position in self._position_dicts(state, np.arange(len(mmsis)), sim_time)}
+    
+    def position(self, mmsi, now=None):
+        return self.positions([mmsi], now).get(str(mmsi))
+    
+    def in_area(self, min_lat, max_lat, min_lon, max_lon, now=None):
+        """Position dicts of fleet vessels inside a bbox"""
+        sim_time, state = self.snapshot(now)
+        mask = (
+            (state['latitude'] >= float(min_lat)) & (state['latitude'] <= float(max_lat))
+            & (state['longitude'] >= float(min_lon)) & (state['longitude'] <= float(max_lon))
+        )
+        return self._position_dicts(state, np.flatnonzero(mask), sim_time)
+    
+    def area_records(self, min_lat, max_lat, min_lon, max_lon, now=None):
+        """Fleet vessels inside a bbox in the _fetch_area_* record shape"""
+        return [{
+            'mmsi': position['mmsi'],
+            'name': position['vessel_name'],
+            'latitude': position['latitude'],
+            'longitude': position['longitude'],
+            'speed': position['speed_over_ground'],
+            'course': position['course_over_ground'],
+            'heading': position['heading'],
+            'status': position['navigational_status'],
+            'vessel_type': position['vessel_type'],
+            'destination': position['destination'],
+            'eta': position['eta'],
+            'timestamp': position['timestamp'].isoformat(),
+            'source': 'simulator',
+        } for position in self.in_area(min_lat, max_lat, min_lon, max_lon, now)]
+    
+    def _position_dicts(self, state, indexes, sim_time):
+        timestamp = datetime.fromtimestamp(sim_time, tz=dt_timezone.utc)
+        columns = {name: state[name][indexes].tolist() for name in (
+            'mmsi', 'latitude', 'longitude', 'speed_over_ground', 'course_over_ground', 'heading',
+            'status', 'type', 'destination', 'eta_hours',
+        )}
+        positions = []
+        for row in zip(*columns.values()):
+            mmsi, lat, lon, sog, cog, heading, status, vessel_type, destination, eta_hours = row
+            positions.append({
+                'mmsi': str(mmsi),
+                'latitude': round(lat, 6),
+                'longitude': round(lon, 6),
+                'speed_over_ground': round(sog, 1),
+                'course_over_ground': round(cog, 1),
+                'heading': int(heading) % 360,
+                'navigational_status': str(STATUSES[status]),
+                'timestamp': timestamp,
+                'data_source': 'simulator',
+                'vessel_name': f"SIM {mmsi}",
+                'vessel_type': VESSEL_TYPES[vessel_type],
+                'destination': destination,
+                'eta': (timestamp + timedelta(hours=eta_hours)).isoformat(),
+            })
+        return positions
+
+
+_simulator = None
+_simulator_lock = threading.Lock()
+
+
+def get_simulator():
+    """Process-wide simulator built from the AIS_SIMULATOR_* settings"""
+    global _simulator
+    if _simulator is None:
+        with _simulator_lock:
+            if _simulator is None:
+                _simulator = FleetSimulator()
+                logger.info(
+                    f"Fleet simulator: {_simulator.size} vessels from MMSI {_simulator.mmsi_start}, "
+                    f"seed {_simulator.seed}, time x{_simulator.time_scale}"
+                )
+    return _simulator
+
+
+def simulator_enabled():
+    return getattr(settings, 'AIS_SIMULATOR_ENABLED', False)
+
+
+def create_fleet_vessels(simulator=None, batch_size=1000):
+    """Create tracked Vessel rows for the simulated fleet; existing MMSIs are left alone"""
+    from apps.vessels.models import Vessel
+    
+    simulator = simulator or get_simulator()
+    mmsis = simulator.fleet_mmsis()
+    types = (_uniform(mmsis, simulator.seed, 6) * len(VESSEL_TYPES)).astype(int)
+    existing = Vessel.objects.count()
+    for start in range(0, len(mmsis), batch_size):
+        Vessel.objects.bulk_create([
+            Vessel(
+                mmsi=str(mmsi),
+                vessel_name=f"SIM {mmsi}",
+                vessel_type=VESSEL_TYPES[vessel_type],
+                flag_country='XX',
+                is_tracked=True,
+            )
+            for mmsi, vessel_type in zip(mmsis[start:start + batch_size].tolist(), types[start:start + batch_size].tolist())
+        ], batch_size=batch_size, ignore_conflicts=True)
+    return Vessel.objects.count() - existing
@@ -0,0 +1,146 @@
+"""
+Single-flight request coalescing
+Concurrent identical upstream fetches share one in-flight call: within a
+process through a threading.Event, across processes through a lock and a
+short-lived result in the Django cache
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+_stats_lock = threading.Lock()
+_stats = Counter()
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Run fn once per key, however many callers ask for it at the same time
+    
+    The first caller in a process becomes the local leader; later callers wait
+    for its result. The leader then takes a cache lock so only one process
+    calls upstream - the others poll for the result it publishes for
+    AIS_SINGLEFLIGHT_RESULT_TTL seconds. If the lock holder dies or the wait
+    times out the caller fetches for itself rather than failing.
+    """
+    
+    def __init__(self, namespace):
+        self.namespace = namespace
+        self.lock_timeout = getattr(settings, 'AIS_SINGLEFLIGHT_LOCK_TIMEOUT', 30)
+        self.wait_timeout = getattr(settings, 'AIS_SINGLEFLIGHT_WAIT_TIMEOUT', 30)
+        self.result_ttl = getattr(settings, 'AIS_SINGLEFLIGHT_RESULT_TTL', 5)
+        self.poll_interval = 0.05
+        self._lock = threading.Lock()
+        self._calls = {}
+    
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+        
+        if not leader:
+            if call.event.wait(self.wait_timeout):
+                _count('coalesced_local')
+                if call.error is not None:
+                    raise call.error
+                # Callers may mutate what they get back
+                return copy.deepcopy(call.result)
+            _count('wait_timeouts')
+            return fn()
+        
+        try:
+            result = self._do_shared(key, fn)
+            call.result = copy.deepcopy(result)
+            return result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+    
+    def _do_shared(self, key, fn):
+        """Coalesce across processes through the cache"""
+        lock_key = f"singleflight:{self.namespace}:{key}:lock"
+        result_key = f"singleflight:{self.namespace}:{key}:result"
+        
+        try:
+            acquired = cache.add(lock_key, os.getpid(), self.lock_timeout)
+        except Exception as e:
+            logger.debug(f"Single-flight lock unavailable for {key}: {str(e)}")
+            _count('leaders')
+            return fn()
+        
+        if acquired:
+            _count('leaders')
+            try:
+                result = fn()
+                _cache_call(cache.set, result_key, result, self.result_ttl)
+                return result
+            finally:
+                _cache_call(cache.delete, lock_key)
+        
+        # Another process is fetching: wait for its result
+        deadline = time.monotonic() + self.wait_timeout
+        while time.monotonic() < deadline:
+            result = _cache_call(cache.get_many, [result_key, lock_key])
+            if result is None:
+                break
+            if result_key in result:
+                _count('coalesced_remote')
+                return result[result_key]
+            if lock_key not in result:
+                break
+            time.sleep(self.poll_interval)
+        
+        _count('wait_timeouts')
+        return fn()
+
+
+def _cache_call(method, *args):
+    try:
+        return method(*args)
+    except Exception as e:
+        logger.debug(f"Single-flight cache call failed: {str(e)}")
+        return None
+
+
+def _count(name):
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def singleflight_stats():
+    """
+    Coalescing counters for this process
+    leaders: upstream calls made; coalesced_*: callers that reused one
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    total = sum(stats.get(name, 0) for name in ('leaders', 'coalesced_local', 'coalesced_remote', 'wait_timeouts'))
+    coalesced = stats.get('coalesced_local', 0) + stats.get('coalesced_remote', 0)
+    stats['coalesced_ratio'] = round(coalesced / total, 3) if total else 0
+    return stats
+
+
+area_flight = SingleFlight('area')
+position_flight = SingleFlight('position')
@@ -5,57 +5,311 @@ Celery tasks for vessel tracking
 from celery import shared_task
 from django.utils import timezone
 import logging
+import time
+import zlib
 
 logger = logging.getLogger(__name__)
 
 
+def poll_and_store(vessels):
+    """
+    Fetch positions for vessels and write them in batches
+    of AIS_WRITE_BATCH_SIZE vessels per transaction, or hand them to the
+    fix queue writer when AIS_QUEUE_BACKEND is set
+    With AIS_AREA_POLLING_ENABLED vessels are first grouped into bounding
+    boxes by last known position and only stragglers are looked up by MMSI.
+    Returns (positions, updated_count, error_count)
+    """
+    from django.conf import settings
+    from .polling import AsyncAISPoller
+    from .area_planner import poll_by_area
+    from .fix_queue import publish_fixes
+    from .services import VesselService
+    
+    vessels = {vessel.mmsi: vessel for vessel in vessels}
+    
+    if getattr(settings, 'AIS_AREA_POLLING_ENABLED', True):
+        positions = poll_by_area(vessels.values())
+    else:
+        positions = AsyncAISPoller().poll(list(vessels))
+    
+    missing = len(vessels) - len(positions)
+    if missing:
+        logger.warning(f"No position data returned for {missing} vessels")
+    
+    # With a fix queue the dedicated writer stores them (see fix_queue.py)
+    queued = publish_fixes({mmsi: data for mmsi, data in positions.items() if mmsi in vessels})
+    if queued is not None:
+        return positions, queued, 0
+    
+    updated_count = 0
+    error_count = 0
+    batch_size = getattr(settings, 'AIS_WRITE_BATCH_SIZE', 500)
+    updates = [(vessels[mmsi], data) for mmsi, data in positions.items() if mmsi in vessels]
+    
+    for i in range(0, len(updates), batch_size):
+        batch = updates[i:i + batch_size]
+        try:
+            VesselService.apply_position_batch(batch)
+            updated_count += len(batch)
+        except Exception as e:
+            error_count += len(batch)
+            logger.error(f"Error writing position batch of {len(batch)} vessels: {str(e)}")
+    
+    return positions, updated_count, error_count
+
+
+def shard_mmsis(mmsis, shard_count):
+    """
+    Split MMSIs into at most shard_count shards by a stable hash
+    Small runs use fewer shards (AIS_POLL_MIN_SHARD_SIZE vessels each at least)
+    so a handful of due vessels is not spread over every worker
+    """
+    from django.conf import settings
+    
+    min_size = getattr(settings, 'AIS_POLL_MIN_SHARD_SIZE', 50)
+    shard_count = max(1, min(shard_count, -(-len(mmsis) // min_size)))
+    shards = [[] for _ in range(shard_count)]
+    for mmsi in mmsis:
+        # crc32 rather than hash(): it must agree across worker processes
+        shards[zlib.crc32(str(mmsi).encode()) % shard_count].append(mmsi)
+    return [shard for shard in shards if shard]
+
+
+def dispatch_poll_shards(mmsis, reschedule=False, lock_token=None):
+    """
+    Fan the poll out as a Celery chord: one poll_vessel_shard task per shard,
+    then summarize_poll_shards with all shard results
+    """
+    from celery import chord
+    from django.conf import settings
+    
+    dispatched_at = time.time()
+    shards = shard_mmsis(mmsis, getattr(settings, 'AIS_POLL_SHARDS', 4))
+    header = [
+        poll_vessel_shard.s(index, shard, reschedule=reschedule, dispatched_at=dispatched_at)
+        for index, shard in enumerate(shards)
+    ]
+    callback = summarize_poll_shards.s(dispatched_at, lock_token=lock_token)
+    # A shard that still fails (worker lost, time limit) skips the callback; free the lock anyway
+    chord(header)(callback.on_error(release_poll_lock.s(lock_token=lock_token)))
+    logger.info(f"Dispatched poll of {len(mmsis)} vessels in {len(shards)} shards")
+    return len(shards)
+
+
 @shared_task
 def update_vessel_positions():
     """
-    Fetch and update vessel positions from AIS data provider
-    Runs every 60 seconds
+    Fetch and update positions for every tracked vessel at once
+    No longer scheduled (see poll_due_vessels); kept for manual full refreshes
+    
+    The tracked set is split into AIS_POLL_SHARDS shards by MMSI hash and
+    polled in parallel by poll_vessel_shard tasks.
+    """
+    from .models import Vessel
+    
+    tracked = list(Vessel.objects.filter(is_tracked=True, is_deleted=False).values_list('mmsi', flat=True))
+    if not tracked:
+        return "No tracked vessels"
+    shard_count = dispatch_poll_shards(tracked)
+    return f"Dispatched {len(tracked)} vessels in {shard_count} shards"
+
+
+@shared_task
+def poll_due_vessels():
+    """
+    Poll only the vessels whose next poll is due (see scheduler.py)
+    Runs every few seconds. Due vessels are fanned out in shards; the poll
+    lock is held until summarize_poll_shards has seen every shard, and a
+    tick that finds it taken exits immediately, so runs never overlap
     """
     from .models import Vessel
-    from .services import AISIntegrationService, VesselService
+    from .scheduler import PollScheduler
     
-    ais_service = AISIntegrationService()
-    tracked_vessels = Vessel.objects.filter(is_tracked=True, is_deleted=False)
+    scheduler = PollScheduler()
+    token = scheduler.acquire()
+    if token is None:
+        logger.info("Previous vessel poll still running, skipping tick")
+        return "Skipped: previous poll still running"
     
-    updated_count = 0
-    error_count = 0
+    try:
+        if scheduler.needs_sync():
+            tracked = Vessel.objects.filter(is_tracked=True, is_deleted=False).values_list('mmsi', flat=True)
+            scheduler.sync(list(tracked))
+        
+        due = scheduler.due()
+        if not due:
+            scheduler.release(token)
+            return "No vessels due"
+        
+        shard_count = dispatch_poll_shards(due, reschedule=True, lock_token=token)
+    except Exception:
+        scheduler.release(token)
+        raise
+    return f"Dispatched {len(due)} due vessels in {shard_count} shards"
+
+
+@shared_task
+def poll_vessel_shard(shard, mmsis, reschedule=False, dispatched_at=None):
+    """
+    Fetch and bulk-write positions for one shard of vessels
+    Always returns a summary (errors included) so the chord callback runs
+    """
+    from .models import Vessel
+    from .scheduler import PollScheduler
     
-    for vessel in tracked_vessels:
+    started = time.time()
+    vessels = []
+    error = None
+    try:
+        vessels = list(Vessel.objects.filter(mmsi__in=mmsis, is_tracked=True, is_deleted=False))
+        positions, updated_count, error_count = poll_and_store(vessels)
+    except Exception as e:
+        logger.error(f"Poll shard {shard} failed: {str(e)}")
+        positions, updated_count, error_count, error = {}, 0, len(vessels or mmsis), str(e)
+    
+    if reschedule:
+        # Failed vessels are rescheduled too, so one bad shard cannot spin
         try:
-            position_data = ais_service.fetch_vessel_position(vessel.mmsi)
-            
-            if position_data:
-                VesselService.update_vessel_position(vessel, position_data)
-                updated_count += 1
-            else:
-                logger.warning(f"No position data returned for vessel {vessel.mmsi}")
-                
+            PollScheduler().reschedule(vessels, positions)
         except Exception as e:
-            error_count += 1
-            logger.error(f"Error updating vessel {vessel.mmsi}: {str(e)}")
+            logger.error(f"Rescheduling poll shard {shard} failed: {str(e)}")
+            error = error or str(e)
+    
+    # How old the fixes we just stored were when they arrived
+    now = timezone.now()
+    ages = [
+        (now - data['timestamp']).total_seconds()
+        for data in positions.values()
+        if hasattr(data.get('timestamp'), 'tzinfo')
+    ]
+    return {
+        'shard': shard,
+        'vessels': len(vessels),
+        'updated': updated_count,
+        'missing': len(vessels) - len(positions),
+        'errors': error_count,
+        'error': error,
+        'queue_lag_seconds': round(started - dispatched_at, 2) if dispatched_at else None,
+        'duration_seconds': round(time.time() - started, 2),
+        'data_age_seconds': round(sum(ages) / len(ages), 1) if ages else None,
+    }
+
+
+@shared_task
+def summarize_poll_shards(results, dispatched_at, lock_token=None):
+    """
+    Chord callback: log per-shard timing, errors and lag, then free the poll lock
+    """
+    from .scheduler import PollScheduler
+    
+    try:
+        for result in sorted(results, key=lambda r: r['shard']):
+            age = result['data_age_seconds']
+            logger.info(
+                f"Poll shard {result['shard']}: {result['vessels']} vessels, {result['updated']} updated, "
+                f"{result['missing']} missing, {result['errors']} errors, "
+                f"queued {result['queue_lag_seconds']}s, took {result['duration_seconds']}s, "
+                f"data age {f'{age}s' if age is not None else 'n/a'}"
+            )
+        
+        elapsed = time.time() - dispatched_at
+        summary = {
+            'shards': len(results),
+            'vessels': sum(r['vessels'] for r in results),
+            'updated': sum(r['updated'] for r in results),
+            'missing': sum(r['missing'] for r in results),
+            'errors': sum(r['errors'] for r in results),
+            'failed_shards': [r['shard'] for r in results if r['error']],
+            'elapsed_seconds': round(elapsed, 2),
+            'slowest_shard_seconds': max((r['duration_seconds'] for r in results), default=0),
+            'max_queue_lag_seconds': max((r['queue_lag_seconds'] or 0 for r in results), default=0),
+        }
+        logger.info(
+            f"Vessel poll completed: {summary['updated']} of {summary['vessels']} updated, "
+            f"{summary['errors']} errors across {summary['shards']} shards in {elapsed:.1f}s"
+        )
+        return summary
+    finally:
+        if lock_token:
+            PollScheduler().release(lock_token)
+
+
+@shared_task
+def release_poll_lock(request, exc, traceback, lock_token=None):
+    """Chord error callback: free the poll lock when summarize_poll_shards will not run"""
+    from .scheduler import PollScheduler
     
-    logger.info(f"Vessel position update completed: {updated_count} updated, {error_count} errors")
-    return f"Updated {updated_count} vessels, {error_count} errors"
+    logger.error(f"Vessel poll chord failed: {str(exc)}")
+    if lock_token:
+        PollScheduler().release(lock_token)
+
+
+@shared_task
+def refresh_live_picture():
+    """
+    Rebuild the live picture served by realtime_positions and map_view
+    Runs every 30 seconds
+    """
+    from .live_picture import rebuild_live_picture
+    
+    count = rebuild_live_picture()
+    logger.info(f"Live picture refreshed: {count} vessels")
+    return f"Published {count} vessels"
 
 
 @shared_task
 def cleanup_old_positions():
     """
-    Clean up vessel positions older than 90 days
-    Runs daily
+    Tiered retention of vessel positions
+    Thins history older than the AIS_POSITION_DOWNSAMPLE_TIERS ages, a time-
+    boxed chunk at a time, then deletes positions older than
+    AIS_POSITION_RETENTION_DAYS if set (partitioned storage drops whole
+    partitions instead of deleting rows)
+    Runs hourly
     """
+    from django.conf import settings
     from .models import VesselPosition
+    from .downsampling import downsample_positions
+    from .partitions import drop_expired_partitions
     from datetime import timedelta
     
-    cutoff_date = timezone.now() - timedelta(days=90)
+    results = []
+    for resolution, counts in downsample_positions().items():
+        logger.info(
+            f"Downsampled positions to {resolution}s: {counts['chunks']} chunks, "
+            f"{counts['examined']} examined, {counts['deleted']} deleted"
+        )
+        results.append(f"{counts['deleted']} thinned to {resolution}s")
+    
+    retention_days = getattr(settings, 'AIS_POSITION_RETENTION_DAYS', 0)
+    if not retention_days:
+        return f"Downsampled: {', '.join(results) or 'no tiers'}"
+    cutoff_date = timezone.now() - timedelta(days=retention_days)
+    
+    expired = drop_expired_partitions(cutoff_date)
+    if expired is not None:
+        dropped, deleted_count = expired
+        logger.info(f"Dropped {len(dropped)} position partitions and {deleted_count} old default-partition rows")
+        return f"Downsampled: {', '.join(results) or 'no tiers'}; dropped partitions: {', '.join(dropped) or 'none'}; deleted {deleted_count} position records"
+    
     deleted_count = VesselPosition.objects.filter(timestamp__lt=cutoff_date).delete()[0]
     
     logger.info(f"Cleaned up {deleted_count} old vessel positions")
-    return f"Deleted {deleted_count} position records"
+    return f"Downsampled: {', '.join(results) or 'no tiers'}; deleted {deleted_count} position records"
+
+
+@shared_task
+def ensure_position_partitions():
+    """
+    Create vessel position partitions for the retention window and the next
+    AIS_POSITION_PARTITIONS_AHEAD periods
+    Runs daily
+    """
+    from .partitions import ensure_partitions
+    
+    created = ensure_partitions()
+    return f"Created {len(created)} position partitions"
 
 
 @shared_task
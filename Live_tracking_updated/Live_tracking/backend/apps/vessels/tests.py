@@ -0,0 +1,1078 @@
+"""
+Tests for the vessels app
+"""
+
+import asyncio
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta, timezone as dt_timezone
+from io import StringIO
+from types import SimpleNamespace
+from unittest import mock
+
+import httpx
+import numpy as np
+import pandas as pd
+import requests
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from redis.exceptions import RedisError
+
+from .aisstream import AISStreamIngester, _import_websockets, normalize_message
+from .area_planner import AreaPollPlanner
+from .compression import DeadBandFilter
+from .downsampling import downsample_positions, select_keepers
+from .ingest import PositionBatchWriter
+from .management.commands.aisstream_standin import Command as AISStreamStandinCommand
+from .management.commands.fleet_standin import Command as FleetStandinCommand
+from .management.commands.ingest_nmea import Command as IngestNmeaCommand
+from .management.commands.provider_standin import Command as ProviderStandinCommand
+from .models import PositionDownsampleWatermark, Vessel, VesselPosition
+from .nmea import NmeaDecoder, nmea_checksum
+from .provider_health import ProviderHealth, get_provider_health, order_providers
+from .providers import COMMON_DEFAULTS, AsyncProviderClient, ProviderClient, get_provider_config
+from .rate_limit import ProviderRateLimited, TokenBucket
+from .recording import ProviderRecorder, ReplayIndex, StandinServer, start_recording, stop_recording
+from .services import AISIntegrationService, VesselService
+from .simulator import EARTH_RADIUS_NM, FleetSimulator, get_simulator
+from .partitions import (
+    DEFAULT_PARTITION, SQLitePartitioner, ensure_partitions, partition_positions, unpartition_positions,
+)
+from .tasks import dispatch_poll_shards, poll_vessel_shard, release_poll_lock, shard_mmsis
+
+
+def utc(*args):
+    return datetime(*args, tzinfo=dt_timezone.utc)
+
+
+def make_vessel(mmsi='244000001', **fields):
+    fields.setdefault('vessel_name', f"TEST {mmsi}")
+    fields.setdefault('flag_country', 'NL')
+    return Vessel.objects.create(mmsi=mmsi, **fields)
+
+
+def located(mmsi, latitude, longitude):
+    return SimpleNamespace(mmsi=mmsi, latitude=latitude, longitude=longitude)
+
+
+class AreaPollPlannerTests(SimpleTestCase):
+    """Clustering of last known positions into area queries"""
+    
+    def setUp(self):
+        self.planner = AreaPollPlanner(cell_deg=2.0, max_span_deg=20.0, padding_deg=0.5, min_vessels=3)
+    
+    def test_neighbouring_cells_share_one_padded_box(self):
+        plan = self.planner.plan([
+            located('1', 50.5, 1.5),
+            located('2', 50.7, 1.2),
+            located('3', 51.1, 2.3),
+        ])
+        self.assertEqual(len(plan.boxes), 1)
+        min_lat, max_lat, min_lon, max_lon, mmsis = plan.boxes[0]
+        self.assertEqual((min_lat, max_lat, min_lon, max_lon), (49.5, 52.5, -0.5, 4.5))
+        self.assertEqual(sorted(mmsis), ['1', '2', '3'])
+        self.assertEqual(plan.individual, [])
+    
+    def test_small_clusters_and_unknown_positions_go_individual(self):
+        plan = self.planner.plan([
+            located('1', 50.5, 1.5),
+            located('2', 50.7, 1.2),
+            located('3', 51.1, 2.3),
+            located('4', 10.0, 10.0),
+            located('5', None, None),
+        ])
+        self.assertEqual(len(plan.boxes), 1)
+        self.assertEqual(sorted(plan.individual), ['4', '5'])
+    
+    def test_boxes_never_exceed_the_maximum_span(self):
+        planner = AreaPollPlanner(cell_deg=2.0, max_span_deg=20.0, padding_deg=0.0, min_vessels=1)
+        vessels = [located(str(i), 0.5, lon) for i, lon in enumerate(range(-39, 40, 2))]
+        plan = planner.plan(vessels)
+        self.assertEqual(sum(len(box[4]) for box in plan.boxes), len(vessels))
+        for _, _, min_lon, max_lon, _ in plan.boxes:
+            self.assertLessEqual(max_lon - min_lon, 20.0)
+    
+    def test_padding_is_clamped_at_the_poles(self):
+        planner = AreaPollPlanner(cell_deg=2.0, padding_deg=1.0, min_vessels=1)
+        (box,) = planner.plan([located('1', 89.5, 179.5)]).boxes
+        self.assertEqual((box[1], box[3]), (90.0, 180.0))
+
+
+def closed_port():
+    """A local port nothing listens on"""
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def http_response(status, body=''):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body.encode()
+    response.url = 'http://provider.test/'
+    return response
+
+
+@override_settings(AIS_RECORD_PATH='')
+class ProviderClientTests(SimpleTestCase):
+    """Retries and failure handling of the pooled provider clients"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def config(self, max_retries=0):
+        return {
+            **COMMON_DEFAULTS, 'base_url': 'http://provider.test', 'timeout': 2, 'pool_maxsize': 2,
+            'max_retries': max_retries, 'backoff_base': 0,
+        }
+    
+    def test_transport_error_on_the_final_attempt_raises(self):
+        client = ProviderClient('standin', self.config(max_retries=1))
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            client.get(f'http://127.0.0.1:{closed_port()}/')
+        with self.assertRaises(requests.exceptions.MissingSchema):
+            client.get('notaurl')
+        stats = client.stats()
+        self.assertEqual((stats['retries'], stats['in_flight']), (2, 0))
+    
+    def test_server_error_is_retried(self):
+        client = ProviderClient('standin', self.config(max_retries=2))
+        with mock.patch.object(client.session, 'request', side_effect=[http_response(503), http_response(200, 'ok')]):
+            response = client.get('http://provider.test/')
+        self.assertEqual((response.status_code, response.text), (200, 'ok'))
+        self.assertEqual(client.stats()['retries'], 1)
+    
+    def test_last_response_is_returned_when_retries_run_out(self):
+        client = ProviderClient('standin', self.config(max_retries=1))
+        with mock.patch.object(client.session, 'request', side_effect=[http_response(503), http_response(502)]):
+            self.assertEqual(client.get('http://provider.test/').status_code, 502)
+    
+    def test_async_transport_error_and_cancellation_propagate(self):
+        async def scenario():
+            client = AsyncProviderClient('standin', self.config())
+            try:
+                with self.assertRaises(httpx.ConnectError):
+                    await client.get(f'http://127.0.0.1:{closed_port()}/')
+                with mock.patch.object(client.client, 'request', side_effect=asyncio.CancelledError):
+                    with self.assertRaises(asyncio.CancelledError):
+                        await client.get('http://provider.test/')
+            finally:
+                await client.client.aclose()
+            return client.stats()
+        
+        stats = asyncio.run(scenario())
+        self.assertEqual((stats['requests'], stats['errors'], stats['in_flight']), (2, 1, 0))
+
+
+@override_settings(
+    AIS_BREAKER_FAILURE_THRESHOLD=3, AIS_BREAKER_COOLDOWN=30, AIS_HEALTH_SYNC_INTERVAL=0, AIS_HEALTH_REORDER_MARGIN=0.2,
+)
+class ProviderHealthTests(SimpleTestCase):
+    """
+    Circuit breakers shared through the cache; the local-memory cache used in
+    development stands in for Redis, each ProviderHealth for one worker
+    """
+    
+    def setUp(self):
+        cache.clear()
+    
+    def open_breaker(self, health):
+        for _ in range(health.failure_threshold):
+            health.record_failure(0.1)
+    
+    def expire_cooldown(self, health, cooldown=1):
+        cache.set(health.breaker_key, {'open_until': time.time() - 1, 'cooldown': cooldown}, 60)
+    
+    def test_breaker_opens_for_every_worker(self):
+        worker, other = ProviderHealth('standin'), ProviderHealth('standin')
+        worker.record_failure(0.1)
+        worker.record_failure(0.1)
+        self.assertTrue(worker.allow_request())
+        worker.record_failure(0.1)
+        self.assertFalse(worker.allow_request())
+        self.assertTrue(other.is_open())
+        self.assertFalse(other.allow_request())
+    
+    def test_only_one_probe_after_cooldown(self):
+        worker, other = ProviderHealth('standin'), ProviderHealth('standin')
+        self.open_breaker(worker)
+        self.expire_cooldown(worker)
+        self.assertTrue(worker.allow_request())
+        self.assertFalse(worker.allow_request())
+        self.assertFalse(other.allow_request())
+        self.assertEqual(other.snapshot()['state'], 'half_open')
+    
+    def test_failed_probe_reopens_with_doubled_cooldown(self):
+        worker, other = ProviderHealth('standin'), ProviderHealth('standin')
+        self.open_breaker(worker)
+        self.expire_cooldown(worker, cooldown=30)
+        self.assertTrue(worker.allow_request())
+        worker.record_failure(0.1)
+        self.assertEqual(worker.breaker['cooldown'], 60)
+        self.assertTrue(other.is_open())
+    
+    def test_successful_probe_closes_for_every_worker(self):
+        worker, other = ProviderHealth('standin'), ProviderHealth('standin')
+        self.open_breaker(worker)
+        self.expire_cooldown(worker)
+        self.assertTrue(worker.allow_request())
+        self.assertFalse(other.allow_request())
+        worker.record_success(0.1)
+        for health in (worker, other):
+            self.assertTrue(health.allow_request())
+            self.assertEqual(health.snapshot()['state'], 'closed')
+    
+    def test_chain_skips_open_breakers_and_prefers_healthier_providers(self):
+        slow, fast, down = (f"{name}-{time.monotonic_ns()}" for name in ('slow', 'fast', 'down'))
+        get_provider_health(slow).record_success(2.0)
+        get_provider_health(fast).record_success(0.1)
+        self.open_breaker(get_provider_health(down))
+        self.assertEqual(order_providers([slow, fast, down]), [fast, slow])
+    
+    def test_comparable_providers_keep_the_configured_order(self):
+        first, second = (f"{name}-{time.monotonic_ns()}" for name in ('first', 'second'))
+        get_provider_health(first).record_success(0.2)
+        get_provider_health(second).record_success(0.1)
+        self.assertEqual(order_providers([first, second]), [first, second])
+
+
+# Type 1 report from the gpsd AIVDM documentation: MMSI 477553000, moored
+GPSD_TYPE_1 = '!AIVDM,1,1,,B,177KQJ5000G?tO`K>RA1wUbN0TKH,0*5C'
+
+
+def armor(fields):
+    """6-bit armored payload and fill bits for (value, width) fields"""
+    bits = ''.join(format(value & ((1 << width) - 1), f'0{width}b') for value, width in fields)
+    fill = -len(bits) % 6
+    bits += '0' * fill
+    values = [int(bits[i:i + 6], 2) for i in range(0, len(bits), 6)]
+    return ''.join(chr(value + 48 if value < 40 else value + 56) for value in values), fill
+
+
+def sixbit_text(text, chars):
+    """(value, 6) fields for an AIS text field, padded with '@'"""
+    return [(ord(char) - 64 if char >= '@' else ord(char), 6) for char in text.ljust(chars, '@')]
+
+
+def sentence(payload, fill, count=1, index=1, seq_id=''):
+    body = f"AIVDM,{count},{index},{seq_id},A,{payload},{fill}"
+    return f"!{body}*{nmea_checksum(body):02X}"
+
+
+def class_b_report(mmsi, latitude, longitude, sog=123, cog=1805, heading=511):
+    return armor([
+        (18, 6), (0, 2), (mmsi, 30), (0, 8), (sog, 10), (0, 1),
+        (round(longitude * 600000), 28), (round(latitude * 600000), 27),
+        (cog, 12), (heading, 9), (30, 6), (0, 29),
+    ])
+
+
+def static_voyage_report(mmsi):
+    return armor(
+        [(5, 6), (0, 2), (mmsi, 30), (0, 2), (9074729, 30)]
+        + sixbit_text('PBXY', 7) + sixbit_text('NORDIC STAR', 20)
+        + [(80, 8), (150, 9), (50, 9), (15, 6), (15, 6), (1, 4), (12, 4), (24, 5), (13, 5), (30, 6), (125, 8)]
+        + sixbit_text('ROTTERDAM', 20) + [(0, 1), (0, 1)]
+    )
+
+
+class NmeaDecoderTests(SimpleTestCase):
+    """Raw AIS sentence decoding"""
+    
+    def setUp(self):
+        self.decoder = NmeaDecoder()
+    
+    def test_class_a_position_report(self):
+        message = self.decoder.decode_line(GPSD_TYPE_1)
+        self.assertEqual(message['mmsi'], '477553000')
+        self.assertEqual(message['message_type'], 1)
+        self.assertAlmostEqual(message['latitude'], 47.5828333)
+        self.assertAlmostEqual(message['longitude'], -122.3458333)
+        self.assertEqual(message['speed_over_ground'], 0.0)
+        self.assertEqual(message['course_over_ground'], 51.0)
+        self.assertEqual(message['heading'], 181)
+        self.assertEqual(message['navigational_status'], 'moored')
+        self.assertEqual(message['data_source'], 'nmea')
+    
+    def test_bad_checksum_is_rejected(self):
+        self.assertIsNone(self.decoder.decode_line(GPSD_TYPE_1[:-2] + '00'))
+        self.assertEqual(self.decoder.stats['bad_checksum'], 1)
+    
+    def test_class_b_position_with_signed_coordinates(self):
+        payload, fill = class_b_report(244123456, -33.5, -70.25)
+        message = self.decoder.decode_line(sentence(payload, fill))
+        self.assertEqual(message['mmsi'], '244123456')
+        self.assertEqual((message['latitude'], message['longitude']), (-33.5, -70.25))
+        self.assertEqual(message['speed_over_ground'], 12.3)
+        self.assertEqual(message['course_over_ground'], 180.5)
+        self.assertIsNone(message['heading'])
+    
+    def test_static_voyage_data_from_two_fragments(self):
+        payload, fill = static_voyage_report(244123456)
+        first = sentence(payload[:40], 0, count=2, index=1, seq_id='3')
+        second = sentence(payload[40:], fill, count=2, index=2, seq_id='3')
+        
+        # Fragments may arrive in either order
+        for lines in ((first, second), (second, first)):
+            decoder = NmeaDecoder()
+            self.assertIsNone(decoder.decode_line(lines[0]))
+            message = decoder.decode_line(lines[1])
+            self.assertEqual(message['mmsi'], '244123456')
+            self.assertEqual(message['imo_number'], '9074729')
+            self.assertEqual(message['call_sign'], 'PBXY')
+            self.assertEqual(message['vessel_name'], 'NORDIC STAR')
+            self.assertEqual(message['destination'], 'ROTTERDAM')
+            self.assertEqual(message['vessel_type'], 'tanker')
+            self.assertEqual((message['length_overall'], message['beam'], message['draft']), (200, 30, 12.5))
+            self.assertEqual((message['eta'].month, message['eta'].day, message['eta'].hour, message['eta'].minute), (12, 24, 13, 30))
+    
+    def test_tag_block_time_becomes_the_timestamp(self):
+        message = self.decoder.decode_line('\\s:rx1,c:1700000000*00\\' + GPSD_TYPE_1)
+        self.assertEqual(message['timestamp'], datetime(2023, 11, 14, 22, 13, 20, tzinfo=dt_timezone.utc))
+    
+    def test_unsupported_message_type(self):
+        payload, fill = armor([(4, 6), (0, 2), (244123456, 30), (0, 130)])
+        self.assertIsNone(self.decoder.decode_line(sentence(payload, fill)))
+        self.assertEqual(self.decoder.stats['unsupported'], 1)
+
+
+class IngestNmeaCommandTests(TestCase):
+    """ingest_nmea against a log file and a local socket"""
+    
+    def setUp(self):
+        self.vessel = make_vessel('244123456', vessel_name='UNNAMED')
+        handle, self.path = tempfile.mkstemp(suffix='.nmea')
+        payload, fill = class_b_report(244123456, 52.25, 4.5)
+        static_payload, static_fill = static_voyage_report(244123456)
+        with os.fdopen(handle, 'w') as log:
+            log.write(sentence(payload, fill) + '\n')
+            log.write(sentence(static_payload[:40], 0, count=2, index=1, seq_id='1') + '\n')
+            log.write(sentence(static_payload[40:], static_fill, count=2, index=2, seq_id='1') + '\n')
+            log.write(GPSD_TYPE_1 + '\n')  # unknown MMSI
+            log.write('garbage\n')
+    
+    def tearDown(self):
+        os.remove(self.path)
+    
+    def test_file_feed_is_written(self):
+        out = StringIO()
+        call_command('ingest_nmea', file=self.path, stats_interval=3600, stdout=out)
+        
+        self.vessel.refresh_from_db()
+        self.assertEqual(float(self.vessel.latitude), 52.25)
+        self.assertEqual(self.vessel.vessel_name, 'NORDIC STAR')
+        self.assertEqual(self.vessel.destination, 'ROTTERDAM')
+        self.assertEqual(VesselPosition.objects.filter(vessel=self.vessel).count(), 1)
+        self.assertIn('1 positions written', out.getvalue())
+        self.assertIn('1 from unknown MMSIs', out.getvalue())
+    
+    def test_socket_stream_is_split_into_lines(self):
+        feed, receiver = socket.socketpair()
+        with feed, receiver:
+            feed.sendall(GPSD_TYPE_1.encode() + b'\r\n' + GPSD_TYPE_1[:20].encode())
+            feed.sendall(GPSD_TYPE_1[20:].encode() + b'\n')
+            feed.shutdown(socket.SHUT_WR)
+            lines = list(IngestNmeaCommand().stream_lines(receiver))
+        self.assertEqual([line.strip() for line in lines], [GPSD_TYPE_1, GPSD_TYPE_1])
+
+
+class NormalizeMessageTests(SimpleTestCase):
+    """AISStream messages into the position schema"""
+    
+    def test_position_report(self):
+        message = normalize_message({
+            'MessageType': 'PositionReport',
+            'MetaData': {'MMSI': 24412345, 'time_utc': '2022-12-29 18:22:32.318353 +0000 UTC'},
+            'Message': {'PositionReport': {
+                'Latitude': 52.123456789, 'Longitude': 4.5, 'Sog': 102.3, 'Cog': 360, 'TrueHeading': 511,
+                'NavigationalStatus': 5,
+            }},
+        })
+        self.assertEqual(message['mmsi'], '024412345')
+        self.assertEqual(message['latitude'], 52.1234568)
+        self.assertIsNone(message['speed_over_ground'])
+        self.assertIsNone(message['course_over_ground'])
+        self.assertIsNone(message['heading'])
+        self.assertEqual(message['navigational_status'], 'moored')
+        self.assertEqual(message['timestamp'], datetime(2022, 12, 29, 18, 22, 32, 318353, tzinfo=dt_timezone.utc))
+    
+    def test_static_data_report(self):
+        message = normalize_message({
+            'MessageType': 'StaticDataReport',
+            'MetaData': {'MMSI': 244123456},
+            'Message': {'StaticDataReport': {
+                'ReportA': {'Valid': True, 'Name': 'NORDIC STAR  '},
+                'ReportB': {'Valid': True, 'CallSign': 'PBXY', 'ShipType': 37, 'Dimension': {'A': 8, 'B': 4, 'C': 2, 'D': 2}},
+            }},
+        })
+        self.assertEqual(message['vessel_name'], 'NORDIC STAR')
+        self.assertEqual(message['call_sign'], 'PBXY')
+        self.assertEqual((message['length_overall'], message['beam']), (12, 4))
+    
+    def test_unusable_messages(self):
+        self.assertIsNone(normalize_message({'MessageType': 'PositionReport', 'MetaData': {}}))
+        self.assertIsNone(normalize_message({
+            'MessageType': 'PositionReport', 'MetaData': {'MMSI': 244123456},
+            'Message': {'PositionReport': {'Latitude': 91, 'Longitude': 4.5}},
+        }))
+        self.assertIsNone(normalize_message({'MessageType': 'SafetyBroadcastMessage', 'MetaData': {'MMSI': 244123456}}))
+
+
+class AISStreamStandinTests(SimpleTestCase):
+    """AISStreamIngester against the aisstream_standin websocket"""
+    
+    def setUp(self):
+        self.standin = AISStreamStandinCommand()
+        self.standin.options = {'vessels': 20, 'mmsi_start': 244000000, 'rate': 2000.0, 'seed': 1}
+        self.standin.recorded = None
+    
+    def serve(self):
+        return _import_websockets().serve(self.standin.stream, '127.0.0.1', 0)
+    
+    def test_ingester_receives_and_writes_synthetic_positions(self):
+        writer = PositionBatchWriter(batch_size=50, flush_interval=0.05, dry_run=True)
+        
+        async def scenario():
+            async with self.serve() as server:
+                port = server.sockets[0].getsockname()[1]
+                ingester = AISStreamIngester([(51.0, 53.0, 3.0, 6.0)], url=f'ws://127.0.0.1:{port}', api_key='test', writer=writer)
+                task = asyncio.create_task(ingester.run())
+                deadline = time.monotonic() + 10
+                while ingester.stats['written'] < 200 and time.monotonic() < deadline:
+                    await asyncio.sleep(0.02)
+                ingester.stop()
+                await task
+            return ingester
+        
+        ingester = asyncio.run(scenario())
+        self.assertEqual(ingester.stats['connections'], 1)
+        self.assertGreaterEqual(ingester.stats['written'], 200)
+        self.assertEqual(writer.stats['positions'], ingester.stats['written'])
+    
+    def test_missing_api_key_is_refused(self):
+        async def scenario():
+            async with self.serve() as server:
+                port = server.sockets[0].getsockname()[1]
+                async with _import_websockets().connect(f'ws://127.0.0.1:{port}') as websocket:
+                    await websocket.send(json.dumps({'BoundingBoxes': [[[51, 3], [53, 6]]]}))
+                    return json.loads(await websocket.recv())
+        
+        self.assertEqual(asyncio.run(scenario()), {'error': 'Api Key Is Not Valid'})
+
+
+def fix(minute=0, latitude=52.0, longitude=4.0, sog=10.0, cog=90.0, status='underway', **fields):
+    return dict(
+        latitude=latitude, longitude=longitude, speed_over_ground=sog, course_over_ground=cog,
+        navigational_status=status, timestamp=utc(2026, 3, 1, 12, minute), **fields
+    )
+
+
+@override_settings(
+    AIS_COMPRESSION_ENABLED=True, AIS_COMPRESSION_DISTANCE_M=50, AIS_COMPRESSION_SPEED_KN=0.5,
+    AIS_COMPRESSION_COURSE_DEG=5, AIS_COMPRESSION_KEEPALIVE_MINUTES=10,
+)
+class DeadBandFilterTests(SimpleTestCase):
+    """Which fixes make it into the position history"""
+    
+    def setUp(self):
+        cache.clear()
+        self.filter = DeadBandFilter(namespace='test:lastfix')
+    
+    def kept(self, *fixes):
+        return self.filter.filter([(1, data) for data in fixes])
+    
+    def test_first_fix_is_stored(self):
+        self.assertEqual(self.kept(fix()), [0])
+    
+    def test_thresholds(self):
+        # 0.0003 deg of latitude is ~33 m, 0.0005 is ~56 m
+        self.assertEqual(self.kept(fix(), fix(1, latitude=52.0003), fix(2, latitude=52.0005)), [0, 2])
+        self.assertEqual(self.kept(fix(), fix(1, sog=10.4), fix(2, sog=10.5)), [0, 2])
+        self.assertEqual(self.kept(fix(), fix(1, cog=94.0), fix(2, cog=95.0)), [0, 2])
+        self.assertEqual(self.kept(fix(), fix(1, status='at_anchor')), [0, 1])
+    
+    def test_course_is_ignored_when_stationary(self):
+        self.assertEqual(self.kept(fix(sog=0.2), fix(1, sog=0.2, cog=200.0)), [0])
+    
+    def test_keepalive(self):
+        self.assertEqual(self.kept(fix(), fix(9), fix(10), fix(15)), [0, 2])
+    
+    def test_late_fix_is_stored_without_becoming_the_reference(self):
+        self.assertEqual(self.kept(fix(5), fix(0), fix(6)), [0, 1])
+    
+    def test_manual_fixes_are_always_stored(self):
+        self.assertEqual(self.kept(fix(), fix(1, data_source='manual')), [0, 1])
+    
+    def test_remembered_fix_is_the_reference_for_the_next_batch(self):
+        self.filter.remember([(1, fix(0)), (1, fix(3)), (2, fix(1))])
+        self.assertEqual(self.kept(fix(4), fix(13)), [1])
+        self.assertEqual(self.filter.filter([(2, fix(2)), (3, fix(2))]), [1])
+    
+    @override_settings(AIS_COMPRESSION_ENABLED=False)
+    def test_disabled(self):
+        self.assertEqual(self.kept(fix(), fix(1)), [0, 1])
+
+
+@override_settings(AIS_COMPRESSION_ENABLED=True, AIS_COMPRESSION_KEEPALIVE_MINUTES=10)
+class DeadBandCommitTests(TestCase):
+    """The dead-band reference follows committed writes only"""
+    
+    def setUp(self):
+        cache.clear()
+        self.vessel = make_vessel()
+    
+    def test_committed_fix_becomes_the_reference(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            VesselService.apply_position_batch([(self.vessel, fix(0))])
+        self.assertIsNone(VesselService.update_vessel_position(self.vessel, fix(1)))
+    
+    def test_rolled_back_fix_is_forgotten(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                VesselService.apply_position_batch([(self.vessel, fix(0))])
+                raise RuntimeError('caller failed after the position write')
+        self.assertFalse(VesselPosition.objects.exists())
+        self.assertIsNotNone(VesselService.update_vessel_position(self.vessel, fix(0)))
+        self.assertEqual(VesselPosition.objects.count(), 1)
+
+
+@override_settings(AIS_POLL_MIN_SHARD_SIZE=50)
+class ShardMmsisTests(SimpleTestCase):
+    """Splitting a poll run across workers"""
+    
+    mmsis = [str(244000000 + i) for i in range(1000)]
+    
+    def test_every_mmsi_lands_in_exactly_one_shard(self):
+        shards = shard_mmsis(self.mmsis, 4)
+        self.assertEqual(len(shards), 4)
+        self.assertEqual(sorted(m for shard in shards for m in shard), sorted(self.mmsis))
+    
+    def test_assignment_is_stable(self):
+        # Same shard for an MMSI whatever else is due in the run
+        shards = shard_mmsis(self.mmsis, 4)
+        reversed_shards = shard_mmsis(self.mmsis[::-1], 4)
+        self.assertEqual([sorted(shard) for shard in shards], [sorted(shard) for shard in reversed_shards])
+        subset = shard_mmsis(self.mmsis[:500], 4)
+        home = {m: index for index, shard in enumerate(shards) for m in shard}
+        for shard in subset:
+            self.assertEqual(len({home[m] for m in shard}), 1)
+    
+    def test_small_runs_use_fewer_shards(self):
+        self.assertEqual(len(shard_mmsis(self.mmsis[:10], 4)), 1)
+        self.assertLessEqual(len(shard_mmsis(self.mmsis[:120], 4)), 3)
+        self.assertEqual(shard_mmsis([], 4), [])
+
+
+class PollShardTests(SimpleTestCase):
+    """Shard tasks always hand the chord callback a summary"""
+    
+    def setUp(self):
+        scheduler = mock.patch('apps.vessels.scheduler.PollScheduler')
+        self.scheduler = scheduler.start()
+        self.addCleanup(scheduler.stop)
+    
+    def test_database_error_is_summarised(self):
+        with mock.patch.object(Vessel.objects, 'filter', side_effect=DatabaseError('server closed the connection')):
+            summary = poll_vessel_shard(2, ['244000001', '244000002'], reschedule=True)
+        self.assertEqual((summary['shard'], summary['errors']), (2, 2))
+        self.assertEqual(summary['error'], 'server closed the connection')
+    
+    def test_rescheduling_error_is_summarised(self):
+        self.scheduler.return_value.reschedule.side_effect = RedisError('connection refused')
+        with mock.patch.object(Vessel.objects, 'filter', return_value=[]), \
+                mock.patch('apps.vessels.tasks.poll_and_store', return_value=({}, 0, 0)):
+            summary = poll_vessel_shard(0, [], reschedule=True)
+        self.assertEqual(summary['error'], 'connection refused')
+    
+    def test_failed_chord_releases_the_poll_lock(self):
+        with mock.patch('celery.chord') as chord:
+            dispatch_poll_shards(['244000001'], lock_token='token')
+        callback = chord.return_value.call_args.args[0]
+        (errback,) = callback.options['link_error']
+        self.assertEqual((errback.task, errback.kwargs), (release_poll_lock.name, {'lock_token': 'token'}))
+        
+        release_poll_lock(None, ValueError('worker lost'), None, lock_token='token')
+        self.scheduler.return_value.release.assert_called_once_with('token')
+
+
+@override_settings(AIS_COMPRESSION_ENABLED=False)
+class ApplyPositionBatchTests(TestCase):
+    """Batched position writes"""
+    
+    def setUp(self):
+        self.vessel = make_vessel()
+        self.other = make_vessel('244000002')
+    
+    def test_replayed_batch_stores_each_fix_once(self):
+        batch = [
+            (self.vessel, fix(0)), (self.vessel, fix(1, latitude=52.01)), (self.other, fix(0, longitude=4.2)),
+        ]
+        VesselService.apply_position_batch(batch)
+        VesselService.apply_position_batch(batch)
+        VesselService.apply_position_batch(batch[1:] + [(self.vessel, fix(2, latitude=52.02))])
+        
+        self.assertEqual(VesselPosition.objects.filter(vessel=self.vessel).count(), 3)
+        self.assertEqual(VesselPosition.objects.filter(vessel=self.other).count(), 1)
+    
+    def test_vessel_row_takes_the_latest_report(self):
+        VesselService.apply_position_batch([(self.vessel, fix(0)), (self.vessel, fix(1, latitude=52.5, sog=3.0))])
+        self.vessel.refresh_from_db()
+        self.assertEqual(float(self.vessel.latitude), 52.5)
+        self.assertEqual(float(self.vessel.speed_over_ground), 3.0)
+        self.assertEqual(self.vessel.last_position_update, utc(2026, 3, 1, 12, 1))
+    
+    def test_out_of_order_reports_only_reach_the_history(self):
+        VesselService.apply_position_batch([(self.vessel, fix(5, latitude=52.5)), (self.vessel, fix(1, latitude=52.1))])
+        VesselService.apply_position_batch([(self.vessel, fix(3, latitude=52.3))])
+        self.vessel.refresh_from_db()
+        self.assertEqual(float(self.vessel.latitude), 52.5)
+        self.assertEqual(self.vessel.last_position_update, utc(2026, 3, 1, 12, 5))
+        self.assertEqual(VesselPosition.objects.filter(vessel=self.vessel).count(), 3)
+    
+    def test_newer_fix_from_another_writer_is_kept(self):
+        stale = Vessel.objects.get(pk=self.vessel.pk)
+        VesselService.apply_position_batch([(self.vessel, fix(5, latitude=52.5))])
+        VesselService.apply_position_batch([(stale, fix(3, latitude=52.3))])
+        self.vessel.refresh_from_db()
+        self.assertEqual(float(self.vessel.latitude), 52.5)
+    
+    def test_empty_batch(self):
+        self.assertEqual(VesselService.apply_position_batch([]), [])
+
+
+@override_settings(AIS_COMPRESSION_ENABLED=True, AIS_COMPRESSION_KEEPALIVE_MINUTES=10)
+class BulkUpdatePositionsTests(TestCase):
+    """Set-based position updates and their row-by-row retry"""
+    
+    def setUp(self):
+        cache.clear()
+        make_vessel('244000001')
+        make_vessel('244000002')
+    
+    def test_counts_accepted_and_stored_fixes(self):
+        result = VesselService.bulk_update_positions([
+            fix(0, mmsi='244000001'), fix(1, mmsi='244000001'), fix(0, mmsi='244000002'), fix(0, mmsi='244999999'),
+        ])
+        # The second fix of 244000001 is a dead-band duplicate: accepted, not stored
+        self.assertEqual((result['updated'], result['stored']), (3, 2))
+        self.assertEqual(result['errors'], ['Vessel with MMSI 244999999 not found'])
+        self.assertEqual(VesselPosition.objects.count(), 2)
+    
+    def test_failed_batch_is_retried_row_by_row(self):
+        apply_position_batch = VesselService.apply_position_batch
+        
+        def flaky(updates):
+            if len(updates) > 1 or updates[0][0].mmsi == '244000002':
+                raise ValueError('constraint violated')
+            return apply_position_batch(updates)
+        
+        with mock.patch.object(VesselService, 'apply_position_batch', side_effect=flaky):
+            result = VesselService.bulk_update_positions([fix(0, mmsi='244000001'), fix(0, mmsi='244000002')])
+        self.assertEqual((result['updated'], result['stored']), (1, 1))
+        self.assertEqual(result['errors'], ['Error updating 244000002: constraint violated'])
+        self.assertEqual(list(VesselPosition.objects.values_list('vessel__mmsi', flat=True)), ['244000001'])
+
+
+@override_settings(AIS_RATE_LIMIT_REDIS_RETRY=30)
+class TokenBucketTests(SimpleTestCase):
+    """Provider token buckets, on the local fallback (no Redis here)"""
+    
+    def setUp(self):
+        self.redis = mock.Mock()
+        self.redis.return_value.eval.side_effect = RedisError('connection refused')
+        for patcher in (
+            mock.patch('apps.vessels.rate_limit.get_redis', self.redis),
+            mock.patch('apps.vessels.rate_limit._redis_retry_at', 0.0),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+    
+    def test_burst_then_refill_delay(self):
+        bucket = TokenBucket('standin', rate=10, burst=3)
+        self.assertEqual([bucket.take() for _ in range(3)], [0.0, 0.0, 0.0])
+        self.assertAlmostEqual(bucket.take(), 0.1, delta=0.01)
+        # Redis is not retried until AIS_RATE_LIMIT_REDIS_RETRY has passed
+        self.assertEqual(self.redis.return_value.eval.call_count, 1)
+        self.assertEqual(bucket.stats['local'], 4)
+    
+    def test_wait_queues_for_a_token(self):
+        bucket = TokenBucket('standin', rate=50, burst=1)
+        started = time.monotonic()
+        bucket.wait()
+        bucket.wait()
+        self.assertGreaterEqual(time.monotonic() - started, 0.015)
+        self.assertEqual(bucket.stats['granted'], 2)
+        self.assertGreaterEqual(bucket.stats['waits'], 1)
+    
+    def test_rejected_past_max_queue_wait(self):
+        bucket = TokenBucket('standin', rate=1, burst=1, max_queue_wait=0)
+        bucket.wait()
+        with self.assertRaises(ProviderRateLimited):
+            bucket.wait()
+        self.assertEqual(bucket.stats['rejected'], 1)
+    
+    def test_pause_empties_the_bucket(self):
+        bucket = TokenBucket('standin', rate=10, burst=5)
+        bucket.pause(2)
+        self.assertGreater(bucket.take(), 2)
+
+
+def serve_in_thread(test, handler_class):
+    """Start a stand-in HTTP server on a free port for the duration of a test"""
+    server = StandinServer(('127.0.0.1', 0), handler_class)
+    server.counts = Counter()
+    threading.Thread(target=server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+    test.addCleanup(server.server_close)
+    test.addCleanup(server.shutdown)
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def recorded(body, path='/', status=200, **query):
+    return {
+        'provider': 'aishub', 'method': 'GET', 'path': path, 'query': query,
+        'status': status, 'content_type': 'application/json', 'body': body, 'latency_ms': 0,
+    }
+
+
+class ReplayIndexTests(SimpleTestCase):
+    """Looking recorded responses up by request"""
+    
+    def setUp(self):
+        self.index = ReplayIndex([
+            recorded('exact', mmsi='244000001', format='1'),
+            recorded('other vessel', mmsi='244000002', format='1'),
+            recorded('other format', mmsi='244000002', format='0'),
+        ])
+    
+    def lookup(self, **query):
+        record = self.index.lookup('aishub', 'GET', '/', query)
+        return record and record['body']
+    
+    def test_exact_then_any_mmsi_then_any_query(self):
+        self.assertEqual(self.lookup(mmsi='244000001', format='1'), 'exact')
+        self.assertEqual(self.lookup(mmsi='244999999', format='0'), 'other format')
+        self.assertEqual(self.lookup(latmin='50'), 'exact')
+        self.assertIsNone(self.index.lookup('marinesia', 'GET', '/', {}))
+    
+    def test_repeated_requests_cycle(self):
+        self.assertEqual(
+            [self.lookup(mmsi='244999999', format='1') for _ in range(3)], ['exact', 'other vessel', 'exact']
+        )
+    
+    def test_credentials_do_not_affect_matching(self):
+        self.assertEqual(self.lookup(mmsi='244000001', format='1', username='secret'), 'exact')
+    
+    def test_api_key_in_the_path_is_not_recorded(self):
+        handle, path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, path)
+        base_url = 'https://services.marinetraffic.com/api'
+        recorder = ProviderRecorder(path)
+        recorder.record(
+            'marinetraffic', base_url, 'GET', f'{base_url}/exportvessel/v:8/s3cr3tk3y/timespan:10/mmsi:244000001/protocol:json',
+            200, 'application/json', '[["244000001"]]', 0.1,
+        )
+        recorder.close()
+        with open(path) as handle:
+            line = handle.read()
+        self.assertNotIn('s3cr3tk3y', line)
+        self.assertEqual(json.loads(line)['path'], '/exportvessel/v:8/*/timespan:10/mmsi:244000001/protocol:json')
+        
+        # Replayed for any key (and MMSI)
+        record = ReplayIndex.from_files([path]).lookup(
+            'marinetraffic', 'GET', '/exportvessel/v:8/otherkey/timespan:10/mmsi:244000002/protocol:json', {}
+        )
+        self.assertEqual(record['body'], '[["244000001"]]')
+
+
+@override_settings(AIS_PROVIDER_STANDIN_URL='', AIS_RECORD_PATH='')
+class ProviderStandinTests(SimpleTestCase):
+    """Recording through ProviderClient and replaying with provider_standin"""
+    
+    options = {
+        'latency_ms': 0, 'latency_scale': 1.0, 'jitter_ms': 0.0, 'error_rate': 0.0,
+        'throttle_rate': 0.0, 'payload_scale': 1.0, 'seed': 1,
+    }
+    
+    def setUp(self):
+        cache.clear()
+        handle, self.path = tempfile.mkstemp(suffix='.jsonl')
+        os.close(handle)
+        self.addCleanup(os.remove, self.path)
+    
+    def standin(self, records, **options):
+        handler = ProviderStandinCommand().handler_class(ReplayIndex(records), {**self.options, **options})
+        return serve_in_thread(self, handler)
+    
+    def provider_client(self, standin):
+        # As with AIS_PROVIDER_STANDIN_URL: no quota to protect, so no rate limit
+        config = {**get_provider_config('aishub'), 'base_url': f'{standin}/aishub', 'rate': None, 'max_retries': 0}
+        return ProviderClient('aishub', config)
+    
+    def test_recording_replays_through_a_second_standin(self):
+        body = '[{"ERROR": false}, [{"MMSI": 244000001, "LATITUDE": 52.1}, {"MMSI": 244000002, "LATITUDE": 52.2}]]'
+        client = self.provider_client(self.standin([recorded(body, mmsi='244000001')]))
+        start_recording(self.path)
+        try:
+            response = client.get(client.config['base_url'], params={'mmsi': '244000001', 'username': 'secret'})
+        finally:
+            stop_recording()
+        self.assertEqual(response.text, body)
+        
+        with open(self.path) as handle:
+            lines = handle.read().splitlines()
+        self.assertEqual(len(lines), 1)
+        self.assertNotIn('secret', lines[0])
+        self.assertEqual(json.loads(lines[0])['query'], {'mmsi': '244000001'})
+        
+        # Another MMSI gets the recorded response, with its vessel list doubled
+        replay = self.provider_client(self.standin([json.loads(lines[0])], payload_scale=2.0))
+        response = replay.get(replay.config['base_url'], params={'mmsi': '244000002'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()[1]), 4)
+    
+    def test_injected_errors_and_missing_recordings(self):
+        client = self.provider_client(self.standin([recorded('[]', mmsi='244000001')], error_rate=1.0))
+        self.assertEqual(client.get(client.config['base_url'], params={'mmsi': '244000001'}).status_code, 503)
+        self.assertEqual(client.stats()['errors'], 1)
+        
+        client = self.provider_client(self.standin([]))
+        self.assertEqual(client.get(f"{client.config['base_url']}/vessels").status_code, 404)
+
+
+class FleetSimulatorTests(SimpleTestCase):
+    """Deterministic synthetic fleet"""
+    
+    now = 1767225600  # 2026-01-01
+    
+    def setUp(self):
+        self.simulator = FleetSimulator(size=500, seed=7, mmsi_start=200000000, time_scale=1.0)
+    
+    def test_same_seed_same_fleet(self):
+        mmsis = self.simulator.fleet_mmsis()[:50]
+        same = FleetSimulator(size=500, seed=7, mmsi_start=200000000, time_scale=1.0)
+        other = FleetSimulator(size=500, seed=8, mmsi_start=200000000, time_scale=1.0)
+        self.assertEqual(self.simulator.positions(mmsis, self.now), same.positions(mmsis, self.now))
+        self.assertNotEqual(self.simulator.positions(mmsis, self.now), other.positions(mmsis, self.now))
+    
+    def test_tracks_are_continuous(self):
+        # Minute-by-minute moves through a week of departures, arrivals and berthings
+        mmsis = self.simulator.fleet_mmsis()
+        statuses = set()
+        for start in range(self.now, self.now + 7 * 86400, 3600):
+            before = self.simulator.state(mmsis, self.simulator.sim_time(start))
+            after = self.simulator.state(mmsis, self.simulator.sim_time(start + 60))
+            lat1, lat2 = np.radians(before['latitude']), np.radians(after['latitude'])
+            dlon = np.radians(after['longitude'] - before['longitude'])
+            cos_angle = np.sin(lat1) * np.sin(lat2) + np.cos(lat1) * np.cos(lat2) * np.cos(dlon)
+            moved_nm = EARTH_RADIUS_NM * np.arccos(np.clip(cos_angle, -1.0, 1.0))
+            # Under 23 kn along the lane is under 0.4 nm a minute, plus the offset turning through waypoints
+            self.assertLess(moved_nm.max(), 0.6)
+            statuses.update(before['status'].tolist())
+        self.assertEqual(statuses, {0, 1, 2})
+    
+    def test_area_matches_single_vessel_lookups(self):
+        vessels = self.simulator.in_area(-90, 90, -180, 180, self.now)
+        self.assertEqual(len(vessels), 500)
+        in_channel = self.simulator.in_area(49.0, 54.0, 0.0, 10.0, self.now)
+        self.assertTrue(in_channel)
+        for position in in_channel:
+            self.assertTrue(49.0 <= position['latitude'] <= 54.0 and 0.0 <= position['longitude'] <= 10.0)
+            self.assertEqual(position, self.simulator.position(position['mmsi'], self.now))
+    
+    def test_any_mmsi_is_simulated(self):
+        self.assertEqual(self.simulator.position(244000001, self.now)['mmsi'], '244000001')
+        self.assertEqual(self.simulator.positions(['not-an-mmsi']), {})
+
+
+class SimulatorProviderTests(SimpleTestCase):
+    """The simulator in-process and behind fleet_standin"""
+    
+    def setUp(self):
+        cache.clear()
+        # Both sides see the same simulated second
+        clock = mock.patch('apps.vessels.simulator.time', mock.Mock(time=lambda: 1767225600.0))
+        clock.start()
+        self.addCleanup(clock.stop)
+    
+    @override_settings(AIS_SIMULATOR_ENABLED=True)
+    def test_in_process_provider(self):
+        service = AISIntegrationService()
+        self.assertEqual(service.position_chain(), ['simulator'])
+        self.assertEqual(service.fetch_vessel_position('200000042'), get_simulator().position('200000042'))
+        records = service._fetch_provider_area(50.5, 51.5, 1.0, 2.0)
+        self.assertTrue(all(record['source'] == 'simulator' for record in records))
+    
+    def test_http_standin_serves_the_in_process_fleet(self):
+        simulator = get_simulator()
+        standin = serve_in_thread(self, FleetStandinCommand().handler_class(simulator, {'latency_ms': 0}))
+        config = {**get_provider_config('aishub'), 'base_url': f'{standin}/aishub', 'rate': None, 'max_retries': 0}
+        service = AISIntegrationService()
+        service.aishub_url = config['base_url']
+        
+        with mock.patch.object(service, '_http', return_value=ProviderClient('aishub', config)):
+            position = service._fetch_from_aishub('200000042')
+        expected = simulator.position('200000042')
+        self.assertEqual(position['mmsi'], '200000042')
+        self.assertEqual((position['latitude'], position['longitude']), (expected['latitude'], expected['longitude']))
+        self.assertEqual(position['course_over_ground'], expected['course_over_ground'])
+
+
+def track(*fixes):
+    """select_keepers frame from (vessel_id, seconds, sog, cog, status) tuples"""
+    frame = pd.DataFrame.from_records(
+        fixes, columns=['vessel_id', 'timestamp', 'speed_over_ground', 'course_over_ground', 'navigational_status']
+    )
+    frame['heading'] = 511
+    return frame
+
+
+class SelectKeepersTests(SimpleTestCase):
+    """Which fixes survive downsampling"""
+    
+    def kept(self, *fixes):
+        return select_keepers(track(*fixes), 600, 30).tolist()
+    
+    def test_first_fix_per_bucket(self):
+        self.assertEqual(
+            self.kept(*[(1, minute * 60, 10.0, 90.0, 'underway') for minute in range(0, 25, 4)]),
+            [True, False, False, True, False, True, False],
+        )
+    
+    def test_status_changes_and_turns(self):
+        self.assertEqual(self.kept(
+            (1, 0, 10.0, 90.0, 'underway'),
+            (1, 60, 10.0, 100.0, 'underway'),
+            (1, 120, 10.0, 135.0, 'underway'),  # 35 degree turn
+            (1, 180, 10.0, 150.0, 'underway'),
+            (1, 240, 0.1, 150.0, 'moored'),
+            (1, 300, 0.1, 300.0, 'moored'),  # course is noise when stationary
+        ), [True, False, True, False, True, False])
+    
+    def test_gradual_turn(self):
+        # A U-turn at 3 degrees per fix: every 30 degrees is kept
+        kept = self.kept(*[(1, second * 10, 12.0, second * 3.0, 'underway') for second in range(60)])
+        self.assertEqual([index for index, keep in enumerate(kept) if keep], [0, 10, 20, 30, 40, 50])
+    
+    def test_turn_while_stopped(self):
+        self.assertEqual(self.kept(
+            (1, 0, 10.0, 90.0, 'underway'),
+            (1, 60, 0.2, 90.0, 'underway'),
+            (1, 120, 10.0, 270.0, 'underway'),
+        ), [True, False, True])
+    
+    def test_turn_across_north(self):
+        self.assertEqual(self.kept((1, 0, 10.0, 350.0, 'underway'), (1, 60, 10.0, 10.0, 'underway')), [True, False])
+    
+    def test_each_vessel_starts_its_own_track(self):
+        self.assertEqual(self.kept(
+            (1, 0, 10.0, 90.0, 'underway'), (1, 60, 10.0, 90.0, 'underway'),
+            (2, 60, 10.0, 270.0, 'moored'), (2, 120, 10.0, 270.0, 'moored'),
+        ), [True, False, True, False])
+
+
+@override_settings(
+    AIS_POSITION_DOWNSAMPLE_TIERS=[(7, 600), (90, 3600)], AIS_POSITION_DOWNSAMPLE_TURN_DEG=30,
+    AIS_POSITION_DOWNSAMPLE_CHUNK_HOURS=1, AIS_POSITION_DOWNSAMPLE_TIME_BUDGET=60,
+)
+class DownsamplePositionsTests(TestCase):
+    """Tiered thinning of stored history"""
+    
+    now = utc(2026, 3, 31, 12)
+    
+    def setUp(self):
+        self.vessel = make_vessel()
+        for days_ago in (100, 30, 1):
+            start = self.now - timedelta(days=days_ago)
+            VesselPosition.objects.bulk_create([
+                VesselPosition(
+                    vessel=self.vessel, latitude=52.0, longitude=4.0 + minute / 1000, speed_over_ground=10.0,
+                    course_over_ground=90.0, navigational_status='underway', timestamp=start + timedelta(minutes=minute),
+                ) for minute in range(120)
+            ])
+    
+    def stored(self, days_ago):
+        start = self.now - timedelta(days=days_ago)
+        return VesselPosition.objects.filter(timestamp__gte=start, timestamp__lt=start + timedelta(hours=2)).count()
+    
+    def test_each_age_band_gets_its_resolution(self):
+        stats = downsample_positions(now=self.now)
+        # Hourly beyond 90 days, every 10 minutes from 7 days, untouched below
+        self.assertEqual((self.stored(100), self.stored(30), self.stored(1)), (2, 12, 120))
+        self.assertEqual(stats[3600]['deleted'], 118)
+        self.assertEqual(stats[600]['deleted'], 108)
+        self.assertEqual(
+            PositionDownsampleWatermark.objects.get(resolution_seconds=600).processed_until, utc(2026, 3, 24, 12)
+        )
+    
+    def test_runs_resume_from_the_watermark(self):
+        downsample_positions(now=self.now)
+        stats = downsample_positions(now=self.now + timedelta(hours=1))
+        self.assertEqual(stats[600]['examined'], 0)
+        self.assertEqual(stats[3600]['examined'], 0)
+    
+    def test_out_of_time_runs_stop_early(self):
+        stats = downsample_positions(now=self.now, time_budget=0)
+        self.assertEqual(stats[600]['chunks'], 0)
+        self.assertEqual(self.stored(30), 120)
+
+
+class SQLitePartitionTests(TestCase):
+    """Shard tables behind the vessel_positions view (partitioning is opt-in)"""
+    
+    def setUp(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite shards only')
+        self.vessel = make_vessel()
+        VesselPosition.objects.create(vessel=self.vessel, latitude=52, longitude=4, timestamp=utc(2026, 3, 10, 12))
+        self.assertTrue(partition_positions())
+        self.partitioner = SQLitePartitioner(connection)
+        ensure_partitions(utc(2026, 3, 1), utc(2026, 5, 1))
+    
+    def test_existing_rows_move_into_their_shard(self):
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM vessel_positions_p20260301')
+            self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertEqual(VesselPosition.objects.count(), 1)
+    
+    def test_route_by_timestamp_text(self):
+        rows = [(1, '2026-03-31 23:59:59'), (2, '2026-04-01 00:00:00'), (3, '2025-01-01 00:00:00')]
+        routed = self.partitioner.route(rows, 1)
+        self.assertEqual(routed['vessel_positions_p20260301'], [rows[0]])
+        self.assertEqual(routed['vessel_positions_p20260401'], [rows[1]])
+        self.assertEqual(routed[DEFAULT_PARTITION], [rows[2]])
+    
+    def test_tables_limited_to_overlapping_shards(self):
+        self.assertEqual(
+            self.partitioner.tables(utc(2026, 4, 5), utc(2026, 4, 6)), [DEFAULT_PARTITION, 'vessel_positions_p20260401']
+        )
+    
+    def test_create_through_view_returns_no_primary_key(self):
+        # The INSTEAD OF trigger cannot report the shard row's key back
+        position = VesselPosition.objects.create(vessel=self.vessel, latitude=53, longitude=5, timestamp=utc(2026, 4, 2))
+        self.assertIsNone(position.pk)
+        stored = VesselPosition.objects.get(vessel=self.vessel, timestamp=utc(2026, 4, 2))
+        self.assertEqual(float(stored.latitude), 53)
+    
+    def test_save_of_loaded_row_updates_it(self):
+        # UPDATE through the view reports 0 rows; select_on_save keeps save() from inserting a duplicate
+        position = VesselPosition.objects.get()
+        position.latitude = 51
+        position.save()
+        self.assertEqual(VesselPosition.objects.count(), 1)
+        self.assertEqual(float(VesselPosition.objects.get().latitude), 51)
+    
+    def test_unpartition_restores_plain_table(self):
+        VesselPosition.objects.create(vessel=self.vessel, latitude=53, longitude=5, timestamp=utc(2026, 4, 2))
+        self.assertTrue(unpartition_positions())
+        self.assertFalse(self.partitioner.is_partitioned())
+        self.assertEqual(VesselPosition.objects.count(), 2)
+        position = VesselPosition.objects.create(vessel=self.vessel, latitude=54, longitude=6, timestamp=utc(2026, 4, 3))
+        self.assertIsNotNone(position.pk)
@@ -0,0 +1,130 @@
+"""
+Tile cache for upstream area queries
+The globe is split into fixed lat/lon tiles per zoom level and provider
+results are cached per tile, so overlapping viewports share upstream calls
+"""
+
+import logging
+import math
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+
+class TileCache:
+    """
+    TTL cache of area query results keyed by (zoom, x, y) tile
+    
+    Zoom z splits longitude into 2**z columns and latitude into 2**(z-1) rows,
+    so every tile is 360 / 2**z degrees square. A bbox is served at the deepest
+    zoom whose tile count stays within AIS_TILE_MAX_TILES; cached tiles are
+    read in one get_many and only missing or expired tiles are fetched, with a
+    single upstream call covering all of them.
+    """
+    
+    def __init__(self, fetch_area, namespace='ais:tile', ttl=None, min_zoom=None, max_zoom=None, max_tiles=None):
+        # fetch_area(min_lat, max_lat, min_lon, max_lon) -> list of dicts with mmsi/latitude/longitude
+        self.fetch_area = fetch_area
+        self.namespace = namespace
+        self.ttl = ttl or getattr(settings, 'AIS_TILE_TTL', 60)
+        self.min_zoom = min_zoom or getattr(settings, 'AIS_TILE_MIN_ZOOM', 2)
+        self.max_zoom = max_zoom or getattr(settings, 'AIS_TILE_MAX_ZOOM', 8)
+        self.max_tiles = max_tiles or getattr(settings, 'AIS_TILE_MAX_TILES', 16)
+        self.stats = {'hits': 0, 'misses': 0, 'upstream_calls': 0}
+    
+    def tile_size(self, zoom):
+        return 360.0 / (2 ** zoom)
+    
+    def tile_for_point(self, zoom, lat, lon):
+        size = self.tile_size(zoom)
+        x = min(max(int(math.floor((lon + 180.0) / size)), 0), 2 ** zoom - 1)
+        y = min(max(int(math.floor((lat + 90.0) / size)), 0), 2 ** (zoom - 1) - 1)
+        return (zoom, x, y)
+    
+    def tile_bounds(self, tile):
+        """(min_lat, max_lat, min_lon, max_lon) of a tile"""
+        zoom, x, y = tile
+        size = self.tile_size(zoom)
+        return (y * size - 90.0, (y + 1) * size - 90.0, x * size - 180.0, (x + 1) * size - 180.0)
+    
+    def tiles_for_bbox(self, zoom, min_lat, max_lat, min_lon, max_lon):
+        _, min_x, min_y = self.tile_for_point(zoom, min_lat, min_lon)
+        _, max_x, max_y = self.tile_for_point(zoom, max_lat, max_lon)
+        return [(zoom, x, y) for x in range(min_x, max_x + 1) for y in range(min_y, max_y + 1)]
+    
+    def choose_zoom(self, min_lat, max_lat, min_lon, max_lon):
+        """Deepest zoom at which the bbox needs no more than max_tiles tiles"""
+        for zoom in range(self.max_zoom, self.min_zoom - 1, -1):
+            _, min_x, min_y = self.tile_for_point(zoom, min_lat, min_lon)
+            _, max_x, max_y = self.tile_for_point(zoom, max_lat, max_lon)
+            if (max_x - min_x + 1) * (max_y - min_y + 1) <= self.max_tiles:
+                return zoom
+        return self.min_zoom
+    
+    def _key(self, tile):
+        return f"{self.namespace}:{tile[0]}:{tile[1]}:{tile[2]}"
+    
+    def get(self, min_lat, max_lat, min_lon, max_lon):
+        """
+        Records inside the bbox, assembled from cached tiles
+        Missing or expired tiles are fetched from upstream and cached
+        """
+        min_lat, max_lat, min_lon, max_lon = float(min_lat), float(max_lat), float(min_lon), float(max_lon)
+        zoom = self.choose_zoom(min_lat, max_lat, min_lon, max_lon)
+        tiles = {self._key(tile): tile for tile in self.tiles_for_bbox(zoom, min_lat, max_lat, min_lon, max_lon)}
+        
+        try:
+            cached = cache.get_many(list(tiles))
+        except Exception as e:
+            logger.warning(f"Tile cache read failed: {str(e)}")
+            cached = {}
+        
+        missing = [tile for key, tile in tiles.items() if key not in cached]
+        self.stats['hits'] += len(tiles) - len(missing)
+        self.stats['misses'] += len(missing)
+        if missing:
+            cached.update(self._fill(missing))
+        
+        logger.debug(f"Area tiles at zoom {zoom}: {len(tiles) - len(missing)} cached, {len(missing)} fetched")
+        
+        records = []
+        seen = set()
+        for key in tiles:
+            for record in cached.get(key, []):
+                mmsi = record.get('mmsi')
+                if mmsi in seen:
+                    continue
+                if min_lat <= float(record['latitude']) <= max_lat and min_lon <= float(record['longitude']) <= max_lon:
+                    seen.add(mmsi)
+                    records.append(record)
+        return records
+    
+    def _fill(self, missing):
+        """Fetch the bbox covering all missing tiles once and split the result into tiles"""
+        bounds = [self.tile_bounds(tile) for tile in missing]
+        self.stats['upstream_calls'] += 1
+        fetched = self.fetch_area(
+            min(b[0] for b in bounds),
+            max(b[1] for b in bounds),
+            min(b[2] for b in bounds),
+            max(b[3] for b in bounds),
+        )
+        
+        zoom = missing[0][0]
+        filled = {self._key(tile): [] for tile in missing}
+        for record in fetched or []:
+            try:
+                tile = self.tile_for_point(zoom, float(record['latitude']), float(record['longitude']))
+            except (KeyError, TypeError, ValueError):
+                continue
+            key = self._key(tile)
+            if key in filled:
+                filled[key].append(record)
+        
+        try:
+            cache.set_many(filled, self.ttl)
+        except Exception as e:
+            logger.warning(f"Tile cache write failed: {str(e)}")
+        return filled
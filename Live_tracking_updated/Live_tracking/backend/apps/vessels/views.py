@@ -8,10 +8,14 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Q
 from django.conf import settings
+from django.http import StreamingHttpResponse
 from datetime import datetime, timedelta
+import json
 import logging
+from redis.exceptions import RedisError
 
 from apps.authentication.permissions import IsOperator, IsAnalyst, IsAdmin
 from .models import Vessel, VesselPosition, VesselNote, VesselRoute
@@ -23,9 +27,43 @@ from .serializers import (
 )
 from .services import VesselService, AISIntegrationService, VesselAnalyticsService
 from .analytics import VesselAnalytics
+from .providers import provider_pool_stats
+from .provider_health import health_snapshot
+from .singleflight import singleflight_stats
+from .compression import compression_stats
+from .weather_grid import weather_grid_stats
+from .profile_cache import profile_cache_stats
+from .fix_queue import fix_queue_stats
+from .scheduler import PollScheduler, mark_watched
+from .live_picture import ID_LOOKUP_BATCH, vessels_in_area
+from .ingest import PositionUploadIngest
 
 logger = logging.getLogger(__name__)
 
+UPLOAD_FORMATS = {
+    'application/x-ndjson': 'ndjson',
+    'application/jsonl': 'ndjson',
+    'application/json-lines': 'ndjson',
+    'text/csv': 'csv',
+}
+MAX_REPORTED_UPLOAD_ERRORS = 1000
+
+
+def _request_body_lines(request):
+    """
+    Iterate the raw request body line by line without buffering it
+    Django reads nothing from a chunked WSGI body (no Content-Length), so
+    when the server has already de-chunked it (wsgi.input_terminated) the
+    input stream is read directly
+    """
+    django_request = request._request
+    environ = getattr(django_request, 'environ', {})
+    if not environ.get('CONTENT_LENGTH') and environ.get('wsgi.input_terminated'):
+        stream = environ['wsgi.input']
+    else:
+        stream = django_request
+    return iter(stream.readline, b'')
+
 
 class VesselViewSet(viewsets.ModelViewSet):
     """
@@ -107,6 +145,9 @@ class VesselViewSet(viewsets.ModelViewSet):
                     }
                 }, status=status.HTTP_403_FORBIDDEN)
         
+        # Someone is looking at this vessel: poll it more often for a while
+        mark_watched([instance.mmsi])
+        
         serializer = self.get_serializer(instance)
         return Response({
             'success': True,
@@ -201,6 +242,8 @@ class VesselViewSet(viewsets.ModelViewSet):
                     }
                 }, status=status.HTTP_403_FORBIDDEN)
         
+        mark_watched([vessel.mmsi])
+        
         # Parse date parameters
         start_str = request.query_params.get('start')
         end_str = request.query_params.get('end')
@@ -291,6 +334,8 @@ class VesselViewSet(viewsets.ModelViewSet):
     def map_view(self, request):
         """
         Get vessels in a bounding box for map display
+        The bbox is resolved against the live picture (see refresh_live_picture);
+        only vessels in the database are returned, as VesselListSerializer data
         GET /api/vessels/map_view/?min_lat=...&max_lat=...&min_lon=...&max_lon=...
         """
         try:
@@ -304,14 +349,19 @@ class VesselViewSet(viewsets.ModelViewSet):
                 'error': {'message': 'Invalid bounding box coordinates'}
             }, status=status.HTTP_400_BAD_REQUEST)
         
-        vessels = VesselService.get_vessels_in_area(min_lat, max_lat, min_lon, max_lon)
+        records, picture_meta = vessels_in_area(min_lat, max_lat, min_lon, max_lon)
+        vessel_ids = [record['id'] for record in records if record.get('id') is not None]
+        vessels = []
+        for start in range(0, len(vessel_ids), ID_LOOKUP_BATCH):
+            vessels.extend(Vessel.objects.filter(id__in=vessel_ids[start:start + ID_LOOKUP_BATCH], is_deleted=False))
         serializer = VesselListSerializer(vessels, many=True)
         
         return Response({
             'success': True,
             'data': {
-                'count': vessels.count(),
-                'vessels': serializer.data
+                'count': len(serializer.data),
+                'vessels': serializer.data,
+                **picture_meta
             }
         })
     
@@ -339,6 +389,56 @@ class VesselViewSet(viewsets.ModelViewSet):
             'data': result
         })
     
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated, IsAdmin])
+    def ingest_positions(self, request):
+        """
+        Streaming position ingest for large uploads (NDJSON or CSV, may be chunked)
+        The body is parsed line by line and committed every batch_size rows
+        POST /api/vessels/ingest_positions/?batch_size=1000[&progress=stream]
+        Content-Type: application/x-ndjson or text/csv
+        With progress=stream the response is NDJSON: one line per committed
+        batch, then a final summary line
+        """
+        content_type = (request.content_type or '').split(';')[0].strip().lower()
+        upload_format = UPLOAD_FORMATS.get(content_type)
+        if upload_format is None:
+            return Response({
+                'success': False,
+                'error': {'message': f"Unsupported content type '{content_type}', use application/x-ndjson or text/csv"}
+            }, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+        
+        try:
+            batch_size = int(request.query_params.get('batch_size', getattr(settings, 'AIS_UPLOAD_BATCH_SIZE', 1000)))
+        except ValueError:
+            return Response({
+                'success': False,
+                'error': {'message': 'batch_size must be an integer'}
+            }, status=status.HTTP_400_BAD_REQUEST)
+        batch_size = max(1, min(batch_size, getattr(settings, 'AIS_UPLOAD_MAX_BATCH_SIZE', 10000)))
+        
+        ingest = PositionUploadIngest(_request_body_lines(request), format=upload_format, batch_size=batch_size)
+        
+        if request.query_params.get('progress') == 'stream':
+            def progress():
+                for summary in ingest.batches():
+                    yield json.dumps(summary, default=str) + '\n'
+                yield json.dumps({'success': True, 'data': dict(ingest.totals)}) + '\n'
+            return StreamingHttpResponse(progress(), content_type='application/x-ndjson')
+        
+        # Keep only a bounded sample of errors so the summary stays small for huge uploads
+        errors = []
+        for summary in ingest.batches():
+            if len(errors) < MAX_REPORTED_UPLOAD_ERRORS:
+                errors.extend(summary['errors'][:MAX_REPORTED_UPLOAD_ERRORS - len(errors)])
+        
+        return Response({
+            'success': True,
+            'data': {
+                **ingest.totals,
+                'errors': errors
+            }
+        })
+    
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAnalyst])
     def fleet_statistics(self, request):
         """
@@ -352,6 +452,31 @@ class VesselViewSet(viewsets.ModelViewSet):
             'data': stats
         })
     
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsAdmin])
+    def provider_stats(self, request):
+        """
+        Connection pool utilisation, circuit breaker state, request
+        coalescing, history compression, weather grid and profile cache
+        counters in this process,
+        plus the shared polling schedule and ingestion queue depth/lag
+        GET /api/vessels/provider_stats/
+        """
+        stats = provider_pool_stats()
+        stats['health'] = health_snapshot()
+        stats['singleflight'] = singleflight_stats()
+        stats['compression'] = compression_stats()
+        stats['weather_grid'] = weather_grid_stats()
+        stats['profiles'] = profile_cache_stats()
+        stats['queue'] = fix_queue_stats()
+        try:
+            stats['schedule'] = PollScheduler().stats()
+        except RedisError as e:
+            stats['schedule'] = {'error': str(e)}
+        return Response({
+            'success': True,
+            'data': stats
+        })
+    
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated, IsOperator])
     def analytics(self, request):
         """
@@ -386,7 +511,9 @@ class VesselViewSet(viewsets.ModelViewSet):
     def realtime_positions(self, request):
         """
         Get real-time positions for vessels accessible to the user's role
-        Uses FREE AISHub API for live vessel tracking
+        Served from the live picture kept up to date by the refresh_live_picture
+        task (MarineSia/AISHub/MarineTraffic + database); updated_at and
+        age_seconds tell clients how old the data is
         
         Role-based visibility:
         - Operators: See only assigned vessels
@@ -430,22 +557,11 @@ class VesselViewSet(viewsets.ModelViewSet):
                     'error': {'message': 'Invalid longitude range: must be between -180 and 180, min_lon <= max_lon'}
                 }, status=status.HTTP_400_BAD_REQUEST)
             
-            # Fetch real-time data from AIS sources
-            ais_service = AISIntegrationService()
-            vessels = ais_service.fetch_vessels_in_area(min_lat, max_lat, min_lon, max_lon)
-            
-            if vessels is None:
-                vessels = []
-            
-            # Enrich vessels with database IDs
-            from .models import Vessel as VesselModel, VesselAssignment
-            mmsi_to_id_map = dict(
-                VesselModel.objects.filter(mmsi__in=[v.get('mmsi') for v in vessels])
-                .values_list('mmsi', 'id')
-            )
+            # Served from the background-maintained live picture; no upstream I/O here
+            vessels, picture_meta = vessels_in_area(min_lat, max_lat, min_lon, max_lon)
+            total = len(vessels)
             
-            for vessel in vessels:
-                vessel['id'] = mmsi_to_id_map.get(vessel.get('mmsi'))
+            from .models import VesselAssignment
             
             # Filter vessels based on user role
             if request.user.role == 'operator':
@@ -464,7 +580,7 @@ class VesselViewSet(viewsets.ModelViewSet):
                     logger.info(f"Showing all {len(vessels)} vessels to operator {request.user.email} (no assignments configured)")
                 else:
                     vessels = [v for v in vessels if v.get('mmsi') in assigned_mmsi]
-                    logger.info(f"Filtered {len(vessels)} vessels for operator {request.user.email} from {len(ais_service.fetch_vessels_in_area(min_lat, max_lat, min_lon, max_lon))} total")
+                    logger.info(f"Filtered {len(vessels)} vessels for operator {request.user.email} from {total} total")
             else:
                 # Analysts and Admins see all vessels
                 logger.info(f"Showing {len(vessels)} vessels to {request.user.role} {request.user.email}")
@@ -476,8 +592,10 @@ class VesselViewSet(viewsets.ModelViewSet):
                 'data': {
                     'vessels': vessels,
                     'count': len(vessels),
-                    'source': 'aishub_free',
+                    'source': picture_meta['source'],
                     'timestamp': timezone.now().isoformat(),
+                    'updated_at': picture_meta['updated_at'],
+                    'age_seconds': picture_meta['age_seconds'],
                     'user_role': request.user.role,
                     'filtered': request.user.role == 'operator'
                 }
@@ -546,33 +664,27 @@ class VesselViewSet(viewsets.ModelViewSet):
                     'error': {'message': 'Invalid coordinate data from AIS source'}
                 }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
-            # Update vessel with latest data
-            vessel.latitude = position_data['latitude']
-            vessel.longitude = position_data['longitude']
-            vessel.speed_over_ground = position_data.get('speed_over_ground', 0)
-            vessel.course_over_ground = position_data.get('course_over_ground', 0)
-            vessel.heading = position_data.get('heading')
-            vessel.navigational_status = position_data.get('navigational_status', vessel.navigational_status)
-            vessel.last_position_update = timezone.now()
-            vessel.data_source = position_data.get('data_source', 'ais')
+            data_source = position_data.get('data_source', 'ais')
             
             # Update vessel name if available and not set
             if not vessel.vessel_name and position_data.get('vessel_name'):
                 vessel.vessel_name = position_data['vessel_name']
+            vessel.data_source = data_source
             
-            vessel.save()
-            
-            # Create position history record
-            VesselPosition.objects.create(
-                vessel=vessel,
-                latitude=position_data['latitude'],
-                longitude=position_data['longitude'],
-                speed_over_ground=position_data.get('speed_over_ground', 0),
-                course_over_ground=position_data.get('course_over_ground', 0),
-                heading=position_data.get('heading'),
-                timestamp=timezone.now(),
-                data_source=position_data.get('data_source', 'ais')
-            )
+            # Current position and history go through the shared write path
+            # (dead-band filter, idempotent insert)
+            with transaction.atomic():
+                VesselService.apply_position_batch([(vessel, {
+                    'latitude': position_data['latitude'],
+                    'longitude': position_data['longitude'],
+                    'speed_over_ground': position_data.get('speed_over_ground', 0),
+                    'course_over_ground': position_data.get('course_over_ground', 0),
+                    'heading': position_data.get('heading'),
+                    'navigational_status': position_data.get('navigational_status'),
+                    'timestamp': timezone.now(),
+                    'data_source': data_source,
+                })])
+                vessel.save(update_fields=['vessel_name', 'data_source', 'updated_at'])
             
             serializer = VesselDetailSerializer(vessel)
             
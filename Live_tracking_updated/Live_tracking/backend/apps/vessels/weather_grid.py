@@ -0,0 +1,174 @@
+"""
+Gridded weather cache
+StormGlass point forecasts are cached at the nodes of a fixed lat/lon grid
+(AIS_WEATHER_CELL_DEG apart) for AIS_WEATHER_TTL seconds and filled lazily.
+Each vessel gets weather bilinearly interpolated from the four nodes around
+it, so viewports share cached nodes instead of spending API quota per request
+"""
+
+import logging
+import math
+from collections import Counter
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from .singleflight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+WEATHER_FIELDS = ('wave_height', 'wave_direction', 'wind_speed', 'wind_direction', 'air_temperature', 'water_temperature')
+# Angles are interpolated as unit vectors so 350 and 10 degrees average to 0, not 180
+DIRECTION_FIELDS = ('wave_direction', 'wind_direction')
+
+# Cached for failed or empty fetches so an unavailable node is not retried on every request
+_UNAVAILABLE = 'unavailable'
+
+weather_flight = SingleFlight('weather')
+
+# Shared by every grid in the process (service instances are short-lived)
+_grid_stats = Counter()
+
+
+class WeatherGrid:
+    """
+    Lazily filled grid of weather nodes keyed by (row, column)
+    
+    Node (i, j) sits at (i * cell, j * cell). Missing nodes are fetched at most
+    AIS_WEATHER_MAX_FETCH per call, those surrounding the most vessels first;
+    vessels whose corner nodes are not all known are interpolated from the
+    ones that are (weights renormalised).
+    """
+    
+    def __init__(self, fetch_point, namespace='weather:grid', cell_deg=None, ttl=None, max_fetch=None):
+        # fetch_point(lat, lon) -> dict with WEATHER_FIELDS or None
+        self.fetch_point = fetch_point
+        self.cell = cell_deg or getattr(settings, 'AIS_WEATHER_CELL_DEG', 1.0)
+        self.namespace = f"{namespace}:{self.cell}"
+        self.ttl = ttl or getattr(settings, 'AIS_WEATHER_TTL', 3600)
+        self.failure_ttl = getattr(settings, 'AIS_WEATHER_FAILURE_TTL', 300)
+        self.max_fetch = max_fetch if max_fetch is not None else getattr(settings, 'AIS_WEATHER_MAX_FETCH', 8)
+        self.columns = int(round(360 / self.cell))
+        self.max_row = max(1, int(math.floor(90 / self.cell + 1e-9)))
+        self.stats = _grid_stats
+    
+    def _key(self, node):
+        return f"{self.namespace}:{node[0]}:{node[1]}"
+    
+    def _node_position(self, node):
+        lon = node[1] * self.cell
+        return node[0] * self.cell, ((lon + 180) % 360) - 180
+    
+    def interpolate(self, latitudes, longitudes):
+        """
+        Weather for each point as an (n, len(WEATHER_FIELDS)) array, NaN where
+        no surrounding node is known
+        """
+        lat = np.clip(np.asarray(latitudes, dtype=float), -90.0, 90.0)
+        lon = np.asarray(longitudes, dtype=float)
+        
+        y = lat / self.cell
+        x = lon / self.cell
+        # The lower row stops one short of the polar row so i0 + 1 is still a node at or below 90 degrees
+        i0 = np.clip(np.floor(y).astype(int), -self.max_row, self.max_row - 1)
+        j0 = np.floor(x).astype(int)
+        fy = np.clip(y - i0, 0.0, 1.0)
+        fx = x - j0
+        
+        # Corners: (i0, j0), (i0, j0+1), (i0+1, j0), (i0+1, j0+1); columns wrap at the antimeridian
+        rows = np.stack([i0, i0, i0 + 1, i0 + 1], axis=1)
+        cols = np.stack([j0, j0 + 1, j0, j0 + 1], axis=1) % self.columns
+        weights = np.stack([(1 - fy) * (1 - fx), (1 - fy) * fx, fy * (1 - fx), fy * fx], axis=1)
+        
+        # One integer id per node keeps the de-duplication one-dimensional (and fast)
+        ids, inverse = np.unique(rows * self.columns + cols, return_inverse=True)
+        inverse = inverse.reshape(rows.shape)
+        nodes = [(int(node_id // self.columns), int(node_id % self.columns)) for node_id in ids.tolist()]
+        values = self._node_values(nodes, np.bincount(inverse.ravel()))
+        
+        # Directions become (sin, cos) columns so they can be averaged linearly
+        direction_idx = [WEATHER_FIELDS.index(name) for name in DIRECTION_FIELDS]
+        radians = np.radians(values[:, direction_idx])
+        components = np.concatenate([values, np.sin(radians), np.cos(radians)], axis=1)
+        
+        corner_values = components[inverse]  # (points, 4, fields)
+        known = ~np.isnan(corner_values)
+        corner_weights = np.where(known, weights[:, :, None], 0.0)
+        total = corner_weights.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            blended = np.nansum(np.where(known, corner_values, 0.0) * corner_weights, axis=1) / total
+        blended[total == 0] = np.nan
+        
+        n = len(WEATHER_FIELDS)
+        sin_part = blended[:, n:n + len(direction_idx)]
+        cos_part = blended[:, n + len(direction_idx):]
+        result = blended[:, :n]
+        result[:, direction_idx] = np.round(np.degrees(np.arctan2(sin_part, cos_part)), 6) % 360
+        return result
+    
+    def _node_values(self, nodes, demand):
+        """Cached node values as an array, fetching the most demanded missing nodes"""
+        keys = [self._key(node) for node in nodes]
+        try:
+            cached = cache.get_many(keys)
+        except Exception as e:
+            logger.warning(f"Weather grid read failed: {str(e)}")
+            cached = {}
+        
+        missing = [index for index, key in enumerate(keys) if key not in cached]
+        self.stats['hits'] += len(keys) - len(missing)
+        self.stats['misses'] += len(missing)
+        missing.sort(key=lambda index: -demand[index])
+        for index in missing[:self.max_fetch]:
+            cached[keys[index]] = weather_flight.do(keys[index], lambda node=nodes[index], key=keys[index]: self._fill(node, key))
+        self.stats['deferred'] += max(0, len(missing) - self.max_fetch)
+        
+        values = np.full((len(nodes), len(WEATHER_FIELDS)), np.nan)
+        for index, key in enumerate(keys):
+            weather = cached.get(key)
+            if isinstance(weather, dict):
+                values[index] = [np.nan if weather.get(name) is None else float(weather[name]) for name in WEATHER_FIELDS]
+        return values
+    
+    def _fill(self, node, key):
+        lat, lon = self._node_position(node)
+        self.stats['upstream_calls'] += 1
+        weather = self.fetch_point(lat, lon)
+        try:
+            if weather:
+                cache.set(key, weather, self.ttl)
+            else:
+                cache.set(key, _UNAVAILABLE, self.failure_ttl)
+        except Exception as e:
+            logger.warning(f"Weather grid write failed: {str(e)}")
+        return weather or _UNAVAILABLE
+    
+    def enhance(self, vessels):
+        """Attach interpolated weather to vessel dicts with latitude/longitude"""
+        located = []
+        for vessel in vessels:
+            try:
+                located.append((vessel, float(vessel['latitude']), float(vessel['longitude'])))
+            except (KeyError, TypeError, ValueError):
+                continue
+        if not located:
+            return vessels
+        
+        weather = self.interpolate([lat for _, lat, _ in located], [lon for _, _, lon in located])
+        enhanced = 0
+        for (vessel, _, _), row in zip(located, weather.tolist()):
+            if all(math.isnan(value) for value in row):
+                continue
+            vessel['weather'] = {
+                name: None if math.isnan(value) else round(value, 2)
+                for name, value in zip(WEATHER_FIELDS, row)
+            }
+            vessel['weather_source'] = 'stormglass'
+            enhanced += 1
+        logger.debug(f"Interpolated weather for {enhanced} of {len(located)} vessels")
+        return vessels
+
+
+def weather_grid_stats():
+    return dict(_grid_stats)
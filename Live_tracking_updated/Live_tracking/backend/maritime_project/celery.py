@@ -19,20 +19,32 @@ app.autodiscover_tasks()
 
 # Celery Beat Schedule
 app.conf.beat_schedule = {
-    # Update vessel positions every 60 seconds
-    'update-vessel-positions': {
-        'task': 'apps.vessels.tasks.update_vessel_positions',
-        'schedule': 60.0,  # Every 60 seconds
+    # Poll vessels that are due per their own update frequency (see apps/vessels/scheduler.py)
+    'poll-due-vessels': {
+        'task': 'apps.vessels.tasks.poll_due_vessels',
+        'schedule': 5.0,  # Scheduler tick; runs never overlap (Redis lock)
+        'options': {'expires': 5},
+    },
+    # Rebuild the live picture served to map clients every 30 seconds
+    'refresh-live-picture': {
+        'task': 'apps.vessels.tasks.refresh_live_picture',
+        'schedule': 30.0,
+        'options': {'expires': 25},  # drop runs that could not start before the next one
     },
     # Check for stale vessel tracking every 6 hours
     'check-vessel-tracking-status': {
         'task': 'apps.vessels.tasks.check_vessel_tracking_status',
         'schedule': crontab(minute=0, hour='*/6'),  # Every 6 hours
     },
-    # Clean up old vessel positions daily
+    # Create upcoming vessel position partitions ahead of time
+    'ensure-position-partitions': {
+        'task': 'apps.vessels.tasks.ensure_position_partitions',
+        'schedule': crontab(hour=0, minute=30),  # Daily at 0:30 AM
+    },
+    # Downsample (and expire) old vessel positions, a time-boxed chunk per run
     'cleanup-old-positions': {
         'task': 'apps.vessels.tasks.cleanup_old_positions',
-        'schedule': crontab(hour=1, minute=0),  # Daily at 1:00 AM
+        'schedule': crontab(minute=15),  # Hourly
     },
     # Clean up old audit logs daily
     'cleanup-audit-logs': {
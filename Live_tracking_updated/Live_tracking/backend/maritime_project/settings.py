@@ -246,9 +246,31 @@ if not DEBUG:
     SECURE_CONTENT_TYPE_NOSNIFF = True
     X_FRAME_OPTIONS = 'DENY'
 
+# Cache Configuration
+# Shared state for AIS ingestion (provider health, caches) lives in Redis;
+# without REDIS_URL each process falls back to local memory
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+            'KEY_PREFIX': 'maritime',
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Redis (Celery broker and shared ingestion state)
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+REDIS_SOCKET_TIMEOUT = 5  # seconds
+
 # Celery Configuration
-CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
@@ -260,6 +282,8 @@ MARINESIA_API_KEY = os.getenv('MARINESIA_API_KEY', '')  # Free API - Optional bu
 UNCTAD_API_KEY = os.getenv('UNCTAD_API_KEY', '')
 NOAA_API_KEY = os.getenv('NOAA_API_KEY', '')
 STORMGLASS_API_KEY = os.getenv('STORMGLASS_API_KEY', '')
+AISSTREAM_API_KEY = os.getenv('AISSTREAM_API_KEY', '')  # Free - push-based stream (ingest_aisstream)
+AISSTREAM_URL = os.getenv('AISSTREAM_URL', 'wss://stream.aisstream.io/v0/stream')
 
 # Application-Specific Settings
 MAX_LOGIN_ATTEMPTS = 5
@@ -268,6 +292,148 @@ CONGESTION_THRESHOLD = 75  # Port congestion alert threshold
 VESSEL_UPDATE_INTERVAL = 60  # seconds
 SESSION_TIMEOUT_MINUTES = 60
 
+# AIS Ingestion
+AIS_PROVIDER_CONCURRENCY = {
+    'marinesia': int(os.getenv('AIS_MARINESIA_CONCURRENCY', '50')),
+    'aishub': int(os.getenv('AIS_AISHUB_CONCURRENCY', '10')),
+    'marinetraffic': int(os.getenv('AIS_MARINETRAFFIC_CONCURRENCY', '5')),
+}
+AIS_WRITE_BATCH_SIZE = 500  # vessels written per transaction
+
+# Buffered ingestion queue between fetchers and the database writer (see apps/vessels/fix_queue.py)
+AIS_QUEUE_BACKEND = os.getenv('AIS_QUEUE_BACKEND', '')  # '' (write directly), 'redis' or 'local'
+AIS_QUEUE_STREAM = 'ais:fixes'
+AIS_QUEUE_GROUP = 'writers'
+AIS_QUEUE_MAXLEN = 200000  # backlog cap; the oldest fixes are dropped beyond it
+AIS_QUEUE_BATCH_SIZE = 1000  # rows per writer batch
+AIS_QUEUE_MAX_WAIT_MS = 500  # or whatever arrived within this time
+AIS_QUEUE_MAX_LAG = 30  # seconds; beyond this only the last fix per vessel is written
+AIS_QUEUE_CLAIM_IDLE = 60  # seconds before unacknowledged fixes of a dead writer are taken over
+
+# Dead-band compression of vessel_positions: a fix is only stored when it moved,
+# changed speed/course/status beyond these thresholds, or the keep-alive is due
+AIS_COMPRESSION_ENABLED = os.getenv('AIS_COMPRESSION_ENABLED', 'True') == 'True'
+AIS_COMPRESSION_DISTANCE_M = 50
+AIS_COMPRESSION_SPEED_KN = 0.5
+AIS_COMPRESSION_COURSE_DEG = 5
+AIS_COMPRESSION_KEEPALIVE_MINUTES = 10
+
+# Time-partitioned vessel_positions (see apps/vessels/partitions.py), opt-in: migration 0004 converts
+# the table only when this is set while it runs (migrate vessels back to 0003 and forward to switch later)
+AIS_POSITION_PARTITIONING = os.getenv('AIS_POSITION_PARTITIONING', 'False') == 'True'
+AIS_POSITION_PARTITION_INTERVAL = os.getenv('AIS_POSITION_PARTITION_INTERVAL', 'month')  # 'month' or 'week'
+AIS_POSITION_PARTITIONS_AHEAD = 3  # future partitions kept ready
+AIS_POSITION_RETENTION_DAYS = int(os.getenv('AIS_POSITION_RETENTION_DAYS', '0'))  # hard deletion age, 0 keeps history
+
+# Tiered downsampling of position history (see apps/vessels/downsampling.py):
+# (age in days, one fix per N seconds) - full resolution for 7 days, 10 minutes to 90 days, hourly beyond
+AIS_POSITION_DOWNSAMPLE_TIERS = [(7, 600), (90, 3600)]
+AIS_POSITION_DOWNSAMPLE_TURN_DEG = 30  # course changes kept at any resolution (status changes always are)
+AIS_POSITION_DOWNSAMPLE_CHUNK_HOURS = 1  # history processed per transaction
+AIS_POSITION_DOWNSAMPLE_TIME_BUDGET = 240  # seconds per run; the rest waits for the next run
+
+# Cluster-wide request rates per provider (requests/second, 0 = unlimited), see apps/vessels/rate_limit.py
+# e.g. AIS_STORMGLASS_RATE=0.000115 for the free plan's 10 requests a day
+AIS_PROVIDER_RATES = {
+    'marinesia': float(os.getenv('AIS_MARINESIA_RATE', '10')),
+    'aishub': float(os.getenv('AIS_AISHUB_RATE', '1')),
+    'marinetraffic': float(os.getenv('AIS_MARINETRAFFIC_RATE', '1')),
+    'stormglass': float(os.getenv('AIS_STORMGLASS_RATE', '0')),
+}
+AIS_RATE_LIMIT_REDIS_RETRY = 30  # seconds on local buckets after Redis fails
+
+# Provider record/replay for offline load tests (see apps/vessels/recording.py)
+AIS_RECORD_PATH = os.getenv('AIS_RECORD_PATH', '')  # append every provider response to this JSON lines file
+AIS_PROVIDER_STANDIN_URL = os.getenv('AIS_PROVIDER_STANDIN_URL', '')  # e.g. http://127.0.0.1:8780 (manage.py provider_standin)
+
+# Deterministic fleet simulator (see apps/vessels/simulator.py); serve it over HTTP with manage.py fleet_standin
+AIS_SIMULATOR_ENABLED = os.getenv('AIS_SIMULATOR_ENABLED', 'False') == 'True'  # use it in-process instead of the providers
+AIS_SIMULATOR_FLEET_SIZE = int(os.getenv('AIS_SIMULATOR_FLEET_SIZE', '10000'))
+AIS_SIMULATOR_SEED = int(os.getenv('AIS_SIMULATOR_SEED', '1'))
+AIS_SIMULATOR_MMSI_START = 200000000
+AIS_SIMULATOR_TIME_SCALE = float(os.getenv('AIS_SIMULATOR_TIME_SCALE', '1.0'))  # simulated seconds per real second
+
+# Pooled provider clients (see apps/vessels/providers.py for defaults)
+# Per provider: base_url, timeout, pool_maxsize, max_retries, backoff_base, backoff_max,
+# rate, burst, max_queue_wait
+AIS_PROVIDERS = {
+    'marinesia': {'pool_maxsize': AIS_PROVIDER_CONCURRENCY['marinesia'], 'rate': AIS_PROVIDER_RATES['marinesia']},
+    'aishub': {'pool_maxsize': AIS_PROVIDER_CONCURRENCY['aishub'], 'rate': AIS_PROVIDER_RATES['aishub']},
+    'marinetraffic': {'pool_maxsize': AIS_PROVIDER_CONCURRENCY['marinetraffic'], 'rate': AIS_PROVIDER_RATES['marinetraffic']},
+    'stormglass': {'rate': AIS_PROVIDER_RATES['stormglass'], 'burst': 10},
+}
+
+# Provider circuit breakers and health-based chain ordering
+AIS_BREAKER_FAILURE_THRESHOLD = 5  # consecutive failures before a provider is skipped
+AIS_BREAKER_COOLDOWN = 30  # seconds before the first probe, doubled after a failed probe
+AIS_BREAKER_MAX_COOLDOWN = 600
+AIS_HEALTH_SYNC_INTERVAL = 2  # seconds between shared-state reads/writes per process
+AIS_HEALTH_REORDER_MARGIN = 0.2  # score advantage needed to jump ahead in the chain
+AIS_ENDPOINT_RETRY_INTERVAL = 3600  # seconds before re-probing endpoints that all failed
+
+# Per-vessel polling schedule (poll_due_vessels): intervals start from Vessel.ais_update_frequency
+AIS_SCHEDULER_WATCHED_INTERVAL = 15  # seconds between polls while a user is viewing the vessel
+AIS_SCHEDULER_WATCH_TTL = 300  # seconds a view keeps a vessel boosted
+AIS_SCHEDULER_STATIONARY_FACTOR = 5  # interval multiplier for moored/anchored vessels
+AIS_SCHEDULER_MIN_INTERVAL = 10
+AIS_SCHEDULER_MAX_INTERVAL = 1800
+AIS_SCHEDULER_MAX_PER_TICK = 5000
+AIS_SCHEDULER_SYNC_INTERVAL = 60  # seconds between syncs of the schedule with tracked vessels
+AIS_SCHEDULER_LOCK_TTL = 300  # poll lock expiry if a worker dies mid-run or a shard is lost
+
+# Polls are fanned out to Celery workers in shards by MMSI hash (poll_vessel_shard)
+AIS_POLL_SHARDS = int(os.getenv('AIS_POLL_SHARDS', '4'))  # roughly the number of workers
+AIS_POLL_MIN_SHARD_SIZE = 50  # fewer shards for small runs
+
+# Area-batched polling: cluster tracked vessels into bounding boxes
+AIS_AREA_POLLING_ENABLED = os.getenv('AIS_AREA_POLLING_ENABLED', 'True') == 'True'
+AIS_AREA_CELL_DEG = 2.0  # grid cell used to cluster last known positions
+AIS_AREA_MAX_SPAN_DEG = 20.0  # largest box sent to a provider
+AIS_AREA_PADDING_DEG = 0.5  # margin for vessels that moved since their last fix
+AIS_AREA_MIN_VESSELS = 3  # smaller clusters are looked up per MMSI
+
+# Tile cache for realtime area queries (tile = 360 / 2**zoom degrees)
+AIS_TILE_CACHE_ENABLED = os.getenv('AIS_TILE_CACHE_ENABLED', 'True') == 'True'
+AIS_TILE_TTL = int(os.getenv('AIS_TILE_TTL', '60'))  # seconds
+AIS_TILE_MIN_ZOOM = 2
+AIS_TILE_MAX_ZOOM = 8
+AIS_TILE_MAX_TILES = 16  # per request; larger viewports use coarser tiles
+
+# Weather grid: StormGlass points cached at grid nodes and interpolated per vessel
+AIS_WEATHER_CELL_DEG = 1.0  # distance between grid nodes
+AIS_WEATHER_TTL = 3600  # seconds a node's forecast is reused
+AIS_WEATHER_FAILURE_TTL = 300  # seconds before an unavailable node is retried
+AIS_WEATHER_MAX_FETCH = 8  # new nodes fetched per request (the rest wait for later requests)
+
+# Vessel static profiles (MarineSia /profile), see apps/vessels/profile_cache.py
+AIS_PROFILE_TTL_DAYS = 30  # how long a profile is kept in the shared cache
+AIS_PROFILE_REFRESH_DAYS = 7  # older profiles are served and refreshed in the background
+AIS_PROFILE_MISSING_TTL = 86400  # seconds before a vessel without a profile is asked again
+AIS_PROFILE_RETRY_INTERVAL = 300  # seconds between fetches of one profile (also failure backoff)
+AIS_PROFILE_LOCAL_SIZE = 10000  # per-process LRU entries
+AIS_PROFILE_REFRESH_WORKERS = 2
+
+# Single-flight coalescing of identical concurrent upstream fetches
+AIS_SINGLEFLIGHT_LOCK_TIMEOUT = 30  # seconds a cross-process fetch lock is held at most
+AIS_SINGLEFLIGHT_WAIT_TIMEOUT = 30  # seconds a follower waits before fetching itself
+AIS_SINGLEFLIGHT_RESULT_TTL = 5  # seconds a shared result stays readable by other processes
+
+# Live picture: latest state of every vessel, rebuilt in the background and
+# served to realtime_positions/map_view without upstream calls
+AIS_LIVE_PICTURE_CHECK_INTERVAL = 1.0  # seconds between version checks of the in-process mirror
+AIS_LIVE_PICTURE_RETRY_INTERVAL = 30  # seconds to wait before retrying Redis after an error
+
+# Streamed ingestion (ingest_nmea, ingest_aisstream, ingest_positions uploads)
+AIS_INGEST_FLUSH_INTERVAL = 1.0  # seconds a partial batch may wait before it is written
+AIS_UPLOAD_BATCH_SIZE = 1000  # rows committed per batch by ingest_positions uploads
+AIS_UPLOAD_MAX_BATCH_SIZE = 10000
+
+# AISStream websocket ingester (ingest_aisstream)
+AISSTREAM_QUEUE_SIZE = 10000  # decoded messages buffered between socket and database
+AISSTREAM_BACKPRESSURE_TIMEOUT = 5.0  # seconds to wait for queue space before dropping
+AISSTREAM_IDLE_TIMEOUT = 60.0  # reconnect when the stream is silent this long
+AISSTREAM_MAX_BACKOFF = 60.0
+
 # Logging Configuration
 LOGGING = {
     'version': 1,